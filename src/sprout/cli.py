@@ -1,20 +1,33 @@
 """Main CLI interface for sprout."""
 
+from pathlib import Path
+
 import typer
 from rich.console import Console
 
 from sprout import __version__
 from sprout.commands.create import create_worktree
 from sprout.commands.ls import list_worktrees
+from sprout.commands.maintain import maintain_repository
 from sprout.commands.path import get_worktree_path
+from sprout.commands.pool import clear_worktree_pool, fill_worktree_pool
+from sprout.commands.ports import list_ports
 from sprout.commands.rm import remove_worktree
+from sprout.commands.sync import sync_worktrees
+from sprout.git import reset_git_context
 from sprout.types import BranchName
+from sprout.watch import DEFAULT_DEBOUNCE
 
 app = typer.Typer(
     name="sprout",
     help="CLI tool to automate git worktree and Docker Compose development workflows.",
     add_completion=False,
 )
+pool_app = typer.Typer(
+    name="pool",
+    help="Manage the pool of pre-populated worktrees that makes create near-instant.",
+)
+app.add_typer(pool_app)
 console = Console()
 
 
@@ -37,7 +50,8 @@ def callback(
     ),
 ) -> None:
     """sprout - Manage git worktrees with Docker Compose environments."""
-    pass
+    # Every invocation discovers its repository afresh, then shares it
+    reset_git_context()
 
 
 @app.command()
@@ -51,9 +65,24 @@ def create(
         "--path",
         help="Output only the worktree path (for use with shell command substitution)",
     ),
+    values: Path | None = typer.Option(
+        None,
+        "--values",
+        help="Dotenv, TOML or JSON file with values for template variables",
+    ),
+    only: str | None = typer.Option(
+        None,
+        "--only",
+        help="Check out only these comma-separated directories (sparse checkout)",
+    ),
+    tune: bool | None = typer.Option(
+        None,
+        "--tune/--no-tune",
+        help="Configure the worktree for a fast git status (default: \\[checkout] tune)",
+    ),
 ) -> None:
     """Create a new development environment."""
-    create_worktree(branch_name, path_only=path)
+    create_worktree(branch_name, path_only=path, values_file=values, only=only, tune=tune)
 
 
 @app.command()
@@ -84,5 +113,82 @@ def path(
     get_worktree_path(identifier)
 
 
+@app.command()
+def ports(
+    json_output: bool = typer.Option(
+        False,
+        "--json",
+        help="Output the port report as JSON",
+    ),
+    gc: bool = typer.Option(
+        False,
+        "--gc",
+        help="Reclaim ports held by worktrees that no longer exist",
+    ),
+    rebuild: bool = typer.Option(
+        False,
+        "--rebuild",
+        help="Rebuild the port ledger from the worktrees' .env files",
+    ),
+    verify: bool = typer.Option(
+        False,
+        "--verify",
+        help="Report ledger entries that don't match the worktrees' .env files",
+    ),
+) -> None:
+    """Show the ports allocated to each development environment."""
+    list_ports(json_output=json_output, gc=gc, rebuild=rebuild, verify=verify)
+
+
+@app.command()
+def sync(
+    watch: bool = typer.Option(
+        False,
+        "--watch",
+        "-w",
+        help="Keep running and update the .env files whenever a template changes",
+    ),
+    debounce: float = typer.Option(
+        DEFAULT_DEBOUNCE,
+        "--debounce",
+        min=0.0,
+        help="Seconds to wait for further template changes before updating (with --watch)",
+    ),
+) -> None:
+    """Update the .env files of all development environments after template changes."""
+    sync_worktrees(watch=watch, debounce=debounce)
+
+
+@app.command()
+def maintain(
+    background: bool = typer.Option(
+        False,
+        "--background",
+        help="Run in a detached process and write the report to .sprout/.maintain.log",
+    ),
+) -> None:
+    """Optimize the git object store shared by all development environments."""
+    maintain_repository(background=background)
+
+
+@pool_app.command("fill")
+def pool_fill(
+    size: int | None = typer.Argument(
+        None,
+        min=0,
+        help="Number of worktrees the pool should hold (default: the last size filled to, "
+        "or \\[pool] max_size)",
+    ),
+) -> None:
+    """Pre-populate worktrees at the current commit for later creates."""
+    fill_worktree_pool(size)
+
+
+@pool_app.command("clear")
+def pool_clear() -> None:
+    """Remove all pre-populated worktrees."""
+    clear_worktree_pool()
+
+
 if __name__ == "__main__":
     app()
@@ -1,30 +1,83 @@
 """Implementation of the create command."""
 
-import re
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Never
 
 import typer
 from rich.console import Console
 
+from sprout.config import load_config
 from sprout.exceptions import SproutError
-from sprout.types import BranchName
+from sprout.git import get_batch_check, tune_worktree
+from sprout.maintenance import start_background_maintenance, worktrees_lock
+from sprout.pool import claim_slot, start_background_fill
+from sprout.ports import (
+    PortLeases,
+    PortLedger,
+    PortSession,
+    extract_ports,
+    kernel_assigned_port,
+)
+from sprout.sync import SyncState, template_hash, template_keys
+from sprout.templates import (
+    CACHE_DIRNAME,
+    fixed_ports,
+    in_cones,
+    load_template,
+    parse_cones,
+    template_targets,
+    variable_names,
+)
+from sprout.types import BranchName, WorktreeState
 from sprout.utils import (
     branch_exists,
     ensure_sprout_dir,
+    force_remove_worktree,
+    get_env_examples,
     get_git_root,
-    get_used_ports,
     is_git_repository,
     parse_env_template,
+    prompt_for_variables,
     run_command,
     worktree_exists,
 )
+from sprout.values import (
+    AnswersStore,
+    FileValueProvider,
+    ValueProvider,
+    build_providers,
+    fetch_values,
+)
 
 console = Console()
 
 
-def create_worktree(branch_name: BranchName, path_only: bool = False) -> Never:
-    """Create a new worktree with development environment."""
+def _release_ports(leases: PortLeases) -> None:
+    """Give back the ports and block reserved for a worktree whose creation failed."""
+    with leases.locked():
+        PortLedger.open(leases.sprout_dir, env_dirs=leases.env_dirs).release(leases.owner)
+        leases.release()
+
+
+def create_worktree(
+    branch_name: BranchName,
+    path_only: bool = False,
+    values_file: Path | None = None,
+    only: str | None = None,
+    tune: bool | None = None,
+) -> Never:
+    """Create a new worktree with development environment.
+
+    Args:
+        branch_name: Branch to create the worktree for
+        path_only: Output only the worktree path
+        values_file: Dotenv, TOML or JSON file with values for template variables
+        only: Comma-separated directories to check out (sparse checkout); None checks
+            out everything
+        tune: Configure the worktree for a fast git status; None uses ``[checkout] tune``
+    """
     # Check prerequisites
     if not is_git_repository():
         if not path_only:
@@ -36,14 +89,41 @@ def create_worktree(branch_name: BranchName, path_only: bool = False) -> Never:
 
     git_root = get_git_root()
 
-    # Find all .env.example files that are tracked by git
-    result = run_command(["git", "ls-files", "*.env.example", "**/*.env.example"])
-    env_examples = []
-    if result.stdout.strip():
-        for file_path in result.stdout.strip().split("\n"):
-            full_path = git_root / file_path
-            if full_path.exists():
-                env_examples.append(full_path)
+    try:
+        config = load_config(git_root)
+        providers: list[ValueProvider] = []
+        if values_file is not None:
+            if not values_file.is_file():
+                raise SproutError(f"Values file not found: {values_file}")
+            providers.append(FileValueProvider(values_file))
+        providers.extend(build_providers(config.values.providers, git_root))
+        cones = parse_cones(only) if only is not None else None
+    except SproutError as e:
+        if not path_only:
+            console.print(f"[red]Error: {e}[/red]")
+        else:
+            typer.echo(f"Error: {e}", err=True)
+        raise typer.Exit(1) from e
+
+    # Find all .env.example files that are tracked by git (or listed in .sprout.toml)
+    try:
+        env_examples = get_env_examples(git_root)
+    except SproutError as e:
+        if not path_only:
+            console.print(f"[red]Error: {e}[/red]")
+        else:
+            typer.echo(f"Error: {e}", err=True)
+        raise typer.Exit(1) from e
+
+    # A missing ledger is rebuilt from the .env files of every template directory, including
+    # the ones a sparse worktree leaves out: other worktrees may have files there
+    env_dirs = sorted({path.parent.relative_to(git_root).as_posix() for path in env_examples})
+
+    # A sparse worktree only gets the templates inside its checked-out directories
+    if cones is not None:
+        env_examples = [
+            path for path in env_examples if in_cones(path.relative_to(git_root), cones)
+        ]
 
     if not env_examples:
         if not path_only:
@@ -51,6 +131,18 @@ def create_worktree(branch_name: BranchName, path_only: bool = False) -> Never:
             console.print(f"Proceeding without .env generation in: {git_root}")
         # Continue execution without exiting
 
+    # Every template with the file it renders to: .env files plus configured targets
+    try:
+        targets = template_targets(git_root, env_examples, config.templates.targets)
+        if cones is not None:
+            targets = [(source, target) for source, target in targets if in_cones(target, cones)]
+    except SproutError as e:
+        if not path_only:
+            console.print(f"[red]Error: {e}[/red]")
+        else:
+            typer.echo(f"Error: {e}", err=True)
+        raise typer.Exit(1) from e
+
     # Check if worktree already exists
     if worktree_exists(branch_name):
         if not path_only:
@@ -68,62 +160,167 @@ def create_worktree(branch_name: BranchName, path_only: bool = False) -> Never:
         console.print(f"Creating worktree for branch [cyan]{branch_name}[/cyan]...")
 
     # Check if branch exists, create if it doesn't
-    if not branch_exists(branch_name):
+    new_branch = not branch_exists(branch_name)
+    if new_branch:
         if not path_only:
             console.print(f"Branch '{branch_name}' doesn't exist. Creating new branch...")
         # Create branch with -b flag
         cmd = ["git", "worktree", "add", "-b", branch_name, str(worktree_path)]
     else:
         cmd = ["git", "worktree", "add", str(worktree_path), branch_name]
+    # Files are checked out separately: in parallel, and after any sparse checkout is set up
+    cmd.insert(3, "--no-checkout")
+    checkout = ["git", "-C", str(worktree_path), *config.checkout.git_options(), "checkout"]
+
+    # A worktree from the pool is already populated: checking out the branch only
+    # updates the files that differ from the commit the pool was filled at
+    slot = claim_slot(sprout_dir, worktree_path) if cones is None else None
+    if slot is not None:
+        if not path_only:
+            console.print("Using a pre-populated worktree from the pool")
+        if new_branch:
+            # Same start point as `git worktree add -b`: the current HEAD
+            start = get_batch_check().resolve(["HEAD"])["HEAD"] or slot["head"]
+            checkout += ["-b", branch_name, start]
+        else:
+            checkout.append(branch_name)
+    else:
+        try:
+            # Kept apart from the `git worktree prune` of a running `sprout maintain`
+            with worktrees_lock(sprout_dir):
+                run_command(cmd)
+        except SproutError as e:
+            if not path_only:
+                console.print(f"[red]Error creating worktree: {e}[/red]")
+            else:
+                typer.echo(f"Error creating worktree: {e}", err=True)
+            raise typer.Exit(1) from e
 
     try:
-        run_command(cmd)
+        if cones is not None:
+            if not path_only:
+                console.print(f"Checking out only: [cyan]{', '.join(cones)}[/cyan]")
+            run_command(
+                ["git", "-C", str(worktree_path), "sparse-checkout", "set", "--cone", *cones]
+            )
+        run_command(checkout)
     except SproutError as e:
         if not path_only:
             console.print(f"[red]Error creating worktree: {e}[/red]")
         else:
             typer.echo(f"Error creating worktree: {e}", err=True)
+        force_remove_worktree(worktree_path)
         raise typer.Exit(1) from e
+    except KeyboardInterrupt:
+        if not path_only:
+            console.print("\n[yellow]Cancelled by user[/yellow]")
+        else:
+            typer.echo("Cancelled by user", err=True)
+        force_remove_worktree(worktree_path)
+        raise typer.Exit(130) from None
 
     # Generate .env files only if .env.example files exist
-    if env_examples:
+    if targets:
         if not path_only:
-            console.print(f"Generating .env files from {len(env_examples)} template(s)...")
+            if env_examples:
+                console.print(f"Generating .env files from {len(env_examples)} template(s)...")
+            if len(targets) > len(env_examples):
+                console.print(f"Rendering {len(targets) - len(env_examples)} template target(s)...")
 
-        # Get all currently used ports to avoid conflicts
-        all_used_ports = get_used_ports()
-        session_ports: set[int] = set()
+        # Ports are leased while the templates are rendered so parallel creates never
+        # collide; the leases are turned into ledger entries once the files are written
+        leases = PortLeases(sprout_dir, branch_name, ttl=config.ports.lease_ttl, env_dirs=env_dirs)
 
         try:
-            for env_example in env_examples:
-                # Calculate relative path from git root
-                relative_dir = env_example.parent.relative_to(git_root)
+            # One allocation session for all templates: used ports are loaded from the
+            # port ledger once and every allocated port is reserved for later templates.
+            # Stale entries left behind by an earlier worktree of this branch are reusable.
+            with leases.locked():
+                ledger = PortLedger.open(sprout_dir, env_dirs=env_dirs)
+                block = None
+                if config.ports.mode == "block":
+                    block = ledger.assign_block(
+                        branch_name, config.ports.block_size, config.ports.block_range
+                    )
+                    # Persist the block right away so concurrent creates skip it
+                    ledger.save()
+            port_session = PortSession(
+                lambda: ledger.ports_of_others(branch_name),
+                block=block,
+                kernel_port=kernel_assigned_port if config.ports.mode == "kernel" else None,
+                leases=leases,
+            )
+
+            # Phase 1: resolve every variable up front and reserve the ports templates
+            # hard-code before any port is handed out
+            cache_dir = sprout_dir / CACHE_DIRNAME
+            names: list[str] = []
+            # What each file is rendered from, recorded so `sprout sync` can update it later
+            rendered: WorktreeState = {"targets": {}, "named_ports": {}}
+            if cones is not None:
+                rendered["cones"] = cones
+            for template, target in targets:
+                tokens = load_template(template, cache_dir)
+                names.extend(name for name in variable_names(tokens) if name not in os.environ)
+                port_session.reserve(fixed_ports(tokens))
+                rendered["targets"][target.as_posix()] = {
+                    "hash": template_hash(template),
+                    "keys": template_keys(tokens),
+                }
 
+            # One batch lookup per value source: the --values file, then the providers
+            values = fetch_values(list(dict.fromkeys(names)), providers)
+
+            # Remaining variables come from remembered answers or are asked for once
+            answers_store = AnswersStore(sprout_dir) if config.values.remember_answers else None
+            answers = answers_store.load() if answers_store else {}
+            prompted = prompt_for_variables(
+                [template for template, _ in targets],
+                silent=path_only,
+                cache_dir=cache_dir,
+                known=values | answers,
+            )
+            if answers_store and prompted:
+                answers_store.update(prompted)
+            answers.update(prompted)
+
+            # Phase 2: render and write all targets concurrently from the shared session
+            def render(template: Path, target: Path) -> None:
                 # Create target directory in worktree if needed
-                if relative_dir != Path("."):
-                    target_dir = worktree_path / relative_dir
-                    target_dir.mkdir(parents=True, exist_ok=True)
-                    env_file = target_dir / ".env"
-                else:
-                    env_file = worktree_path / ".env"
-
-                # Parse template with combined used ports
+                output_file = worktree_path / target
+                output_file.parent.mkdir(parents=True, exist_ok=True)
+
+                # Parse template, allocating ports from the shared session
                 env_content = parse_env_template(
-                    env_example,
+                    template,
                     silent=path_only,
-                    used_ports=all_used_ports | session_ports,
                     branch_name=branch_name,
+                    session=port_session,
+                    cache_dir=cache_dir,
+                    values=values,
+                    answers=answers,
                 )
 
-                # Extract ports from generated content and add to session_ports
-                port_matches = re.findall(r"=(\d{4,5})\b", env_content)
-                for port_str in port_matches:
-                    port = int(port_str)
-                    if 1024 <= port <= 65535:
-                        session_ports.add(port)
+                # Fixed ports written by the template are taken for this worktree as well
+                port_session.reserve(extract_ports(env_content))
+
+                # Write the rendered file
+                output_file.write_text(env_content)
 
-                # Write the .env file
-                env_file.write_text(env_content)
+            with ThreadPoolExecutor(max_workers=config.templates.workers) as executor:
+                for future in [executor.submit(render, *pair) for pair in targets]:
+                    future.result()
+
+            # Record the new worktree's ports so later lookups skip rescanning
+            with leases.locked():
+                PortLedger.open(sprout_dir, env_dirs=env_dirs).claim(
+                    branch_name, port_session.reserved
+                )
+                leases.release()
+                rendered["named_ports"] = dict(port_session.named)
+                state = SyncState.open(sprout_dir)
+                state.record(branch_name, rendered)
+                state.save()
 
         except SproutError as e:
             if not path_only:
@@ -131,7 +328,8 @@ def create_worktree(branch_name: BranchName, path_only: bool = False) -> Never:
             else:
                 typer.echo(f"Error generating .env file: {e}", err=True)
             # Clean up worktree on failure
-            run_command(["git", "worktree", "remove", str(worktree_path)], check=False)
+            _release_ports(leases)
+            force_remove_worktree(worktree_path)
             raise typer.Exit(1) from e
         except KeyboardInterrupt:
             if not path_only:
@@ -139,9 +337,44 @@ def create_worktree(branch_name: BranchName, path_only: bool = False) -> Never:
             else:
                 typer.echo("Cancelled by user", err=True)
             # Clean up worktree on cancellation
-            run_command(["git", "worktree", "remove", str(worktree_path)], check=False)
+            _release_ports(leases)
+            force_remove_worktree(worktree_path)
             raise typer.Exit(130) from None
 
+    # Tune the worktree's git settings; if that fails the worktree still works as is
+    if config.checkout.tune if tune is None else tune:
+        try:
+            latency = tune_worktree(worktree_path)
+            if not path_only:
+                console.print(
+                    f"Tuned git settings for fast status (git status: {latency * 1000:.0f} ms)"
+                )
+        except SproutError as e:
+            if not path_only:
+                console.print(f"[yellow]Warning: Could not tune git settings: {e}[/yellow]")
+            else:
+                typer.echo(f"Warning: Could not tune git settings: {e}", err=True)
+
+    # Put a new worktree in the place of the one taken from the pool
+    if slot is not None and config.pool.refill:
+        try:
+            start_background_fill(git_root, sprout_dir)
+        except OSError as e:
+            if not path_only:
+                console.print(f"[yellow]Warning: Could not refill the pool: {e}[/yellow]")
+            else:
+                typer.echo(f"Warning: Could not refill the pool: {e}", err=True)
+
+    # Optimize the shared object store without making the user wait for it
+    if config.maintenance.after_create:
+        try:
+            start_background_maintenance(git_root, sprout_dir)
+        except OSError as e:
+            if not path_only:
+                console.print(f"[yellow]Warning: Could not start maintenance: {e}[/yellow]")
+            else:
+                typer.echo(f"Warning: Could not start maintenance: {e}", err=True)
+
     # Success message or path output
     if path_only:
         # Output only the path for shell command substitution
@@ -150,7 +383,9 @@ def create_worktree(branch_name: BranchName, path_only: bool = False) -> Never:
         console.print(f"\n[green]✅ Workspace '{branch_name}' created successfully![/green]\n")
         if env_examples:
             console.print(f"Generated .env files from {len(env_examples)} template(s)")
-        else:
+        if len(targets) > len(env_examples):
+            console.print(f"Rendered {len(targets) - len(env_examples)} template target(s)")
+        if not env_examples:
             console.print("No .env files generated (no .env.example templates found)")
         console.print("Navigate to your new environment with:")
         try:
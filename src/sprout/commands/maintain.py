@@ -0,0 +1,56 @@
+"""Implementation of the maintain command."""
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from sprout.exceptions import SproutError
+from sprout.git import get_git_context
+from sprout.maintenance import MAINTAIN_LOG_FILENAME, run_maintenance, start_background_maintenance
+from sprout.utils import ensure_sprout_dir, get_git_root, is_git_repository
+
+console = Console()
+
+
+def maintain_repository(background: bool = False) -> None:
+    """Optimize the object store shared by all worktrees and report the speed-up.
+
+    Args:
+        background: Start maintenance in a detached process and return right away
+    """
+    context = get_git_context()
+    if not is_git_repository() or context is None:
+        console.print("[red]Error: Not in a git repository[/red]")
+        raise typer.Exit(1)
+
+    sprout_dir = ensure_sprout_dir()
+    if background:
+        start_background_maintenance(get_git_root(), sprout_dir)
+        console.print(
+            f"Started maintenance in the background (log: {sprout_dir / MAINTAIN_LOG_FILENAME})"
+        )
+        return None
+
+    console.print(f"Maintaining [cyan]{context.common_dir}[/cyan]...")
+    try:
+        report = run_maintenance(context.common_dir, sprout_dir)
+    except SproutError as e:
+        console.print(f"[red]Error: {e}[/red]")
+        raise typer.Exit(1) from e
+
+    table = Table(title="Maintenance")
+    table.add_column("Step", style="cyan")
+    table.add_column("Time", justify="right")
+    for name, seconds in report.steps:
+        table.add_row(name, f"{seconds * 1000:.0f} ms")
+    console.print(table)
+
+    console.print(
+        f"Loose objects: {report.loose_before} → {report.loose_after}, "
+        f"packs: {report.packs_before} → {report.packs_after}"
+    )
+    console.print(
+        f"Reference query (git rev-list --count --all): "
+        f"{report.query_before * 1000:.0f} ms → {report.query_after * 1000:.0f} ms"
+    )
+    console.print("[green]✅ Maintenance complete[/green]")
@@ -0,0 +1,61 @@
+"""Implementation of the pool commands."""
+
+import typer
+from rich.console import Console
+
+from sprout.config import load_config
+from sprout.exceptions import SproutError
+from sprout.pool import PoolState, clear_pool, fill_pool
+from sprout.utils import ensure_sprout_dir, get_git_root, is_git_repository
+
+console = Console()
+
+
+def fill_worktree_pool(size: int | None = None) -> None:
+    """Pre-populate worktrees so later creates only have to switch branches.
+
+    Args:
+        size: Number of worktrees the pool should hold; None refills to the size the
+            pool was last filled to, or ``[pool] max_size`` if it never was
+    """
+    if not is_git_repository():
+        console.print("[red]Error: Not in a git repository[/red]")
+        raise typer.Exit(1)
+
+    try:
+        config = load_config(get_git_root())
+        sprout_dir = ensure_sprout_dir()
+        max_size = config.pool.max_size
+        if size is None:
+            recorded = PoolState.open(sprout_dir).size
+            size = max_size if recorded is None else min(recorded, max_size)
+        elif size > max_size:
+            console.print(
+                f"[yellow]Warning: Filling only {max_size} worktree(s) (\\[pool] max_size)[/yellow]"
+            )
+            size = max_size
+        added = fill_pool(sprout_dir, size, config.checkout)
+    except SproutError as e:
+        console.print(f"[red]Error filling pool: {e}[/red]")
+        raise typer.Exit(1) from e
+    except KeyboardInterrupt:
+        console.print("\n[yellow]Cancelled by user[/yellow]")
+        raise typer.Exit(130) from None
+
+    if added:
+        console.print(
+            f"[green]✅ Added {len(added)} worktree(s) at {added[0]['head'][:12]} "
+            f"to the pool[/green]"
+        )
+    else:
+        console.print(f"[green]The pool already holds at least {size} worktree(s).[/green]")
+
+
+def clear_worktree_pool() -> None:
+    """Remove every pre-populated worktree."""
+    if not is_git_repository():
+        console.print("[red]Error: Not in a git repository[/red]")
+        raise typer.Exit(1)
+
+    removed = clear_pool(ensure_sprout_dir())
+    console.print(f"[green]✅ Removed {removed} pooled worktree(s)[/green]")
@@ -0,0 +1,203 @@
+"""Implementation of the ports command."""
+
+import json
+import subprocess
+from pathlib import Path
+from typing import Any
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from sprout.exceptions import SproutError
+from sprout.ports import PortLedger, ports_lock, read_bound_ports, scan_env_ports
+from sprout.templates import CACHE_DIRNAME, fixed_ports, load_template
+from sprout.types import BranchName, PortNumber, PortSet
+from sprout.utils import (
+    get_env_dirs,
+    get_env_examples,
+    get_sprout_dir,
+    is_git_repository,
+)
+
+console = Console()
+
+
+def _template_ports(sprout_dir: Path) -> PortSet:
+    """Ports written literally in the tracked templates, which every worktree shares."""
+    cache_dir = sprout_dir / CACHE_DIRNAME if sprout_dir.exists() else None
+    ports: PortSet = set()
+    try:
+        for template in get_env_examples():
+            ports |= fixed_ports(load_template(template, cache_dir))
+    except (SproutError, subprocess.CalledProcessError):
+        pass
+    return ports
+
+
+def _find_collisions(
+    scanned: dict[BranchName, PortSet], shared: PortSet
+) -> dict[PortNumber, list[BranchName]]:
+    """Ports written to the .env files of more than one worktree.
+
+    Args:
+        scanned: Ports found in each worktree's .env files
+        shared: Ports the worktrees share on purpose (fixed ports from the templates)
+    """
+    holders: dict[PortNumber, list[BranchName]] = {}
+    for owner in sorted(scanned):
+        for port in scanned[owner] - shared:
+            holders.setdefault(port, []).append(owner)
+    return {port: owners for port, owners in sorted(holders.items()) if len(owners) > 1}
+
+
+def _print_drift(drift: dict[str, PortSet]) -> None:
+    """Report the result of PortLedger.verify."""
+    if drift["untracked"] or drift["stale"]:
+        console.print(
+            f"[yellow]The port ledger is out of date: {len(drift['untracked'])} port(s) in "
+            f".env files aren't recorded and {len(drift['stale'])} recorded port(s) aren't "
+            "in any .env file. Run 'sprout ports --rebuild' to resync it.[/yellow]"
+        )
+    else:
+        console.print("[green]The port ledger matches the .env files.[/green]")
+
+
+def list_ports(
+    json_output: bool = False, gc: bool = False, rebuild: bool = False, verify: bool = False
+) -> None:
+    """Show which worktree holds which port and reclaim ports of removed worktrees.
+
+    Args:
+        json_output: Print the report as JSON
+        gc: Release the ports of orphaned worktrees
+        rebuild: Rebuild the ledger from the worktrees' .env files first
+        verify: Also report ledger entries that don't match the .env files
+    """
+    if not is_git_repository():
+        if json_output:
+            typer.echo("Error: Not in a git repository", err=True)
+        else:
+            console.print("[red]Error: Not in a git repository[/red]")
+        raise typer.Exit(1)
+
+    sprout_dir = get_sprout_dir()
+
+    # One pass over the worktrees' .env files finds ports shared by several worktrees
+    # and, with --verify, ledger drift; fixed ports such as DB_PORT=5432 are the same
+    # in every worktree by design
+    env_dirs = get_env_dirs()
+    scanned = scan_env_ports(sprout_dir, env_dirs)
+    collisions = _find_collisions(scanned, _template_ports(sprout_dir))
+    bound_ports = read_bound_ports()
+
+    owners: dict[BranchName, PortSet] = {}
+    blocks: dict[BranchName, tuple[PortNumber, int]] = {}
+    orphans: list[BranchName] = []
+    reclaimed: dict[BranchName, PortSet] = {}
+    drift: dict[str, PortSet] | None = None
+    if sprout_dir.exists():
+        with ports_lock(sprout_dir):
+            ledger = PortLedger.open(sprout_dir, env_dirs=env_dirs)
+            if rebuild:
+                ledger = PortLedger.rebuild(sprout_dir, blocks=ledger.blocks(), env_dirs=env_dirs)
+                ledger.save()
+
+            owners = ledger.owners()
+            blocks = ledger.blocks()
+            # Owners whose worktree directory is gone. Git keeps listing a worktree
+            # deleted with rm -rf until it is pruned, so only the directory counts
+            orphans = sorted(
+                owner for owner in set(owners) | set(blocks) if not (sprout_dir / owner).exists()
+            )
+            if gc:
+                for owner in orphans:
+                    reclaimed[owner] = ledger.release(owner)
+            if verify:
+                # Compare against the scan above instead of reading the .env files again
+                drift = ledger.verify(scanned=scanned)
+
+    entries: list[dict[str, Any]] = []
+    for owner in sorted(set(owners) | set(blocks)):
+        block = blocks.get(owner)
+        entries.append(
+            {
+                "worktree": owner,
+                "orphan": owner in orphans,
+                "reclaimed": owner in reclaimed,
+                "block": [block[0], block[0] + block[1] - 1] if block else None,
+                "ports": [
+                    {
+                        "port": port,
+                        "listening": None if bound_ports is None else port in bound_ports,
+                        "collision": [
+                            other for other in collisions.get(port, []) if other != owner
+                        ],
+                    }
+                    for port in sorted(owners.get(owner, set()))
+                ],
+            }
+        )
+
+    if json_output:
+        report = {
+            "worktrees": entries,
+            "collisions": [
+                {"port": port, "worktrees": holders} for port, holders in collisions.items()
+            ],
+            "orphans": orphans,
+            "reclaimed": {owner: sorted(ports) for owner, ports in reclaimed.items()},
+            "drift": (
+                None if drift is None else {kind: sorted(ports) for kind, ports in drift.items()}
+            ),
+        }
+        typer.echo(json.dumps(report, indent=2))
+        return None
+
+    if not entries:
+        console.print("[yellow]No ports allocated by sprout.[/yellow]")
+        if drift is not None:
+            _print_drift(drift)
+        return None
+
+    table = Table(title="Sprout Ports", show_lines=True)
+    table.add_column("Worktree", style="cyan", no_wrap=True)
+    table.add_column("Port", style="bright_white", no_wrap=True)
+    table.add_column("Listening", no_wrap=True)
+    table.add_column("Notes", style="yellow")
+
+    for entry in entries:
+        notes: list[str] = []
+        if entry["reclaimed"]:
+            notes.append("[green]reclaimed[/green]")
+        elif entry["orphan"]:
+            notes.append("[red]orphan (worktree removed)[/red]")
+        if entry["block"]:
+            notes.append(f"block {entry['block'][0]}-{entry['block'][1]}")
+        ports = entry["ports"] or [{"port": None, "listening": None, "collision": []}]
+        for port_info in ports:
+            port_notes = list(notes)
+            if port_info["collision"]:
+                port_notes.append(f"[red]collides with {', '.join(port_info['collision'])}[/red]")
+            listening = {True: "[green]yes[/green]", False: "no", None: "?"}[port_info["listening"]]
+            table.add_row(
+                entry["worktree"],
+                str(port_info["port"]) if port_info["port"] is not None else "-",
+                listening if port_info["port"] is not None else "",
+                ", ".join(port_notes),
+            )
+
+    console.print(table)
+
+    if orphans and not gc:
+        console.print(
+            f"[yellow]{len(orphans)} orphaned worktree(s) still hold ports. "
+            "Run 'sprout ports --gc' to reclaim them.[/yellow]"
+        )
+    if drift is not None:
+        _print_drift(drift)
+    if reclaimed:
+        count = sum(len(ports) for ports in reclaimed.values())
+        console.print(
+            f"[green]✅ Reclaimed {count} port(s) from {len(reclaimed)} worktree(s)[/green]"
+        )
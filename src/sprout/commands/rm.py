@@ -4,7 +4,12 @@ import typer
 from rich.console import Console
 
 from sprout.exceptions import SproutError
+from sprout.maintenance import worktrees_lock
+from sprout.ports import PortLedger, ports_lock
+from sprout.sync import SyncState
 from sprout.utils import (
+    branch_exists,
+    get_env_dirs,
     get_sprout_dir,
     is_git_repository,
     resolve_branch_identifier,
@@ -39,7 +44,8 @@ def remove_worktree(identifier: str) -> None:
         console.print(f"[red]Error: Worktree for branch '{branch_name}' does not exist[/red]")
         raise typer.Exit(1)
 
-    worktree_path = get_sprout_dir() / branch_name
+    sprout_dir = get_sprout_dir()
+    worktree_path = sprout_dir / branch_name
 
     # Confirm removal
     if not typer.confirm(
@@ -51,23 +57,34 @@ def remove_worktree(identifier: str) -> None:
     # Remove worktree
     console.print(f"Removing worktree for branch [cyan]{branch_name}[/cyan]...")
     try:
-        result = run_command(["git", "worktree", "remove", str(worktree_path)], check=False)
-        if result.returncode != 0:
-            # Try force removal if normal removal fails
-            result = run_command(
-                ["git", "worktree", "remove", "--force", str(worktree_path)], check=False
-            )
+        # Kept apart from the `git worktree prune` of a running `sprout maintain`
+        with worktrees_lock(sprout_dir):
+            result = run_command(["git", "worktree", "remove", str(worktree_path)], check=False)
+            if result.returncode != 0:
+                # Try force removal if normal removal fails
+                result = run_command(
+                    ["git", "worktree", "remove", "--force", str(worktree_path)], check=False
+                )
             if result.returncode != 0:
                 console.print(f"[red]Error removing worktree: {result.stderr}[/red]")
                 raise typer.Exit(1)
+        # Release the worktree's ports so they can be handed out again
+        with ports_lock(sprout_dir):
+            PortLedger.open(sprout_dir, env_dirs=get_env_dirs()).release(branch_name)
+            state = SyncState.open(sprout_dir)
+            if state.get(branch_name) is not None:
+                state.forget(branch_name)
+                state.save()
         console.print("[green]✅ Worktree removed successfully[/green]")
     except SproutError as e:
         console.print(f"[red]Error removing worktree: {e}[/red]")
         raise typer.Exit(1) from e
 
-    # Ask about branch deletion
+    # Ask about branch deletion, if there is a branch (not for a detached HEAD)
     try:
-        if typer.confirm(f"Do you also want to delete the git branch '{branch_name}'?"):
+        if branch_exists(branch_name) and typer.confirm(
+            f"Do you also want to delete the git branch '{branch_name}'?"
+        ):
             try:
                 # Try normal deletion first
                 result = run_command(["git", "branch", "-d", branch_name], check=False)
@@ -0,0 +1,321 @@
+"""Implementation of the sync command."""
+
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import typer
+from rich.console import Console
+
+from sprout.config import SproutConfig, load_config
+from sprout.exceptions import SproutError
+from sprout.ports import (
+    PortLeases,
+    PortLedger,
+    PortSession,
+    extract_ports,
+    kernel_assigned_port,
+    ports_lock,
+)
+from sprout.sync import SyncState, TargetUpdate, plan_update, template_hash
+from sprout.templates import (
+    CACHE_DIRNAME,
+    in_cones,
+    load_template,
+    template_targets,
+    unresolved_variables,
+    variable_names,
+)
+from sprout.types import BranchName, PortSet, TemplateToken, WorktreeInfo, WorktreeState
+from sprout.utils import (
+    get_env_dirs,
+    get_env_examples,
+    get_git_root,
+    get_indexed_worktrees,
+    get_sprout_dir,
+    is_git_repository,
+    parse_env_template,
+    prompt_for_variables,
+)
+from sprout.values import AnswersStore, ValueProvider, build_providers, fetch_values
+from sprout.watch import DEFAULT_DEBOUNCE, create_watcher
+
+console = Console()
+
+
+def _render_worktree(
+    sprout_dir: Path,
+    worktree: WorktreeInfo,
+    owner: BranchName,
+    updates: list[TargetUpdate],
+    rendered: WorktreeState,
+    config: SproutConfig,
+    values: dict[str, str],
+    answers: dict[str, str],
+    env_dirs: list[str] | None,
+) -> tuple[PortSet, list[TargetUpdate]]:
+    """Apply the planned updates to one worktree.
+
+    Ports for new keys come from a session that treats every port in the ledger,
+    including this worktree's own, as taken; named ports keep their recorded value.
+
+    Returns:
+        The ports the worktree's rendered files use after the update, and the
+        updates that changed a file
+    """
+    leases = PortLeases(sprout_dir, owner, ttl=config.ports.lease_ttl, env_dirs=env_dirs)
+    with leases.locked():
+        ledger = PortLedger.open(sprout_dir, env_dirs=env_dirs)
+    session = PortSession(
+        ledger.ports,
+        block=ledger.block_for(owner) if config.ports.mode == "block" else None,
+        kernel_port=kernel_assigned_port if config.ports.mode == "kernel" else None,
+        leases=leases,
+    )
+    session.named.update(rendered["named_ports"])
+
+    branch_name = worktree.get("branch") or owner
+    changed: list[TargetUpdate] = []
+    for update in updates:
+        parts = [
+            line
+            if isinstance(line, str)
+            else parse_env_template(
+                update.template,
+                branch_name=branch_name,
+                session=session,
+                values=values,
+                answers=answers,
+                tokens=line,
+            )
+            for line in update.lines
+        ]
+        output_file = worktree["path"] / update.target
+        content = "\n".join(parts)
+        if not output_file.exists() or output_file.read_text() != content:
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            output_file.write_text(content)
+            changed.append(update)
+        rendered["targets"][update.target.as_posix()] = update.state
+
+    rendered["named_ports"] = dict(session.named)
+    ports = session.reserved | set(session.named.values())
+    recorded = ledger.ports_for(owner)
+    for target in rendered["targets"]:
+        try:
+            content = (worktree["path"] / target).read_text()
+        except OSError:
+            continue
+        ports |= extract_ports(content)
+        # Ports kept in lines that aren't KEY=VALUE assignments (``"8080:80"`` in YAML)
+        ports |= {port for port in recorded if re.search(rf"(?<!\d){port}(?!\d)", content)}
+    return ports, changed
+
+
+def _sync(
+    sprout_dir: Path,
+    config: SproutConfig,
+    providers: list[ValueProvider],
+    targets: list[tuple[Path, Path]],
+    templates: set[Path] | None = None,
+) -> None:
+    """Update the files rendered from changed templates in every worktree.
+
+    Args:
+        sprout_dir: The .sprout directory
+        config: Repository configuration
+        providers: Value providers to fetch missing values from
+        targets: Every template paired with the file it renders to
+        templates: If given, only these templates are checked for changes
+
+    Raises:
+        SproutError: If templates can't be read or a worktree fails to update
+    """
+    worktrees = get_indexed_worktrees()
+    if not worktrees:
+        console.print("[yellow]No sprout-managed worktrees found.[/yellow]")
+        return None
+
+    cache_dir = sprout_dir / CACHE_DIRNAME
+    checked = [
+        (template, target)
+        for template, target in targets
+        if templates is None or template in templates
+    ]
+    try:
+        # Compile and hash every template once for all worktrees
+        compiled = {
+            template: (load_template(template, cache_dir), template_hash(template))
+            for template, _ in checked
+        }
+    except OSError as e:
+        raise SproutError(f"Failed to read templates: {e}") from e
+
+    # Plan the updates: only files whose template changed since they were rendered
+    state = SyncState.open(sprout_dir)
+    plans: dict[BranchName, tuple[WorktreeInfo, list[TargetUpdate], WorktreeState]] = {}
+    for worktree in worktrees:
+        owner = worktree["path"].resolve().relative_to(sprout_dir.resolve()).as_posix()
+        recorded = state.get(owner) or {"targets": {}, "named_ports": {}}
+        current = {target.as_posix() for _, target in targets}
+        rendered: WorktreeState = {
+            "targets": {
+                target: target_state
+                for target, target_state in recorded["targets"].items()
+                if target in current
+            },
+            "named_ports": dict(recorded["named_ports"]),
+        }
+        cones = recorded.get("cones")
+        if cones is not None:
+            rendered["cones"] = cones
+        updates: list[TargetUpdate] = []
+        for template, target in checked:
+            # Sparse worktrees only get the files inside their checked-out directories
+            if cones is not None and not in_cones(target, cones):
+                continue
+            tokens, digest = compiled[template]
+            previous = recorded["targets"].get(target.as_posix())
+            if previous is not None and previous["hash"] == digest:
+                continue
+            output_file = worktree["path"] / target
+            existing = output_file.read_text() if output_file.exists() else None
+            updates.append(plan_update(template, target, tokens, digest, existing, previous))
+        if updates:
+            plans[owner] = (worktree, updates, rendered)
+
+    if not plans:
+        console.print("[green]All worktrees are up to date.[/green]")
+        return None
+
+    # Resolve the variables of every line still to be rendered in one batch, asking
+    # for each missing value once before rendering starts
+    pending: list[TemplateToken] = [
+        token
+        for _, updates, _ in plans.values()
+        for update in updates
+        for line in update.lines
+        if not isinstance(line, str)
+        for token in line
+    ]
+    names = [name for name in variable_names(pending) if name not in os.environ]
+    values = fetch_values(names, providers)
+    answers_store = AnswersStore(sprout_dir) if config.values.remember_answers else None
+    answers = answers_store.load() if answers_store else {}
+    prompted = prompt_for_variables(
+        [template for template, _ in checked],
+        cache_dir=cache_dir,
+        known=values | answers,
+        only=set(unresolved_variables(pending)),
+    )
+    if answers_store and prompted:
+        answers_store.update(prompted)
+    answers.update(prompted)
+
+    # Update the worktrees concurrently; port leases keep their allocations apart.
+    # A missing ledger is rebuilt from the .env files of the templates' directories
+    env_dirs = get_env_dirs()
+    results: dict[BranchName, tuple[PortSet, list[TargetUpdate]]] = {}
+    errors: dict[BranchName, str] = {}
+    with ThreadPoolExecutor(max_workers=config.templates.workers) as executor:
+        futures = {
+            owner: executor.submit(
+                _render_worktree,
+                sprout_dir,
+                worktree,
+                owner,
+                updates,
+                rendered,
+                config,
+                values,
+                answers,
+                env_dirs,
+            )
+            for owner, (worktree, updates, rendered) in plans.items()
+        }
+        for owner, future in futures.items():
+            try:
+                results[owner] = future.result()
+            except (SproutError, OSError) as e:
+                errors[owner] = str(e)
+
+    with ports_lock(sprout_dir):
+        ledger = PortLedger.open(sprout_dir, env_dirs=env_dirs)
+        state = SyncState.open(sprout_dir)
+        for owner, (ports, _) in results.items():
+            ledger.claim(owner, ports)
+            state.record(owner, plans[owner][2])
+        state.save()
+        for owner in plans:
+            PortLeases(sprout_dir, owner).release()
+
+    for owner in sorted(plans):
+        if owner in errors:
+            console.print(f"[red]✗ {owner}: {errors[owner]}[/red]")
+            continue
+        for update in results[owner][1]:
+            changes = [f"+{key}" for key in update.added] + [f"-{key}" for key in update.removed]
+            summary = f" ({', '.join(changes)})" if changes else ""
+            console.print(f"[cyan]{owner}[/cyan]: updated {update.target.as_posix()}{summary}")
+
+    if errors:
+        raise SproutError(f"Failed to sync {len(errors)} worktree(s)")
+    synced = sum(1 for _, changed in results.values() if changed)
+    if synced:
+        console.print(f"\n[green]✅ Synced {synced} worktree(s)[/green]")
+    else:
+        console.print("[green]All worktrees are up to date.[/green]")
+
+
+def sync_worktrees(watch: bool = False, debounce: float = DEFAULT_DEBOUNCE) -> None:
+    """Bring every worktree's rendered files up to date with their templates.
+
+    Args:
+        watch: Keep running and sync again whenever a template changes
+        debounce: Seconds to wait for further changes before syncing (watch mode)
+    """
+    if not is_git_repository():
+        console.print("[red]Error: Not in a git repository[/red]")
+        raise typer.Exit(1)
+
+    try:
+        git_root = get_git_root()
+        config = load_config(git_root)
+        providers = build_providers(config.values.providers, git_root)
+        targets = template_targets(git_root, get_env_examples(), config.templates.targets)
+        sprout_dir = get_sprout_dir()
+        _sync(sprout_dir, config, providers, targets)
+    except SproutError as e:
+        console.print(f"[red]Error: {e}[/red]")
+        raise typer.Exit(1) from e
+    except KeyboardInterrupt:
+        console.print("\n[yellow]Cancelled by user[/yellow]")
+        raise typer.Exit(130) from None
+
+    if not watch:
+        return None
+
+    templates = sorted({template for template, _ in targets})
+    watcher = create_watcher(templates)
+    console.print(
+        f"Watching {len(templates)} template(s) for changes "
+        f"({watcher.mechanism}). Press Ctrl+C to stop."
+    )
+    try:
+        with watcher:
+            while True:
+                changed = watcher.wait_for_changes(debounce=debounce)
+                names = ", ".join(sorted(path.relative_to(git_root).as_posix() for path in changed))
+                console.print(f"\nChanged: {names}")
+                started = time.perf_counter()
+                try:
+                    _sync(sprout_dir, config, providers, targets, templates=changed)
+                except SproutError as e:
+                    console.print(f"[red]Error: {e}[/red]")
+                    continue
+                elapsed = (time.perf_counter() - started) * 1000
+                console.print(f"[dim]Synced in {elapsed:.0f} ms[/dim]")
+    except KeyboardInterrupt:
+        console.print("\n[yellow]Stopped watching[/yellow]")
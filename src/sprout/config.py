@@ -0,0 +1,279 @@
+"""Repository configuration for sprout."""
+
+import os
+import tomllib
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+from typing import Any
+
+from sprout.exceptions import SproutError
+from sprout.ports import DEFAULT_LEASE_TTL
+from sprout.types import PortNumber
+
+# Optional configuration file at the repository root
+CONFIG_FILENAME = ".sprout.toml"
+
+PORT_MODES = ("random", "block", "kernel")
+
+VALUE_PROVIDER_TYPES = ("file",)
+
+
+@dataclass(frozen=True)
+class PortConfig:
+    """Settings for {{ auto_port() }} allocation."""
+
+    # "random" picks any free port, "block" gives each worktree a contiguous block,
+    # "kernel" lets the operating system choose (binding port 0)
+    mode: str = "random"
+    block_size: int = 20
+    # Ports blocks are carved from; stays below the usual kernel ephemeral range
+    block_range: tuple[PortNumber, PortNumber] = (10000, 32767)
+    # Seconds before a port lease held by a crashed sprout process expires
+    lease_ttl: int = DEFAULT_LEASE_TTL
+
+
+@dataclass(frozen=True)
+class TemplateConfig:
+    """Settings for rendering .env.example templates."""
+
+    # Threads rendering and writing .env files concurrently during create
+    workers: int = 8
+    # .env.example templates relative to the repository root; None discovers the
+    # tracked templates with git ls-files
+    files: tuple[str, ...] | None = None
+    # Extra templates as (source, target) pairs: source relative to the repository
+    # root, target relative to the worktree root
+    targets: tuple[tuple[str, str], ...] = ()
+
+
+@dataclass(frozen=True)
+class CheckoutConfig:
+    """Settings for populating new worktrees."""
+
+    # Parallel checkout workers (git's checkout.workers); 0 uses one per CPU
+    workers: int = 0
+    # Minimum number of files before checkout runs in parallel
+    # (git's checkout.thresholdForParallelism)
+    parallel_threshold: int = 100
+    # Give each new worktree its own settings for a fast git status (untracked cache,
+    # fsmonitor, index v4, split index, no automatic gc)
+    tune: bool = False
+
+    def git_options(self) -> list[str]:
+        """``git -c`` options that make a checkout use these settings."""
+        workers = self.workers or os.cpu_count() or 1
+        return [
+            "-c",
+            f"checkout.workers={workers}",
+            "-c",
+            f"checkout.thresholdForParallelism={self.parallel_threshold}",
+        ]
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    """Settings for the pool of pre-populated worktrees (`sprout pool`)."""
+
+    # Most worktrees the pool holds; `sprout pool fill` fills up to this by default
+    max_size: int = 4
+    # After a create takes a worktree from the pool, fill it up again in the background
+    refill: bool = True
+
+
+@dataclass(frozen=True)
+class MaintenanceConfig:
+    """Settings for `sprout maintain`."""
+
+    # Start `sprout maintain` in the background after every successful create
+    after_create: bool = False
+
+
+@dataclass(frozen=True)
+class ValueProviderConfig:
+    """A source of template variable values, such as a secrets file."""
+
+    # "file" reads a dotenv, TOML or JSON file
+    type: str
+    # File to read; relative paths are resolved against the repository root
+    path: str
+
+
+@dataclass(frozen=True)
+class ValuesConfig:
+    """Settings for where template variable values come from."""
+
+    # Remember answers typed at prompts in .sprout/.answers.json
+    remember_answers: bool = True
+    providers: tuple[ValueProviderConfig, ...] = ()
+
+
+@dataclass(frozen=True)
+class SproutConfig:
+    """Settings read from .sprout.toml."""
+
+    ports: PortConfig = field(default_factory=PortConfig)
+    templates: TemplateConfig = field(default_factory=TemplateConfig)
+    values: ValuesConfig = field(default_factory=ValuesConfig)
+    checkout: CheckoutConfig = field(default_factory=CheckoutConfig)
+    maintenance: MaintenanceConfig = field(default_factory=MaintenanceConfig)
+    pool: PoolConfig = field(default_factory=PoolConfig)
+
+
+def _parse_port_config(data: dict[str, Any]) -> PortConfig:
+    """Validate the [ports] table."""
+    defaults = PortConfig()
+    mode = data.get("mode", defaults.mode)
+    if mode not in PORT_MODES:
+        raise SproutError(f"Invalid ports.mode '{mode}' (expected one of: {', '.join(PORT_MODES)})")
+
+    block_size = data.get("block_size", defaults.block_size)
+    if not isinstance(block_size, int) or isinstance(block_size, bool) or block_size < 1:
+        raise SproutError("ports.block_size must be a positive integer")
+
+    block_range = data.get("block_range", list(defaults.block_range))
+    if (
+        not isinstance(block_range, list)
+        or len(block_range) != 2
+        or not all(isinstance(port, int) for port in block_range)
+        or not 1024 <= block_range[0] <= block_range[1] <= 65535
+    ):
+        raise SproutError("ports.block_range must be [start, end] within 1024-65535")
+    if block_range[1] - block_range[0] + 1 < block_size:
+        raise SproutError("ports.block_range is smaller than ports.block_size")
+
+    lease_ttl = data.get("lease_ttl", defaults.lease_ttl)
+    if not isinstance(lease_ttl, int) or isinstance(lease_ttl, bool) or lease_ttl < 1:
+        raise SproutError("ports.lease_ttl must be a positive number of seconds")
+
+    return PortConfig(
+        mode=mode,
+        block_size=block_size,
+        block_range=(block_range[0], block_range[1]),
+        lease_ttl=lease_ttl,
+    )
+
+
+def _check_relative(path: str) -> None:
+    """Reject template paths that could point outside the repository."""
+    if not path or PurePosixPath(path).is_absolute() or ".." in PurePosixPath(path).parts:
+        raise SproutError(f"Template path '{path}' must be relative and stay inside the repository")
+
+
+def _parse_template_config(data: dict[str, Any]) -> TemplateConfig:
+    """Validate the [templates] table."""
+    workers = data.get("workers", TemplateConfig().workers)
+    if not isinstance(workers, int) or isinstance(workers, bool) or workers < 1:
+        raise SproutError("templates.workers must be a positive integer")
+
+    files = data.get("files")
+    if files is not None:
+        if not isinstance(files, list) or not all(isinstance(path, str) for path in files):
+            raise SproutError("templates.files must be a list of paths")
+        for path in files:
+            _check_relative(path)
+
+    targets = data.get("targets", {})
+    if not isinstance(targets, dict):
+        raise SproutError("templates.targets must be a table of source = target paths")
+    for source, target in targets.items():
+        if not isinstance(target, str):
+            raise SproutError(f"templates.targets.{source} must be a path")
+        for path in (source, target):
+            _check_relative(path)
+
+    return TemplateConfig(
+        workers=workers,
+        files=None if files is None else tuple(files),
+        targets=tuple(targets.items()),
+    )
+
+
+def _parse_checkout_config(data: dict[str, Any]) -> CheckoutConfig:
+    """Validate the [checkout] table."""
+    defaults = CheckoutConfig()
+    workers = data.get("workers", defaults.workers)
+    if not isinstance(workers, int) or isinstance(workers, bool) or workers < 0:
+        raise SproutError("checkout.workers must be a non-negative integer (0 for one per CPU)")
+
+    parallel_threshold = data.get("parallel_threshold", defaults.parallel_threshold)
+    if (
+        not isinstance(parallel_threshold, int)
+        or isinstance(parallel_threshold, bool)
+        or parallel_threshold < 0
+    ):
+        raise SproutError("checkout.parallel_threshold must be a non-negative integer")
+
+    tune = data.get("tune", defaults.tune)
+    if not isinstance(tune, bool):
+        raise SproutError("checkout.tune must be true or false")
+
+    return CheckoutConfig(workers=workers, parallel_threshold=parallel_threshold, tune=tune)
+
+
+def _parse_pool_config(data: dict[str, Any]) -> PoolConfig:
+    """Validate the [pool] table."""
+    defaults = PoolConfig()
+    max_size = data.get("max_size", defaults.max_size)
+    if not isinstance(max_size, int) or isinstance(max_size, bool) or max_size < 0:
+        raise SproutError("pool.max_size must be a non-negative integer")
+
+    refill = data.get("refill", defaults.refill)
+    if not isinstance(refill, bool):
+        raise SproutError("pool.refill must be true or false")
+
+    return PoolConfig(max_size=max_size, refill=refill)
+
+
+def _parse_maintenance_config(data: dict[str, Any]) -> MaintenanceConfig:
+    """Validate the [maintenance] table."""
+    after_create = data.get("after_create", MaintenanceConfig().after_create)
+    if not isinstance(after_create, bool):
+        raise SproutError("maintenance.after_create must be true or false")
+    return MaintenanceConfig(after_create=after_create)
+
+
+def _parse_values_config(data: dict[str, Any]) -> ValuesConfig:
+    """Validate the [values] table."""
+    remember_answers = data.get("remember_answers", ValuesConfig().remember_answers)
+    if not isinstance(remember_answers, bool):
+        raise SproutError("values.remember_answers must be true or false")
+
+    providers_data = data.get("providers", [])
+    if not isinstance(providers_data, list):
+        raise SproutError("values.providers must be a list of tables")
+    providers: list[ValueProviderConfig] = []
+    for provider in providers_data:
+        if not isinstance(provider, dict) or provider.get("type") not in VALUE_PROVIDER_TYPES:
+            raise SproutError(
+                f"Invalid values provider (expected type one of: {', '.join(VALUE_PROVIDER_TYPES)})"
+            )
+        if not isinstance(provider.get("path"), str):
+            raise SproutError(f"values provider '{provider['type']}' needs a path")
+        providers.append(ValueProviderConfig(type=provider["type"], path=provider["path"]))
+
+    return ValuesConfig(remember_answers=remember_answers, providers=tuple(providers))
+
+
+def load_config(git_root: Path) -> SproutConfig:
+    """Load .sprout.toml from the repository root.
+
+    Returns:
+        The parsed configuration, or the defaults if the file doesn't exist
+    """
+    config_path = git_root / CONFIG_FILENAME
+    try:
+        with config_path.open("rb") as f:
+            data = tomllib.load(f)
+    except FileNotFoundError:
+        return SproutConfig()
+    except (OSError, tomllib.TOMLDecodeError) as e:
+        raise SproutError(f"Failed to read {CONFIG_FILENAME}: {e}") from e
+
+    return SproutConfig(
+        ports=_parse_port_config(data.get("ports", {})),
+        templates=_parse_template_config(data.get("templates", {})),
+        values=_parse_values_config(data.get("values", {})),
+        checkout=_parse_checkout_config(data.get("checkout", {})),
+        maintenance=_parse_maintenance_config(data.get("maintenance", {})),
+        pool=_parse_pool_config(data.get("pool", {})),
+    )
@@ -0,0 +1,35 @@
+"""Writing sprout's bookkeeping files in .sprout/."""
+
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+
+def atomic_write_json(
+    path: Path,
+    data: Any,
+    indent: int | None = 2,
+    sort_keys: bool = False,
+    mode: int = 0o666,
+) -> None:
+    """Write JSON to a file so readers see either the old or the new content.
+
+    The data goes to a temporary file named after the process, which then replaces
+    the target, so concurrent writers never interleave their output.
+
+    Args:
+        path: File to write
+        data: JSON-serializable content
+        indent: Indentation of the output; None writes it on one line
+        sort_keys: Sort the keys of every object
+        mode: Permissions of a newly written file, before the umask is applied
+
+    Raises:
+        OSError: If the file can't be written
+    """
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    with os.fdopen(fd, "w") as f:
+        f.write(json.dumps(data, indent=indent, sort_keys=sort_keys) + "\n")
+    os.replace(tmp_path, path)
@@ -0,0 +1,386 @@
+"""Repository context shared by every command, discovered with a single git call."""
+
+import atexit
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Sequence
+from dataclasses import dataclass
+from pathlib import Path
+
+from sprout.exceptions import SproutError
+from sprout.types import WorktreeInfo
+
+# Number of subprocesses started by sprout in this process, for tests asserting that
+# a command stays within a budget of git calls
+_subprocess_count = 0
+_count_lock = threading.Lock()
+
+# Repository context per working directory; None for directories outside a repository
+_contexts: dict[str, "GitContext | None"] = {}
+# Long-lived `git cat-file --batch-check` process per working directory
+_batch_checks: dict[str, "BatchCheck"] = {}
+_contexts_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class GitContext:
+    """Locations of the repository the current directory belongs to."""
+
+    # .git directory of the current working tree (.git/worktrees/<name> in a linked worktree)
+    git_dir: Path
+    # .git directory shared by all working trees of the repository
+    common_dir: Path
+    # Top-level directory of the current working tree
+    root: Path
+
+
+def run_subprocess(
+    cmd: list[str], check: bool = True, cwd: Path | None = None
+) -> subprocess.CompletedProcess[str]:
+    """Run a command, capturing its text output, and count it.
+
+    Raises:
+        subprocess.CalledProcessError: If ``check`` is set and the command fails
+    """
+    _count_subprocess()
+    return subprocess.run(cmd, capture_output=True, text=True, check=check, cwd=cwd)
+
+
+def run_in_background(cmd: list[str], cwd: Path, log_path: Path) -> None:
+    """Start a command in a detached process that outlives this one.
+
+    Args:
+        cmd: Command to run
+        cwd: Directory to run it in
+        log_path: File its output is appended to
+    """
+    _count_subprocess()
+    with log_path.open("a") as log:
+        subprocess.Popen(
+            cmd,
+            cwd=cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+
+
+def _count_subprocess() -> None:
+    global _subprocess_count
+    with _count_lock:
+        _subprocess_count += 1
+
+
+def subprocess_count() -> int:
+    """Number of subprocesses started through run_subprocess so far."""
+    return _subprocess_count
+
+
+def _discover(cwd: str) -> GitContext | None:
+    """Ask git for the repository locations of a directory in one call."""
+    try:
+        result = run_subprocess(
+            ["git", "rev-parse", "--git-dir", "--git-common-dir", "--show-toplevel"],
+            check=False,
+            cwd=Path(cwd),
+        )
+    except (subprocess.SubprocessError, FileNotFoundError):
+        return None
+    lines = result.stdout.splitlines()
+    if result.returncode != 0 or len(lines) < 3 or not lines[2]:
+        return None
+    # --git-dir and --git-common-dir may be relative to the working directory
+    return GitContext(
+        git_dir=Path(os.path.normpath(os.path.join(cwd, lines[0]))),
+        common_dir=Path(os.path.normpath(os.path.join(cwd, lines[1]))),
+        root=Path(lines[2]),
+    )
+
+
+def get_git_context() -> GitContext | None:
+    """Get the repository context of the current directory.
+
+    The context is discovered once per working directory and cached for the rest
+    of the process.
+
+    Returns:
+        The context, or None if the current directory is not inside a working tree
+    """
+    cwd = os.getcwd()
+    with _contexts_lock:
+        if cwd not in _contexts:
+            _contexts[cwd] = _discover(cwd)
+        return _contexts[cwd]
+
+
+def reset_git_context() -> None:
+    """Forget the cached contexts, for example after a repository was created."""
+    with _contexts_lock:
+        _contexts.clear()
+        for batch_check in _batch_checks.values():
+            batch_check.close()
+        _batch_checks.clear()
+
+
+atexit.register(reset_git_context)
+
+
+class BatchCheck:
+    """Long-lived ``git cat-file --batch-check`` process answering ref and object queries.
+
+    The process is started on the first query and reused for every later one, so
+    any number of lookups costs a single git process.
+    """
+
+    # Queries written before their answers are read, so neither pipe fills up
+    CHUNK_SIZE = 256
+
+    def __init__(self, cwd: Path | None = None) -> None:
+        """Initialize a helper for the repository containing ``cwd``."""
+        self.cwd = cwd
+        self._process: subprocess.Popen[str] | None = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> subprocess.Popen[str]:
+        if self._process is None or self._process.poll() is not None:
+            _count_subprocess()
+            self._process = subprocess.Popen(
+                ["git", "cat-file", "--batch-check"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                cwd=self.cwd,
+            )
+        return self._process
+
+    def resolve(self, names: Sequence[str]) -> dict[str, str | None]:
+        """Look up object names (refs, revisions or object IDs).
+
+        Returns:
+            The object ID each name resolves to, or None if it doesn't exist
+
+        Raises:
+            SproutError: If git can't answer the queries
+        """
+        results: dict[str, str | None] = {}
+        # A query is one line, so names with line breaks can't name anything
+        queries = list(dict.fromkeys(name for name in names if "\n" not in name))
+        with self._lock:
+            process = self._start()
+            assert process.stdin is not None and process.stdout is not None
+            for start in range(0, len(queries), self.CHUNK_SIZE):
+                chunk = queries[start : start + self.CHUNK_SIZE]
+                try:
+                    process.stdin.write("".join(f"{name}\n" for name in chunk))
+                    process.stdin.flush()
+                except OSError as e:
+                    raise SproutError(f"git cat-file failed: {e}") from e
+                for name in chunk:
+                    # "<oid> <type> <size>", or "<name> missing" / "<name> ambiguous"
+                    line = process.stdout.readline()
+                    if not line:
+                        raise SproutError("git cat-file exited unexpectedly")
+                    fields = line.split()
+                    results[name] = None if fields[-1] in ("missing", "ambiguous") else fields[0]
+        return {name: results.get(name) for name in names}
+
+    def close(self) -> None:
+        """Stop the git process."""
+        with self._lock:
+            if self._process is not None:
+                if self._process.stdin is not None:
+                    self._process.stdin.close()
+                self._process.wait()
+                if self._process.stdout is not None:
+                    self._process.stdout.close()
+                self._process = None
+
+
+def get_batch_check() -> BatchCheck:
+    """Get the shared batch-check helper for the current directory."""
+    cwd = os.getcwd()
+    with _contexts_lock:
+        if cwd not in _batch_checks:
+            _batch_checks[cwd] = BatchCheck(Path(cwd))
+        return _batch_checks[cwd]
+
+
+def refs_exist(refs: Sequence[str]) -> dict[str, bool]:
+    """Check which refs exist, with all lookups answered by one git process.
+
+    Args:
+        refs: Full ref names such as ``refs/heads/main``
+
+    Returns:
+        Whether each ref exists
+    """
+    resolved = get_batch_check().resolve(refs)
+    return {ref: resolved[ref] is not None for ref in refs}
+
+
+# Worktree-scoped settings that keep `git status` fast in large repositories
+WORKTREE_TUNING: tuple[tuple[str, str], ...] = (
+    ("core.untrackedCache", "true"),
+    ("index.version", "4"),
+    ("core.splitIndex", "true"),
+    # Objects are shared by all worktrees; gc runs from the main repository
+    ("gc.auto", "0"),
+)
+
+# git's builtin file system monitor only exists on these platforms
+FSMONITOR_PLATFORMS = ("darwin", "win32")
+
+
+def tune_worktree(worktree_path: Path) -> float:
+    """Configure a worktree for a fast ``git status`` and measure the result.
+
+    The settings are written to the worktree's own config (``extensions.worktreeConfig``),
+    so the main repository and other worktrees are unaffected, and the existing index
+    is rewritten in the tuned format right away.
+
+    Args:
+        worktree_path: Root of the worktree
+
+    Returns:
+        Seconds a ``git status`` takes once the untracked cache is populated
+
+    Raises:
+        SproutError: If git rejects a setting
+    """
+    settings = list(WORKTREE_TUNING)
+    if sys.platform in FSMONITOR_PLATFORMS:
+        settings.append(("core.fsmonitor", "true"))
+
+    git = ["git", "-C", str(worktree_path)]
+    commands = [[*git, "config", "extensions.worktreeConfig", "true"]]
+    commands += [[*git, "config", "--worktree", key, value] for key, value in settings]
+    commands.append([*git, "update-index", "--index-version", "4", "--split-index"])
+    # The first status fills the untracked cache; the second shows the steady state
+    commands.append([*git, "status", "--porcelain"])
+    try:
+        for cmd in commands:
+            run_subprocess(cmd)
+        started = time.perf_counter()
+        run_subprocess([*git, "status", "--porcelain"])
+    except subprocess.CalledProcessError as e:
+        raise SproutError(f"Command failed: {' '.join(e.cmd)}\n{e.stderr}") from e
+    return time.perf_counter() - started
+
+
+def _is_object_id(value: str) -> bool:
+    """Whether a string is a full SHA-1 or SHA-256 object name."""
+    return len(value) in (40, 64) and all(c in "0123456789abcdef" for c in value)
+
+
+class _RefReader:
+    """Resolves branches to commits from loose refs and packed-refs."""
+
+    def __init__(self, common_dir: Path) -> None:
+        self.common_dir = common_dir
+        self._packed: dict[str, str] | None = None
+
+    def _packed_refs(self) -> dict[str, str]:
+        if self._packed is None:
+            self._packed = {}
+            try:
+                lines = (self.common_dir / "packed-refs").read_text().splitlines()
+            except FileNotFoundError:
+                lines = []
+            for line in lines:
+                oid, _, ref = line.partition(" ")
+                if ref and _is_object_id(oid):
+                    self._packed[ref] = oid
+        return self._packed
+
+    def resolve(self, ref: str) -> str | None:
+        """Commit a ref points to, or None for a branch without commits."""
+        try:
+            oid = (self.common_dir / ref).read_text().strip()
+        except (FileNotFoundError, NotADirectoryError):
+            return self._packed_refs().get(ref)
+        return oid if _is_object_id(oid) else None
+
+    def read_head(self, head_file: Path, info: WorktreeInfo) -> bool:
+        """Fill in branch and head from a HEAD file; False if it isn't understood."""
+        content = head_file.read_text().strip()
+        if content.startswith("ref: refs/heads/"):
+            ref = content[5:]
+            info["branch"] = ref.removeprefix("refs/heads/")
+            oid = self.resolve(ref)
+            if oid is not None:
+                info["head"] = oid
+            return True
+        if _is_object_id(content):
+            info["head"] = content
+            return True
+        return False
+
+
+def index_state(context: GitContext) -> list[int | str] | None:
+    """Fingerprint of the current working tree's index and HEAD, read without git.
+
+    The list of tracked files can only change when the index is rewritten or HEAD
+    moves, so anything derived from ``git ls-files`` stays valid while this is equal.
+
+    Returns:
+        The index's modification time and size plus HEAD and the commit it points
+        to, or None if they can't be read
+    """
+    try:
+        stat = (context.git_dir / "index").stat()
+        head: WorktreeInfo = {}
+        if not _RefReader(context.common_dir).read_head(context.git_dir / "HEAD", head):
+            return None
+    except (OSError, UnicodeDecodeError):
+        return None
+    return [stat.st_mtime_ns, stat.st_size, head.get("branch") or "", head.get("head") or ""]
+
+
+def read_worktrees(context: GitContext) -> list[WorktreeInfo] | None:
+    """Read the working trees of a repository from its administrative files.
+
+    This gives the same paths, branches and HEADs as ``git worktree list --porcelain``
+    without starting git: the main working tree owns the common directory, and each
+    linked working tree has a ``gitdir`` and ``HEAD`` file in ``worktrees/<name>/``.
+
+    Returns:
+        The working trees, main one first, or None if the layout is unusual (bare
+        repository, reftable refs, unreadable or unexpected files) and git should
+        be asked instead
+    """
+    common_dir = context.common_dir
+    if common_dir.name != ".git" or (common_dir / "reftable").exists():
+        return None
+
+    refs = _RefReader(common_dir)
+    try:
+        main: WorktreeInfo = {"path": common_dir.parent}
+        if not refs.read_head(common_dir / "HEAD", main):
+            return None
+        worktrees = [main]
+
+        try:
+            entries = sorted(os.scandir(common_dir / "worktrees"), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            admin_dir = Path(entry.path)
+            # Absolute path of the working tree's .git file (relative with
+            # worktree.useRelativePaths)
+            gitdir = Path(os.path.normpath(admin_dir / (admin_dir / "gitdir").read_text().strip()))
+            if gitdir.name != ".git":
+                return None
+            info: WorktreeInfo = {"path": gitdir.parent}
+            if not refs.read_head(admin_dir / "HEAD", info):
+                return None
+            worktrees.append(info)
+    except (OSError, UnicodeDecodeError):
+        return None
+    return worktrees
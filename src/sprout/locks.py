@@ -0,0 +1,38 @@
+"""Inter-process file locking for sprout."""
+
+import sys
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+if sys.platform != "win32":
+    import fcntl
+
+
+@contextmanager
+def file_lock(path: Path, shared: bool = False, blocking: bool = True) -> Iterator[None]:
+    """Hold an advisory lock on a file for the duration of the block.
+
+    The lock is released automatically if the process dies. On platforms without
+    flock() the block runs unlocked.
+
+    Args:
+        path: Lock file, created if it doesn't exist
+        shared: Take a shared lock, which other shared holders can hold at the same
+            time, instead of an exclusive one
+        blocking: Wait for the lock; otherwise fail right away if it is held
+
+    Raises:
+        BlockingIOError: If ``blocking`` is false and another process holds the lock
+    """
+    with path.open("a") as lock_file:
+        if sys.platform != "win32":
+            operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            if not blocking:
+                operation |= fcntl.LOCK_NB
+            fcntl.flock(lock_file.fileno(), operation)
+        try:
+            yield
+        finally:
+            if sys.platform != "win32":
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,143 @@
+"""Maintenance of the object store shared by all worktrees of a repository."""
+
+import subprocess
+import sys
+import time
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from sprout.exceptions import SproutError
+from sprout.git import run_in_background, run_subprocess
+from sprout.locks import file_lock
+
+# Held exclusively for the whole run, so only one maintenance runs at a time
+MAINTAIN_LOCK_FILENAME = ".maintain.lock"
+# Held shared while sprout adds or removes a worktree, and exclusively while
+# maintenance prunes worktree records
+WORKTREES_LOCK_FILENAME = ".worktrees.lock"
+# Output of maintenance started in the background
+MAINTAIN_LOG_FILENAME = ".maintain.log"
+
+
+@dataclass
+class MaintenanceReport:
+    """What a maintenance run did and how much it sped up the reference query."""
+
+    # Seconds the reference query took before and after maintenance
+    query_before: float = 0.0
+    query_after: float = 0.0
+    # Seconds each step took, in the order they ran
+    steps: list[tuple[str, float]] = field(default_factory=list)
+    # Loose objects and packs before and after (from git count-objects)
+    loose_before: int = 0
+    loose_after: int = 0
+    packs_before: int = 0
+    packs_after: int = 0
+
+
+def maintain_lock(sprout_dir: Path) -> AbstractContextManager[None]:
+    """Lock held by a running maintenance; fails right away if one is running.
+
+    Raises:
+        BlockingIOError: If another maintenance holds the lock
+    """
+    return file_lock(sprout_dir / MAINTAIN_LOCK_FILENAME, blocking=False)
+
+
+def worktrees_lock(sprout_dir: Path, shared: bool = True) -> AbstractContextManager[None]:
+    """Lock keeping worktree additions and removals apart from ``git worktree prune``."""
+    return file_lock(sprout_dir / WORKTREES_LOCK_FILENAME, shared=shared)
+
+
+@contextmanager
+def _timed(steps: list[tuple[str, float]], name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    yield
+    steps.append((name, time.perf_counter() - started))
+
+
+def _git(common_dir: Path, *args: str) -> str:
+    """Run git on the common directory.
+
+    Raises:
+        SproutError: If the command fails
+    """
+    cmd = ["git", f"--git-dir={common_dir}", *args]
+    try:
+        return run_subprocess(cmd).stdout
+    except subprocess.CalledProcessError as e:
+        raise SproutError(f"Command failed: {' '.join(cmd)}\n{e.stderr}") from e
+
+
+def reference_query(common_dir: Path) -> float:
+    """Time a walk over every commit, which the commit-graph speeds up.
+
+    Returns:
+        Seconds ``git rev-list --count --all`` takes
+    """
+    started = time.perf_counter()
+    _git(common_dir, "rev-list", "--count", "--all")
+    return time.perf_counter() - started
+
+
+def count_objects(common_dir: Path) -> tuple[int, int]:
+    """Number of loose objects and of packs in the object store."""
+    counts: dict[str, str] = {}
+    for line in _git(common_dir, "count-objects", "-v").splitlines():
+        key, _, value = line.partition(": ")
+        counts[key] = value
+    return int(counts.get("count", 0)), int(counts.get("packs", 0))
+
+
+def run_maintenance(common_dir: Path, sprout_dir: Path) -> MaintenanceReport:
+    """Optimize the object store every worktree reads from.
+
+    Loose objects are packed into a new pack (an incremental repack: existing packs
+    are left alone), a multi-pack-index is written over all packs so lookups don't
+    search them one by one, the commit-graph is extended with changed-path filters,
+    and records of worktrees that no longer exist are pruned.
+
+    Args:
+        common_dir: The .git directory shared by all worktrees
+        sprout_dir: The .sprout directory holding the lock files
+
+    Raises:
+        SproutError: If maintenance is already running or a step fails
+    """
+    report = MaintenanceReport()
+    try:
+        with maintain_lock(sprout_dir):
+            report.loose_before, report.packs_before = count_objects(common_dir)
+            report.query_before = reference_query(common_dir)
+
+            with _timed(report.steps, "incremental repack"):
+                _git(common_dir, "repack", "-d", "-q")
+            # An empty repository has no packs to index
+            if any((common_dir / "objects" / "pack").glob("*.pack")):
+                with _timed(report.steps, "multi-pack-index"):
+                    _git(common_dir, "multi-pack-index", "write")
+            with _timed(report.steps, "commit-graph"):
+                _git(
+                    common_dir, "commit-graph", "write", "--reachable", "--split", "--changed-paths"
+                )
+            with _timed(report.steps, "worktree prune"), worktrees_lock(sprout_dir, shared=False):
+                _git(common_dir, "worktree", "prune")
+
+            report.loose_after, report.packs_after = count_objects(common_dir)
+            report.query_after = reference_query(common_dir)
+    except BlockingIOError as e:
+        raise SproutError("Maintenance is already running for this repository") from e
+    return report
+
+
+def start_background_maintenance(git_root: Path, sprout_dir: Path) -> None:
+    """Run ``sprout maintain`` in a detached process that outlives this one.
+
+    Its output goes to ``.sprout/.maintain.log``. A run that finds another one in
+    progress exits without doing anything.
+    """
+    run_in_background(
+        [sys.executable, "-m", "sprout", "maintain"], git_root, sprout_dir / MAINTAIN_LOG_FILENAME
+    )
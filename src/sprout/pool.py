@@ -0,0 +1,192 @@
+"""Pool of pre-populated worktrees that let `sprout create` skip the checkout."""
+
+import json
+import sys
+import uuid
+from contextlib import AbstractContextManager
+from pathlib import Path
+
+from sprout.config import CheckoutConfig
+from sprout.exceptions import SproutError
+from sprout.files import atomic_write_json
+from sprout.git import get_batch_check, run_in_background
+from sprout.locks import file_lock
+from sprout.maintenance import worktrees_lock
+from sprout.types import PoolSlot
+from sprout.utils import force_remove_worktree, run_command
+
+# Directory under .sprout/ holding the pooled worktrees
+POOL_DIRNAME = ".pool"
+# Worktrees ready to be claimed, in the order they were added, and the size the
+# pool was last filled to
+POOL_STATE_FILENAME = ".pool.json"
+POOL_STATE_VERSION = 1
+# Guards the pool state while slots are added and claimed
+POOL_LOCK_FILENAME = ".pool.lock"
+# Held while the pool is filled, so concurrent fills don't overshoot the size
+POOL_FILL_LOCK_FILENAME = ".pool-fill.lock"
+# Output of refills started in the background
+POOL_LOG_FILENAME = ".pool.log"
+
+
+class PoolState:
+    """On-disk list of the pooled worktrees that are ready to be claimed.
+
+    A worktree is only listed once its checkout completed, so a fill that was
+    interrupted never hands out a half-populated worktree.
+    """
+
+    def __init__(self, path: Path, slots: list[PoolSlot] | None = None, size: int | None = None):
+        """Initialize a state backed by the given file."""
+        self.path = path
+        self.slots: list[PoolSlot] = list(slots or [])
+        # Number of worktrees refills bring the pool back to; None until it is filled
+        self.size = size
+
+    @classmethod
+    def open(cls, sprout_dir: Path) -> "PoolState":
+        """Load the state for a .sprout directory; a missing or unreadable file is empty."""
+        path = sprout_dir / POOL_STATE_FILENAME
+        try:
+            data = json.loads(path.read_text())
+            if data.get("version") != POOL_STATE_VERSION:
+                raise ValueError(f"unsupported pool state version: {data.get('version')}")
+            size = data.get("size")
+            if size is not None and not isinstance(size, int):
+                raise ValueError(f"invalid pool size: {size!r}")
+            return cls(path, list(data["slots"]), size)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return cls(path)
+
+    def save(self) -> None:
+        """Write the state atomically."""
+        data = {"version": POOL_STATE_VERSION, "size": self.size, "slots": self.slots}
+        atomic_write_json(self.path, data)
+
+
+def pool_lock(sprout_dir: Path) -> AbstractContextManager[None]:
+    """Lock guarding the pool state of a .sprout directory."""
+    return file_lock(sprout_dir / POOL_LOCK_FILENAME)
+
+
+def slot_path(sprout_dir: Path, slot: PoolSlot) -> Path:
+    """Directory of a pooled worktree."""
+    return sprout_dir / POOL_DIRNAME / slot["name"]
+
+
+def _ready_slots(sprout_dir: Path, state: PoolState) -> list[PoolSlot]:
+    """Slots whose worktree still exists."""
+    return [slot for slot in state.slots if (slot_path(sprout_dir, slot) / ".git").exists()]
+
+
+def fill_pool(sprout_dir: Path, size: int, checkout: CheckoutConfig) -> list[PoolSlot]:
+    """Add detached worktrees at the current HEAD until the pool holds ``size``.
+
+    The size is recorded, so refills after a claim bring the pool back to it.
+
+    Args:
+        sprout_dir: The .sprout directory
+        size: Number of worktrees the pool should hold
+        checkout: Parallel checkout settings used to populate the worktrees
+
+    Returns:
+        The worktrees that were added
+
+    Raises:
+        SproutError: If the repository has no commits or a worktree can't be created
+    """
+    added: list[PoolSlot] = []
+    with file_lock(sprout_dir / POOL_FILL_LOCK_FILENAME):
+        with pool_lock(sprout_dir):
+            state = PoolState.open(sprout_dir)
+            if state.size != size:
+                state.size = size
+                state.save()
+            missing = size - len(_ready_slots(sprout_dir, state))
+        if missing <= 0:
+            return added
+
+        head = get_batch_check().resolve(["HEAD"])["HEAD"]
+        if head is None:
+            raise SproutError("Cannot fill the pool of a repository without commits")
+        (sprout_dir / POOL_DIRNAME).mkdir(exist_ok=True)
+
+        for _ in range(missing):
+            slot: PoolSlot = {"name": uuid.uuid4().hex[:12], "head": head}
+            path = slot_path(sprout_dir, slot)
+            try:
+                with worktrees_lock(sprout_dir):
+                    run_command(
+                        ["git", "worktree", "add", "--detach", "--no-checkout", str(path), head]
+                    )
+                run_command(["git", "-C", str(path), *checkout.git_options(), "checkout"])
+            except (SproutError, KeyboardInterrupt):
+                force_remove_worktree(path)
+                raise
+            with pool_lock(sprout_dir):
+                state = PoolState.open(sprout_dir)
+                state.slots = [*_ready_slots(sprout_dir, state), slot]
+                state.save()
+            added.append(slot)
+    return added
+
+
+def claim_slot(sprout_dir: Path, destination: Path) -> PoolSlot | None:
+    """Take a worktree from the pool and move it to ``destination``.
+
+    The worktree keeps the detached HEAD it was filled at; the caller checks out
+    the branch, which only updates the files that differ.
+
+    Returns:
+        The claimed worktree, or None if the pool is empty
+    """
+    if not (sprout_dir / POOL_STATE_FILENAME).exists():
+        return None
+    with pool_lock(sprout_dir):
+        state = PoolState.open(sprout_dir)
+        slots = _ready_slots(sprout_dir, state)
+        claimed: PoolSlot | None = None
+        while slots and claimed is None:
+            slot = slots.pop(0)
+            path = slot_path(sprout_dir, slot)
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                with worktrees_lock(sprout_dir):
+                    run_command(["git", "worktree", "move", str(path), str(destination)])
+                claimed = slot
+            except SproutError:
+                # Worktrees git refuses to move (with submodules, say) are discarded
+                force_remove_worktree(path)
+        if slots != state.slots:
+            state.slots = slots
+            state.save()
+    return claimed
+
+
+def clear_pool(sprout_dir: Path) -> int:
+    """Remove every pooled worktree, including ones left behind by interrupted fills.
+
+    Returns:
+        Number of worktrees removed
+    """
+    pool_dir = sprout_dir / POOL_DIRNAME
+    with file_lock(sprout_dir / POOL_FILL_LOCK_FILENAME), pool_lock(sprout_dir):
+        paths = sorted(pool_dir.iterdir()) if pool_dir.is_dir() else []
+        for path in paths:
+            force_remove_worktree(path)
+        state = PoolState.open(sprout_dir)
+        if state.slots or state.size is not None:
+            state.slots = []
+            state.size = None
+            state.save()
+    return len(paths)
+
+
+def start_background_fill(git_root: Path, sprout_dir: Path) -> None:
+    """Run ``sprout pool fill`` in a detached process, logging to ``.sprout/.pool.log``.
+
+    Without a size the fill brings the pool back to the size it was last filled to.
+    """
+    run_in_background(
+        [sys.executable, "-m", "sprout", "pool", "fill"], git_root, sprout_dir / POOL_LOG_FILENAME
+    )
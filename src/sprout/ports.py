@@ -0,0 +1,798 @@
+"""Port bookkeeping for sprout worktrees."""
+
+import hashlib
+import json
+import os
+import random
+import re
+import socket
+import threading
+import time
+from collections.abc import Callable, Iterable
+from contextlib import AbstractContextManager
+from pathlib import Path
+
+from sprout.exceptions import SproutError
+from sprout.files import atomic_write_json
+from sprout.locks import file_lock
+from sprout.types import BranchName, PortLease, PortNumber, PortSet
+
+# Ledger file kept next to the worktrees
+LEDGER_FILENAME = ".ports.json"
+# Version 1 recorded a single owner per port; it is still read
+LEDGER_VERSION = 2
+
+# Leases reserve ports while a worktree is being created; all ledger and lease
+# updates happen under the lock file so parallel sprout processes never collide.
+LEASES_FILENAME = ".leases.json"
+LOCK_FILENAME = ".ports.lock"
+DEFAULT_LEASE_TTL = 600
+
+# Port assignments in generated .env files (e.g., PORT=8080)
+PORT_ASSIGNMENT_PATTERN = re.compile(r"=(\d{4,5})\b")
+
+# Random candidates tried before giving up on finding a free port
+MAX_PORT_ATTEMPTS = 1000
+
+# Kernel socket tables listing every local port in use on this machine (Linux)
+PROC_NET_DIR = Path("/proc/net")
+PROC_NET_TABLES = ("tcp", "tcp6", "udp", "udp6")
+
+# Range the kernel hands out for outgoing connections (Linux)
+EPHEMERAL_RANGE_PATH = Path("/proc/sys/net/ipv4/ip_local_port_range")
+
+# Ports sprout may hand out
+MIN_PORT = 1024
+MAX_PORT = 65535
+
+
+def extract_ports(content: str) -> PortSet:
+    """Extract port numbers assigned in .env file content."""
+    ports: PortSet = set()
+    for port_str in PORT_ASSIGNMENT_PATTERN.findall(content):
+        port = int(port_str)
+        if 1024 <= port <= 65535:
+            ports.add(port)
+    return ports
+
+
+def _find_owner(env_file: Path, sprout_dir: Path, roots: dict[Path, str | None]) -> str:
+    """Return the worktree (relative to .sprout/) that contains env_file."""
+    # Walk up to the nearest directory holding a .git entry (the worktree root)
+    for parent in env_file.parents:
+        if parent == sprout_dir:
+            break
+        if parent not in roots:
+            is_root = (parent / ".git").exists()
+            roots[parent] = parent.relative_to(sprout_dir).as_posix() if is_root else None
+        owner = roots[parent]
+        if owner is not None:
+            return owner
+    return env_file.relative_to(sprout_dir).parts[0]
+
+
+def _find_worktree_roots(sprout_dir: Path) -> list[BranchName]:
+    """List the worktrees under .sprout/ without entering their source trees.
+
+    Only branch-name directories (e.g. ``feature/`` for ``feature/login``) are
+    descended; the walk stops at the first directory holding a ``.git`` entry.
+    """
+    roots: list[BranchName] = []
+    pending = [""]
+    while pending:
+        relative = pending.pop()
+        path = os.path.join(sprout_dir, relative)
+        if relative and os.path.lexists(os.path.join(path, ".git")):
+            roots.append(Path(relative).as_posix())
+            continue
+        try:
+            with os.scandir(path) as entries:
+                pending.extend(
+                    os.path.join(relative, entry.name)
+                    for entry in entries
+                    # Ref components can't start with a dot, so dot-dirs are never worktrees
+                    if not entry.name.startswith(".") and entry.is_dir(follow_symlinks=False)
+                )
+        except OSError:
+            continue
+    return sorted(roots)
+
+
+def scan_env_ports(
+    sprout_dir: Path, env_dirs: Iterable[str] | None = None
+) -> dict[BranchName, PortSet]:
+    """Scan the worktrees' .env files and group their ports by worktree.
+
+    Args:
+        sprout_dir: The .sprout directory to scan
+        env_dirs: Directories (relative to a worktree root) that templates generate
+            .env files in. Only those files are read, so the cost grows with
+            worktrees x templates instead of the size of the source trees. Without
+            it every .env file under .sprout/ is searched for.
+    """
+    owners: dict[BranchName, PortSet] = {}
+    if not sprout_dir.exists():
+        return owners
+
+    if env_dirs is not None:
+        targets = sorted(set(env_dirs))
+        for root in _find_worktree_roots(sprout_dir):
+            for env_dir in targets:
+                try:
+                    content = (sprout_dir / root / env_dir / ".env").read_text()
+                except (OSError, ValueError):
+                    continue
+                ports = extract_ports(content)
+                if ports:
+                    owners.setdefault(root, set()).update(ports)
+        return owners
+
+    roots: dict[Path, str | None] = {}
+    for env_file in sprout_dir.rglob("*.env"):
+        relative = env_file.relative_to(sprout_dir)
+        if relative.parts[0].startswith("."):
+            continue
+        if not env_file.is_file():
+            continue
+        try:
+            ports = extract_ports(env_file.read_text())
+        except (OSError, ValueError):
+            continue
+        if ports:
+            owner = _find_owner(env_file, sprout_dir, roots)
+            owners.setdefault(owner, set()).update(ports)
+
+    return owners
+
+
+class PortLedger:
+    """On-disk record of which worktrees own each allocated port.
+
+    The ledger lives in ``.sprout/.ports.json`` and maps every port handed out
+    by sprout to the worktrees it was generated for, so port lookups no longer
+    need to read every ``.env`` file under ``.sprout/``. A fixed port written by
+    a template (``DB_PORT=5432``) belongs to every worktree using it and stays
+    taken until the last of them is removed. In block mode the ledger also
+    records the contiguous port block assigned to each worktree.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        owners: dict[PortNumber, set[BranchName]] | None = None,
+        blocks: dict[BranchName, tuple[PortNumber, int]] | None = None,
+    ) -> None:
+        """Initialize a ledger backed by the given file."""
+        self.path = path
+        self._owners: dict[PortNumber, set[BranchName]] = {
+            port: set(port_owners) for port, port_owners in (owners or {}).items() if port_owners
+        }
+        self._blocks: dict[BranchName, tuple[PortNumber, int]] = dict(blocks or {})
+
+    @classmethod
+    def open(cls, sprout_dir: Path, env_dirs: Iterable[str] | None = None) -> "PortLedger":
+        """Load the ledger for a .sprout directory, rebuilding it if missing or unreadable.
+
+        Args:
+            sprout_dir: The .sprout directory
+            env_dirs: Template directories to scan if the ledger has to be rebuilt
+        """
+        path = sprout_dir / LEDGER_FILENAME
+        try:
+            data = json.loads(path.read_text())
+            version = data.get("version")
+            if version not in (1, LEDGER_VERSION):
+                raise ValueError(f"unsupported ledger version: {version}")
+            owners = {
+                int(port): {str(owner)} if version == 1 else {str(name) for name in owner}
+                for port, owner in data["ports"].items()
+            }
+            blocks = {
+                str(owner): (int(base), int(size))
+                for owner, (base, size) in data.get("blocks", {}).items()
+            }
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            ledger = cls.rebuild(sprout_dir, env_dirs=env_dirs)
+            if sprout_dir.exists():
+                ledger.save()
+            return ledger
+        return cls(path, owners, blocks)
+
+    @classmethod
+    def rebuild(
+        cls,
+        sprout_dir: Path,
+        blocks: dict[BranchName, tuple[PortNumber, int]] | None = None,
+        env_dirs: Iterable[str] | None = None,
+    ) -> "PortLedger":
+        """Build a ledger by rescanning the .env files of existing worktrees once.
+
+        Args:
+            sprout_dir: The .sprout directory to scan
+            blocks: Port block assignments to carry over from a previous ledger
+            env_dirs: Template directories to scan (see scan_env_ports)
+        """
+        owners: dict[PortNumber, set[BranchName]] = {}
+        for owner, ports in scan_env_ports(sprout_dir, env_dirs).items():
+            for port in ports:
+                owners.setdefault(port, set()).add(owner)
+        return cls(sprout_dir / LEDGER_FILENAME, owners, blocks)
+
+    def ports(self) -> PortSet:
+        """Return all ports recorded in the ledger."""
+        return set(self._owners)
+
+    def port_owners(self, port: PortNumber) -> set[BranchName]:
+        """Return the worktrees owning a port (empty if the port is free)."""
+        return set(self._owners.get(port, ()))
+
+    def ports_for(self, owner: BranchName) -> PortSet:
+        """Return the ports owned by a worktree."""
+        return {port for port, port_owners in self._owners.items() if owner in port_owners}
+
+    def ports_of_others(self, owner: BranchName) -> PortSet:
+        """Return the ports owned by any worktree other than ``owner``."""
+        return {port for port, port_owners in self._owners.items() if port_owners - {owner}}
+
+    def owners(self) -> dict[BranchName, PortSet]:
+        """Return the recorded ports grouped by worktree."""
+        grouped: dict[BranchName, PortSet] = {}
+        for port, port_owners in self._owners.items():
+            for owner in port_owners:
+                grouped.setdefault(owner, set()).add(port)
+        return grouped
+
+    def blocks(self) -> dict[BranchName, tuple[PortNumber, int]]:
+        """Return the (base, size) port block assigned to each worktree."""
+        return dict(self._blocks)
+
+    def block_for(self, owner: BranchName) -> range | None:
+        """Return the port block assigned to a worktree, if any."""
+        if owner not in self._blocks:
+            return None
+        base, size = self._blocks[owner]
+        return range(base, base + size)
+
+    def _block_conflicts(self, owner: BranchName, base: PortNumber, size: int) -> bool:
+        """Check if a block overlaps another worktree's block or ports."""
+        for other, (other_base, other_size) in self._blocks.items():
+            if other != owner and base < other_base + other_size and other_base < base + size:
+                return True
+        return any(self._owners.get(port, {owner}) - {owner} for port in range(base, base + size))
+
+    def assign_block(
+        self, owner: BranchName, size: int, port_range: tuple[PortNumber, PortNumber]
+    ) -> range:
+        """Assign a contiguous port block to a worktree.
+
+        The first candidate block is derived from a hash of the worktree name, so
+        recreating a branch gets the same block back. Blocks already taken by other
+        worktrees are skipped by linear probing. The assignment is persisted by the
+        next ``claim``.
+
+        Args:
+            owner: Worktree the block is assigned to
+            size: Number of ports in the block
+            port_range: Inclusive (start, end) range blocks are carved from
+
+        Returns:
+            The ports of the assigned block
+        """
+        existing = self._blocks.get(owner)
+        if existing is not None and existing[1] == size:
+            return range(existing[0], existing[0] + size)
+
+        start, end = port_range
+        count = (end - start + 1) // size
+        digest = hashlib.sha256(owner.encode()).digest()
+        first = int.from_bytes(digest[:8], "big") % count
+        for step in range(count):
+            base = start + ((first + step) % count) * size
+            if not self._block_conflicts(owner, base, size):
+                self._blocks[owner] = (base, size)
+                return range(base, base + size)
+
+        raise SproutError(f"No free block of {size} ports left in range {start}-{end}")
+
+    def claim(self, owner: BranchName, ports: PortSet) -> None:
+        """Record the full set of ports owned by a worktree and persist the ledger.
+
+        The worktree gives up ports previously recorded for it but missing from
+        ``ports``; other worktrees sharing a port keep it.
+        """
+        for port in self.ports_for(owner) - ports:
+            self._disown(port, owner)
+        for port in ports:
+            self._owners.setdefault(port, set()).add(owner)
+        self.save()
+
+    def _disown(self, port: PortNumber, owner: BranchName) -> None:
+        """Drop one owner of a port; the port is free once it has none left."""
+        self._owners[port].discard(owner)
+        if not self._owners[port]:
+            del self._owners[port]
+
+    def release(self, owner: BranchName) -> PortSet:
+        """Drop a worktree's ports and block and persist the ledger.
+
+        Ports other worktrees also own stay recorded for them.
+
+        Returns:
+            The ports the worktree owned
+        """
+        released = self.ports_for(owner)
+        for port in released:
+            self._disown(port, owner)
+        block = self._blocks.pop(owner, None)
+        if released or block is not None:
+            self.save()
+        return released
+
+    def verify(
+        self,
+        env_dirs: Iterable[str] | None = None,
+        scanned: dict[BranchName, PortSet] | None = None,
+    ) -> dict[str, PortSet]:
+        """Compare the ledger against a scan of the worktrees' .env files.
+
+        Args:
+            env_dirs: Template directories to scan (see scan_env_ports)
+            scanned: Result of an earlier scan_env_ports call to compare against
+                instead of scanning again
+
+        Returns:
+            Dict with ``untracked`` ports (found in .env files but missing from the
+            ledger) and ``stale`` ports (recorded but no longer found in any .env file).
+        """
+        if scanned is None:
+            scanned = scan_env_ports(self.path.parent, env_dirs)
+        found: PortSet = set()
+        for ports in scanned.values():
+            found.update(ports)
+        recorded = self.ports()
+        return {"untracked": found - recorded, "stale": recorded - found}
+
+    def save(self) -> None:
+        """Write the ledger atomically."""
+        data = {
+            "version": LEDGER_VERSION,
+            "ports": {str(port): sorted(self._owners[port]) for port in sorted(self._owners)},
+            "blocks": {owner: list(self._blocks[owner]) for owner in sorted(self._blocks)},
+        }
+        atomic_write_json(self.path, data)
+
+
+def ports_lock(sprout_dir: Path) -> AbstractContextManager[None]:
+    """Lock guarding the port ledger and leases of a .sprout directory."""
+    return file_lock(sprout_dir / LOCK_FILENAME)
+
+
+class PortLeases:
+    """Cross-process port reservations held while a worktree is being created.
+
+    Every allocated port is leased in ``.sprout/.leases.json`` under the ports
+    lock before it is written to any file, so concurrent ``sprout create`` runs
+    never hand out the same port. Leases are dropped once the ports are claimed
+    in the ledger; leases left behind by crashed processes expire after ``ttl``
+    seconds. ``env_dirs`` are the template directories scanned if the ledger has
+    to be rebuilt (see scan_env_ports).
+    """
+
+    def __init__(
+        self,
+        sprout_dir: Path,
+        owner: BranchName,
+        ttl: float = DEFAULT_LEASE_TTL,
+        clock: Callable[[], float] = time.time,
+        env_dirs: Iterable[str] | None = None,
+    ) -> None:
+        """Initialize the leases held by this process for a worktree."""
+        self.sprout_dir = sprout_dir
+        self.path = sprout_dir / LEASES_FILENAME
+        self.owner = owner
+        self.ttl = ttl
+        self.env_dirs = env_dirs
+        self.pid = os.getpid()
+        self._clock = clock
+
+    def locked(self) -> AbstractContextManager[None]:
+        """Hold the ports lock."""
+        return ports_lock(self.sprout_dir)
+
+    def _is_mine(self, lease: PortLease) -> bool:
+        return lease["owner"] == self.owner and lease["pid"] == self.pid
+
+    def load(self) -> dict[PortNumber, PortLease]:
+        """Read all unexpired leases."""
+        try:
+            data = json.loads(self.path.read_text())
+            leases = {
+                int(port): PortLease(
+                    owner=str(lease["owner"]),
+                    pid=int(lease["pid"]),
+                    expires=float(lease["expires"]),
+                )
+                for port, lease in data["leases"].items()
+            }
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return {}
+        now = self._clock()
+        return {port: lease for port, lease in leases.items() if lease["expires"] > now}
+
+    def _save(self, leases: dict[PortNumber, PortLease]) -> None:
+        data = {"leases": {str(port): leases[port] for port in sorted(leases)}}
+        atomic_write_json(self.path, data)
+
+    def taken_ports(self) -> PortSet:
+        """Ports leased by other processes or recorded for other worktrees.
+
+        Must be called while holding the lock.
+        """
+        taken = {port for port, lease in self.load().items() if not self._is_mine(lease)}
+        ledger = PortLedger.open(self.sprout_dir, env_dirs=self.env_dirs)
+        return taken | ledger.ports_of_others(self.owner)
+
+    def acquire(self, ports: PortSet) -> None:
+        """Lease ports for this process. Must be called while holding the lock."""
+        leases = self.load()
+        expires = self._clock() + self.ttl
+        for port in ports:
+            leases[port] = PortLease(owner=self.owner, pid=self.pid, expires=expires)
+        self._save(leases)
+
+    def release(self) -> None:
+        """Drop every lease held by this process. Must be called while holding the lock."""
+        leases = self.load()
+        remaining = {port: lease for port, lease in leases.items() if not self._is_mine(lease)}
+        if remaining != leases:
+            self._save(remaining)
+
+
+def is_port_available(port: PortNumber) -> bool:
+    """Check if a port is available for binding."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind(("127.0.0.1", port))
+            return True
+        except OSError:
+            return False
+
+
+def kernel_assigned_port() -> PortNumber:
+    """Let the kernel pick a free port by binding port 0."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        port: PortNumber = sock.getsockname()[1]
+        return port
+
+
+def read_bound_ports(proc_net: Path = PROC_NET_DIR) -> PortSet | None:
+    """Read every locally bound port from the kernel's socket tables in one pass.
+
+    Parses /proc/net/tcp, tcp6, udp and udp6, covering listening sockets, UDP
+    sockets and open connections on all addresses.
+
+    Returns:
+        Set of bound ports, or None if the tables are not available (e.g., not Linux)
+    """
+    ports: PortSet = set()
+    found = False
+    for table in PROC_NET_TABLES:
+        try:
+            content = (proc_net / table).read_text()
+        except OSError:
+            continue
+        found = True
+        # Skip the header; the local address ("0100007F:1F90") is the second column
+        for line in content.splitlines()[1:]:
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            try:
+                ports.add(int(fields[1].rsplit(":", 1)[1], 16))
+            except (IndexError, ValueError):
+                continue
+    return ports if found else None
+
+
+def read_ephemeral_range(path: Path = EPHEMERAL_RANGE_PATH) -> tuple[PortNumber, PortNumber] | None:
+    """Read the kernel's ephemeral port range.
+
+    Returns:
+        Inclusive (start, end) range, or None if it can't be determined
+    """
+    try:
+        start, end = (int(value) for value in path.read_text().split())
+    except (OSError, ValueError):
+        return None
+    return start, end
+
+
+def parse_port_range(spec: str) -> tuple[PortNumber, PortNumber]:
+    """Parse a port range such as "8000-8999"."""
+    try:
+        start_str, end_str = spec.split("-")
+        start, end = int(start_str), int(end_str)
+    except ValueError as e:
+        raise SproutError(f"Invalid port range '{spec}' (expected START-END)") from e
+    if not 1 <= start <= end <= MAX_PORT:
+        raise SproutError(f"Invalid port range '{spec}' (ports must be within 1-{MAX_PORT})")
+    return start, end
+
+
+def parse_auto_port_args(
+    args: str,
+) -> tuple[str | None, tuple[PortNumber, PortNumber] | None]:
+    """Parse the arguments of auto_port().
+
+    Accepts an optional quoted name and an optional START-END range, e.g.
+    ``"api"``, ``8000-8999`` or ``"api", 8000-8999``.
+
+    Returns:
+        Tuple of (name, port range), either of which may be None
+    """
+    name: str | None = None
+    port_range: tuple[PortNumber, PortNumber] | None = None
+    for arg in (part.strip() for part in args.split(",")) if args.strip() else ():
+        if len(arg) >= 2 and arg[0] == arg[-1] and arg[0] in "\"'":
+            if name is not None or not arg[1:-1]:
+                raise SproutError(f"Invalid auto_port() arguments '{args}'")
+            name = arg[1:-1]
+        elif port_range is None:
+            port_range = parse_port_range(arg)
+        else:
+            raise SproutError(f"Invalid auto_port() arguments '{args}'")
+    return name, port_range
+
+
+class PortBitmap:
+    """Set of port numbers stored as a 65536-bit array.
+
+    ``first_free`` skips fully used 64-port words at once, so finding a free port
+    in a range costs O(range / 64).
+    """
+
+    WORD_BITS = 64
+    FULL_WORD = (1 << WORD_BITS) - 1
+
+    def __init__(self, ports: Iterable[PortNumber] = ()) -> None:
+        """Initialize the bitmap with the given ports marked as used."""
+        self._bits = bytearray((MAX_PORT + 1) // 8)
+        self.update(ports)
+
+    def __contains__(self, port: object) -> bool:
+        """Check if a port is marked as used."""
+        if not isinstance(port, int) or not 0 <= port <= MAX_PORT:
+            return False
+        return bool(self._bits[port >> 3] >> (port & 7) & 1)
+
+    def add(self, port: PortNumber) -> None:
+        """Mark a port as used."""
+        self._bits[port >> 3] |= 1 << (port & 7)
+
+    def update(self, ports: Iterable[PortNumber]) -> None:
+        """Mark several ports as used."""
+        for port in ports:
+            self.add(port)
+
+    def first_free(self, start: PortNumber, end: PortNumber) -> PortNumber | None:
+        """Return the lowest unused port in the inclusive range, or None if all are used."""
+        port = start
+        while port <= end:
+            if port % self.WORD_BITS == 0 and port + self.WORD_BITS - 1 <= end:
+                offset = port >> 3
+                word = int.from_bytes(self._bits[offset : offset + 8], "little")
+                if word != self.FULL_WORD:
+                    free = ~word & self.FULL_WORD
+                    return port + (free & -free).bit_length() - 1
+                port += self.WORD_BITS
+                continue
+            if port not in self:
+                return port
+            port += 1
+        return None
+
+
+class PortSession:
+    """Port allocation state shared by every template rendered in one operation.
+
+    The set of ports used by other worktrees is loaded once, on the first
+    allocation, and every port handed out afterwards is remembered in
+    ``reserved`` so later placeholders never receive it again. Candidates are
+    checked against a bitmap built from that snapshot and a single snapshot of
+    the ports bound on this machine; only the final pick is confirmed with a
+    bind probe.
+
+    Ports picked by sprout avoid the kernel's ephemeral range. With a ``block``,
+    ports are handed out in order from that block; with ``kernel_port``, the
+    kernel chooses. Otherwise ports are picked at random, falling back to a
+    bitmap scan so allocation only fails when no port is left. Explicit ranges
+    (``auto_port(8000-8999)``) always return the first free port in the range.
+    Named allocations (``auto_port("api")``) are made once per session and the
+    same port is returned for every later request of that name.
+
+    With ``leases``, each allocation runs under the ports lock: ports taken by
+    concurrent processes are refreshed first and the pick is leased before it is
+    returned. A session may be shared by threads rendering templates concurrently.
+
+    Attributes:
+        reserved: Ports allocated during this session
+        named: Ports allocated by name during this session
+        probes: Number of availability probes performed
+        rescans: Number of times the used-port snapshot was loaded
+    """
+
+    def __init__(
+        self,
+        load_used_ports: Callable[[], PortSet],
+        probe: Callable[[PortNumber], bool] = is_port_available,
+        load_bound_ports: Callable[[], PortSet | None] = read_bound_ports,
+        load_ephemeral_range: Callable[
+            [], tuple[PortNumber, PortNumber] | None
+        ] = read_ephemeral_range,
+        block: range | None = None,
+        kernel_port: Callable[[], PortNumber] | None = None,
+        leases: PortLeases | None = None,
+    ) -> None:
+        """Initialize a session.
+
+        Args:
+            load_used_ports: Returns the ports already taken by other worktrees
+            probe: Returns True if a port can be bound on this machine
+            load_bound_ports: Returns the ports currently bound on this machine, or
+                None if unknown (every candidate is then checked with ``probe``)
+            load_ephemeral_range: Returns the kernel's ephemeral port range, or None
+            block: Contiguous ports to fill in order before falling back to random picks
+            kernel_port: If given, asks the kernel for a port instead of picking one
+            leases: Cross-process leases to coordinate with concurrent sprout runs
+        """
+        self._load_used_ports = load_used_ports
+        self._probe = probe
+        self._load_bound_ports = load_bound_ports
+        self._load_ephemeral_range = load_ephemeral_range
+        self._used_ports: PortSet | None = None
+        self._bound_ports: PortSet | None = None
+        self._ephemeral_range: tuple[PortNumber, PortNumber] | None = None
+        self._taken: PortBitmap | None = None
+        self.block = block
+        self.kernel_port = kernel_port
+        self.leases = leases
+        self.reserved: PortSet = set()
+        self.named: dict[str, PortNumber] = {}
+        self.probes = 0
+        self.rescans = 0
+        self._lock = threading.RLock()
+
+    @property
+    def used_ports(self) -> PortSet:
+        """Ports taken by other worktrees, loaded once per session."""
+        if self._used_ports is None:
+            self._used_ports = set(self._load_used_ports())
+            self.rescans += 1
+        return self._used_ports
+
+    @property
+    def bound_ports(self) -> PortSet:
+        """Ports bound on this machine when the session first needed them."""
+        if self._bound_ports is None:
+            self._bound_ports = self._load_bound_ports() or set()
+        return self._bound_ports
+
+    @property
+    def taken(self) -> PortBitmap:
+        """Bitmap of ports used by worktrees, bound on this machine or reserved."""
+        if self._taken is None:
+            self._taken = PortBitmap(self.used_ports)
+            self._taken.update(self.bound_ports)
+            self._taken.update(self.reserved)
+        return self._taken
+
+    @property
+    def allowed_ranges(self) -> list[tuple[PortNumber, PortNumber]]:
+        """Ranges sprout picks ports from: 1024-65535 minus the ephemeral range."""
+        if self._ephemeral_range is None:
+            self._ephemeral_range = self._load_ephemeral_range() or (0, -1)
+        low, high = self._ephemeral_range
+        if high < low:
+            return [(MIN_PORT, MAX_PORT)]
+        ranges = [(MIN_PORT, min(low - 1, MAX_PORT)), (max(high + 1, MIN_PORT), MAX_PORT)]
+        return [(start, end) for start, end in ranges if start <= end]
+
+    def is_allowed(self, port: PortNumber) -> bool:
+        """Check if sprout may pick a port on its own (outside the ephemeral range)."""
+        return any(start <= port <= end for start, end in self.allowed_ranges)
+
+    def reserve(self, ports: PortSet) -> None:
+        """Mark ports as taken for the rest of the session."""
+        with self._lock:
+            self.reserved.update(ports)
+            if self._taken is not None:
+                self._taken.update(ports)
+
+    def _try_reserve(self, port: PortNumber) -> bool:
+        """Reserve a port if it is free, confirming the pick with a bind probe."""
+        if port in self.taken:
+            return False
+
+        # Confirm the pick with a real bind in case the snapshot is out of date
+        self.probes += 1
+        if self._probe(port):
+            self.reserve({port})
+            return True
+        return False
+
+    def _first_free(self, start: PortNumber, end: PortNumber) -> PortNumber | None:
+        """Reserve the first free port in a range."""
+        port = self.taken.first_free(start, end)
+        while port is not None:
+            if self._try_reserve(port):
+                return port
+            port = self.taken.first_free(port + 1, end) if port < end else None
+        return None
+
+    def allocate(
+        self,
+        port_range: tuple[PortNumber, PortNumber] | None = None,
+        name: str | None = None,
+    ) -> PortNumber:
+        """Reserve and return a port that is neither taken nor bound on this machine.
+
+        Args:
+            port_range: Inclusive (start, end) range to pick the first free port from
+            name: Allocation name; every request with the same name gets the same port
+        """
+        with self._lock:
+            if name is not None and name in self.named:
+                return self.named[name]
+
+            if self.leases is None:
+                port = self._allocate(port_range)
+            else:
+                with self.leases.locked():
+                    # Ports handed out by concurrent processes since the snapshot was taken
+                    self.taken.update(self.leases.taken_ports())
+                    port = self._allocate(port_range)
+                    self.leases.acquire({port})
+
+            if name is not None:
+                self.named[name] = port
+            return port
+
+    def _allocate(self, port_range: tuple[PortNumber, PortNumber] | None) -> PortNumber:
+        """Pick and reserve a port without cross-process coordination."""
+        if port_range is not None:
+            start, end = port_range
+            port = self._first_free(start, end)
+            if port is None:
+                raise SproutError(f"No available port in range {start}-{end}")
+            return port
+
+        if self.kernel_port is not None:
+            for _ in range(MAX_PORT_ATTEMPTS):
+                self.probes += 1
+                port = self.kernel_port()
+                if port >= MIN_PORT and port not in self.taken:
+                    self.reserve({port})
+                    return port
+            raise SproutError(
+                f"Could not get an unused port from the kernel after {MAX_PORT_ATTEMPTS} attempts"
+            )
+
+        if self.block is not None:
+            for port in self.block:
+                if self.is_allowed(port) and self._try_reserve(port):
+                    return port
+
+        for _ in range(MAX_PORT_ATTEMPTS):
+            # Random port between 1024 and 65535
+            port = random.randint(MIN_PORT, MAX_PORT)
+            if self.is_allowed(port) and self._try_reserve(port):
+                return port
+
+        # Random picks keep hitting used ports: scan for the first free one instead
+        for start, end in self.allowed_ranges:
+            free_port = self._first_free(start, end)
+            if free_port is not None:
+                return free_port
+
+        raise SproutError("Could not find an available port: all ports are in use")
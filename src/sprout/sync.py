@@ -0,0 +1,191 @@
+"""Incremental regeneration of rendered templates in existing worktrees."""
+
+import hashlib
+import json
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from sprout.files import atomic_write_json
+from sprout.templates import split_lines
+from sprout.types import BranchName, TargetState, TemplateToken, WorktreeState
+
+# Record of the templates each worktree was rendered from. Updates happen under the
+# ports lock.
+SYNC_STATE_FILENAME = ".sync.json"
+SYNC_STATE_VERSION = 1
+
+
+def template_hash(template_path: Path) -> str:
+    """Hash a template's content to detect changes."""
+    return hashlib.sha256(template_path.read_bytes()).hexdigest()
+
+
+def line_key(line: str) -> str | None:
+    """Return the variable a KEY=VALUE line assigns, if any."""
+    head, eq, _ = line.partition("=")
+    key = head.strip().removeprefix("export ").strip()
+    if not eq or not key or key.startswith("#") or " " in key:
+        return None
+    return key
+
+
+def assignment_key(line_tokens: list[TemplateToken]) -> str | None:
+    """Return the variable a compiled template line assigns, if any."""
+    if not line_tokens or line_tokens[0]["kind"] != "literal":
+        return None
+    return line_key(line_tokens[0]["text"])
+
+
+def template_keys(tokens: list[TemplateToken]) -> list[str]:
+    """Variables assigned by a compiled template, in order."""
+    keys = (assignment_key(line) for line in split_lines(tokens))
+    return list(dict.fromkeys(key for key in keys if key is not None))
+
+
+def line_pattern(line_tokens: list[TemplateToken]) -> re.Pattern[str] | None:
+    """Match the lines a compiled template line can render to.
+
+    Literal text has to appear as is, and every placeholder matches any value.
+
+    Returns:
+        The pattern, or None if the line has no placeholders
+    """
+    if all(token["kind"] == "literal" for token in line_tokens):
+        return None
+    return re.compile(
+        "".join(
+            re.escape(token["text"]) if token["kind"] == "literal" else ".*?"
+            for token in line_tokens
+        )
+    )
+
+
+@dataclass
+class TargetUpdate:
+    """Plan for bringing one rendered file up to date with its template.
+
+    ``lines`` holds, in output order, either existing lines to keep verbatim or
+    compiled template lines that still have to be rendered.
+    """
+
+    template: Path
+    target: Path
+    state: TargetState
+    lines: list[str | list[TemplateToken]] = field(default_factory=list)
+    added: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+
+
+def plan_update(
+    template: Path,
+    target: Path,
+    tokens: list[TemplateToken],
+    template_digest: str,
+    existing: str | None,
+    previous: TargetState | None,
+) -> TargetUpdate:
+    """Work out how to update a rendered file after its template changed.
+
+    Keys the file already has keep their current value, so assigned ports and
+    answers survive. Keys new to the template are rendered, and keys the
+    template no longer produces are dropped. Keys added to the file by hand are
+    kept. Without a previous record, every key missing from the template is
+    treated as added by hand.
+
+    Other lines with placeholders, such as ``- "{{ auto_port() }}:80"`` in a YAML
+    target, are kept as well when the file still has a line the template line
+    renders to; such lines are matched in file order, each at most once.
+
+    Args:
+        template: The template path
+        target: The rendered file, relative to the worktree root
+        tokens: The compiled template
+        template_digest: Hash of the template content
+        existing: Current content of the rendered file, or None if it doesn't exist
+        previous: What the file was last rendered from, if recorded
+    """
+    existing_lines = existing.splitlines() if existing else []
+    current: dict[str, str] = {}
+    for line in existing_lines:
+        key = line_key(line)
+        if key is not None:
+            current.setdefault(key, line)
+
+    # Lines without a key, searched from just after the last one kept
+    others = [line for line in existing_lines if line_key(line) is None]
+    position = 0
+
+    update = TargetUpdate(template, target, {"hash": template_digest, "keys": []})
+    for line_tokens in split_lines(tokens):
+        key = assignment_key(line_tokens)
+        pattern = line_pattern(line_tokens) if key is None else None
+        if pattern is not None:
+            match = next(
+                (
+                    index
+                    for index in range(position, len(others))
+                    if pattern.fullmatch(others[index])
+                ),
+                None,
+            )
+            if match is not None:
+                update.lines.append(others[match])
+                position = match + 1
+                continue
+        if key is not None and key not in update.state["keys"]:
+            update.state["keys"].append(key)
+            if key in current:
+                update.lines.append(current[key])
+                continue
+            update.added.append(key)
+        update.lines.append(line_tokens)
+
+    generated = set(update.state["keys"])
+    previous_keys = set(previous["keys"]) if previous is not None else set()
+    for key, line in current.items():
+        if key in generated:
+            continue
+        if key in previous_keys:
+            update.removed.append(key)
+        else:
+            update.lines.append(line)
+    return update
+
+
+class SyncState:
+    """On-disk record of the templates every worktree was rendered from."""
+
+    def __init__(self, path: Path, worktrees: dict[BranchName, WorktreeState] | None = None):
+        """Initialize a state backed by the given file."""
+        self.path = path
+        self.worktrees: dict[BranchName, WorktreeState] = dict(worktrees or {})
+
+    @classmethod
+    def open(cls, sprout_dir: Path) -> "SyncState":
+        """Load the state for a .sprout directory; a missing or unreadable file is empty."""
+        path = sprout_dir / SYNC_STATE_FILENAME
+        try:
+            data = json.loads(path.read_text())
+            if data.get("version") != SYNC_STATE_VERSION:
+                raise ValueError(f"unsupported sync state version: {data.get('version')}")
+            return cls(path, dict(data["worktrees"]))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return cls(path)
+
+    def get(self, owner: BranchName) -> WorktreeState | None:
+        """Return what a worktree was rendered from, if recorded."""
+        return self.worktrees.get(owner)
+
+    def record(self, owner: BranchName, state: WorktreeState) -> None:
+        """Remember what a worktree was rendered from."""
+        self.worktrees[owner] = state
+
+    def forget(self, owner: BranchName) -> None:
+        """Drop a removed worktree."""
+        self.worktrees.pop(owner, None)
+
+    def save(self) -> None:
+        """Write the state atomically."""
+        data = {"version": SYNC_STATE_VERSION, "worktrees": self.worktrees}
+        atomic_write_json(self.path, data, sort_keys=True)
@@ -0,0 +1,291 @@
+"""Compilation and caching of .env.example templates."""
+
+import hashlib
+import json
+from collections.abc import Sequence
+from pathlib import Path, PurePath, PurePosixPath
+
+from sprout.exceptions import SproutError
+from sprout.files import atomic_write_json
+from sprout.ports import extract_ports
+from sprout.types import PortSet, TemplateToken
+
+# Compiled templates are cached next to the worktrees
+CACHE_DIRNAME = ".cache"
+TEMPLATE_CACHE_VERSION = 2
+
+# Tracked .env.example templates found by the last discovery, with the git index
+# state they were listed from
+TEMPLATE_LIST_FILENAME = ".templates.json"
+TEMPLATE_LIST_VERSION = 1
+
+
+def _literal(text: str) -> TemplateToken:
+    return {"kind": "literal", "text": text, "default": None}
+
+
+def _split_default(rest: str) -> tuple[bool, str | None]:
+    """Parse what follows a placeholder's name: nothing or ``| default``."""
+    rest = rest.strip()
+    if not rest:
+        return True, None
+    if rest.startswith("|"):
+        return True, rest[1:].strip()
+    return False, None
+
+
+def _parse_placeholder(raw: str, body: str) -> TemplateToken | None:
+    """Classify the text between ``{{`` and ``}}``; None if it isn't a placeholder."""
+    body = body.strip()
+    for function in ("auto_port", "branch"):
+        if body.startswith(f"{function}("):
+            close = body.find(")")
+            args = body[len(function) + 1 : close]
+            valid, default = _split_default(body[close + 1 :])
+            if close < 0 or not valid or "(" in args or (function == "branch" and args):
+                return None
+            if function == "branch":
+                return {"kind": "branch", "text": raw, "default": default}
+            return {"kind": "auto_port", "text": args.strip(), "default": default}
+
+    name, pipe, default = body.partition("|")
+    name = name.strip()
+    # Only variables that don't look like function calls (no parentheses)
+    if not name or "(" in name or ")" in name:
+        return None
+    return {"kind": "variable", "text": name, "default": default.strip() if pipe else None}
+
+
+def compile_template(content: str) -> list[TemplateToken]:
+    """Compile template content into a list of literal and placeholder tokens.
+
+    The content is tokenized in a single left-to-right pass that looks at every
+    character a bounded number of times, so compilation is linear in the size of
+    the template even for malformed input such as a long run of unclosed ``{{``.
+    Placeholder output is never rescanned.
+
+    Lines are joined with a newline, so a trailing newline is not preserved.
+    ``${...}`` references and anything else that isn't a placeholder stay literal.
+    """
+    content = "\n".join(content.splitlines())
+    tokens: list[TemplateToken] = []
+    literal_start = 0
+    position = 0
+    while True:
+        close = content.find("}}", position)
+        if close < 0:
+            break
+        # The innermost opening before the closing braces; placeholders never
+        # contain braces or span lines
+        start = content.rfind("{{", position, close)
+        if start < 0:
+            position = close + 1
+            continue
+        body = content[start + 2 : close]
+        token = None
+        if "}" not in body and "\n" not in body:
+            token = _parse_placeholder(content[start : close + 2], body)
+        if token is not None:
+            if start > literal_start:
+                tokens.append(_literal(content[literal_start:start]))
+            tokens.append(token)
+            literal_start = close + 2
+        position = close + 2
+
+    if literal_start < len(content):
+        tokens.append(_literal(content[literal_start:]))
+    return tokens
+
+
+def split_lines(tokens: list[TemplateToken]) -> list[list[TemplateToken]]:
+    """Split compiled template tokens into one token list per line."""
+    lines: list[list[TemplateToken]] = [[]]
+    for token in tokens:
+        if token["kind"] != "literal":
+            lines[-1].append(token)
+            continue
+        for index, part in enumerate(token["text"].split("\n")):
+            if index:
+                lines.append([])
+            if part:
+                lines[-1].append(_literal(part))
+    return lines
+
+
+def variable_names(tokens: list[TemplateToken]) -> list[str]:
+    """Names of all variables used by a template, in order of first use."""
+    return list(dict.fromkeys(token["text"] for token in tokens if token["kind"] == "variable"))
+
+
+def unresolved_variables(tokens: list[TemplateToken]) -> list[str]:
+    """Variables without a default whose value must come from the environment or the user."""
+    names: list[str] = []
+    for token in tokens:
+        if token["kind"] == "variable" and token["default"] is None and token["text"] not in names:
+            names.append(token["text"])
+    return names
+
+
+def fixed_ports(tokens: list[TemplateToken]) -> PortSet:
+    """Ports written literally in a template (e.g. ``DB_PORT=5432``)."""
+    ports: PortSet = set()
+    for token in tokens:
+        if token["kind"] == "literal":
+            ports.update(extract_ports(token["text"]))
+    return ports
+
+
+def template_targets(
+    git_root: Path, env_examples: Sequence[Path], targets: Sequence[tuple[str, str]] = ()
+) -> list[tuple[Path, Path]]:
+    """Pair every template with the file it renders to.
+
+    Each .env.example renders to a ``.env`` in the same directory; configured
+    targets map a source file in the repository to any path in the worktree.
+
+    Args:
+        git_root: Repository root
+        env_examples: Paths to the .env.example template files
+        targets: Configured (source, target) pairs (see TemplateConfig)
+
+    Returns:
+        List of (template path, output path relative to the worktree root)
+
+    Raises:
+        SproutError: If a configured source doesn't exist
+    """
+    pairs = [(path, path.parent.relative_to(git_root) / ".env") for path in env_examples]
+    for source, target in targets:
+        source_path = git_root / source
+        if not source_path.is_file():
+            raise SproutError(f"Template source not found: {source}")
+        pairs.append((source_path, Path(target)))
+    return pairs
+
+
+def parse_cones(value: str) -> list[str]:
+    """Parse a comma-separated list of sparse checkout directories.
+
+    Raises:
+        SproutError: If no directory is given or one points outside the repository
+    """
+    cones: list[str] = []
+    for item in value.split(","):
+        cone = item.strip().strip("/")
+        if not cone:
+            continue
+        if PurePosixPath(cone).is_absolute() or ".." in PurePosixPath(cone).parts:
+            raise SproutError(f"Directory '{item.strip()}' must be relative to the repository root")
+        cones.append(cone)
+    if not cones:
+        raise SproutError("No directories given for the sparse checkout")
+    return list(dict.fromkeys(cones))
+
+
+def in_cones(path: PurePath, cones: Sequence[str]) -> bool:
+    """Whether a file is checked out by a cone-mode sparse checkout of ``cones``.
+
+    Cone mode includes every file below a selected directory, plus the files
+    directly inside the repository root and inside each parent of a selected
+    directory.
+
+    Args:
+        path: File path relative to the repository (or worktree) root
+        cones: Selected directories, relative to the root
+    """
+    directory = PurePosixPath(path.as_posix()).parent.parts
+    for cone in cones:
+        parts = PurePosixPath(cone).parts
+        if directory[: len(parts)] == parts or parts[: len(directory)] == directory:
+            return True
+    return not directory
+
+
+def load_template(template_path: Path, cache_dir: Path | None = None) -> list[TemplateToken]:
+    """Read and compile a template, reusing the cached compilation when possible.
+
+    Cache entries are keyed by the template's path and invalidated when its
+    modification time or size changes.
+
+    Args:
+        template_path: Path to the .env.example template file
+        cache_dir: Directory holding compiled templates, or None to skip caching
+
+    Returns:
+        The compiled template tokens
+    """
+    try:
+        stat = template_path.stat()
+    except FileNotFoundError as e:
+        raise SproutError(f".env.example file not found at {template_path}") from e
+    except OSError as e:
+        raise SproutError(f"Failed to read .env.example: {e}") from e
+
+    cache_path = None
+    if cache_dir is not None:
+        key = hashlib.sha256(str(template_path.resolve()).encode()).hexdigest()[:32]
+        cache_path = cache_dir / f"{key}.json"
+        try:
+            data = json.loads(cache_path.read_text())
+            if (
+                data["version"] == TEMPLATE_CACHE_VERSION
+                and data["mtime_ns"] == stat.st_mtime_ns
+                and data["size"] == stat.st_size
+            ):
+                return list(data["tokens"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    try:
+        content = template_path.read_text()
+    except OSError as e:
+        raise SproutError(f"Failed to read .env.example: {e}") from e
+    tokens = compile_template(content)
+
+    if cache_path is not None:
+        data = {
+            "version": TEMPLATE_CACHE_VERSION,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "tokens": tokens,
+        }
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_json(cache_path, data, indent=None)
+        except OSError:
+            # The cache is an optimization only; a read-only .sprout/ still works
+            pass
+    return tokens
+
+
+def load_template_list(path: Path, key: Sequence[int | str]) -> list[str] | None:
+    """Read the cached template list if it was discovered from the same index state.
+
+    Args:
+        path: The template list cache file
+        key: Fingerprint of the git index and HEAD (see ``sprout.git.index_state``)
+
+    Returns:
+        Template paths relative to the repository root, or None on a cache miss
+    """
+    try:
+        data = json.loads(path.read_text())
+        if data["version"] == TEMPLATE_LIST_VERSION and data["key"] == list(key):
+            return [str(template) for template in data["templates"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def save_template_list(path: Path, key: Sequence[int | str], templates: Sequence[str]) -> None:
+    """Cache a discovered template list for the given index state.
+
+    Nothing is written until the .sprout directory exists, so looking up templates
+    never creates it.
+    """
+    data = {"version": TEMPLATE_LIST_VERSION, "key": list(key), "templates": list(templates)}
+    try:
+        atomic_write_json(path, data, indent=None)
+    except OSError:
+        # Like the compiled templates, the list is an optimization only
+        pass
@@ -2,12 +2,14 @@
 
 from datetime import datetime
 from pathlib import Path
-from typing import TypeAlias, TypedDict
+from typing import NotRequired, TypeAlias, TypedDict
 
 # Type aliases
 BranchName: TypeAlias = str
 WorktreePath: TypeAlias = Path
 EnvContent: TypeAlias = str
+PortNumber: TypeAlias = int
+PortSet: TypeAlias = set[PortNumber]
 
 
 class WorktreeInfo(TypedDict, total=False):
@@ -26,3 +28,53 @@ class GitWorktreeOutput(TypedDict):
     path: Path
     branch: str | None
     head: str | None
+
+
+class PortLease(TypedDict):
+    """Temporary cross-process reservation of a port."""
+
+    owner: str
+    pid: int
+    expires: float
+
+
+class TemplateToken(TypedDict):
+    """Piece of a compiled .env.example template.
+
+    ``kind`` is ``literal`` (``text`` is copied as-is), ``auto_port`` (``text``
+    holds the call arguments), ``branch`` (``text`` is the original placeholder,
+    kept when there is neither a branch name nor a default) or ``variable``
+    (``text`` is the variable name).
+    """
+
+    kind: str
+    text: str
+    default: str | None
+
+
+class TargetState(TypedDict):
+    """What a rendered file was generated from, as recorded for sync."""
+
+    # sha256 of the template content
+    hash: str
+    # Variables the template assigned (KEY=...), in template order
+    keys: list[str]
+
+
+class WorktreeState(TypedDict):
+    """Inputs of the files rendered into one worktree, as recorded for sync."""
+
+    # Keyed by the rendered file's path relative to the worktree root
+    targets: dict[str, TargetState]
+    named_ports: dict[str, PortNumber]
+    # Directories of a sparse checkout (``sprout create --only``); absent for full checkouts
+    cones: NotRequired[list[str]]
+
+
+class PoolSlot(TypedDict):
+    """A pre-populated worktree waiting in the pool to be claimed by a create."""
+
+    # Directory name under .sprout/.pool/
+    name: str
+    # Commit the worktree was checked out at
+    head: str
@@ -1,71 +1,59 @@
 """Common utilities for sprout."""
 
 import os
-import random
-import re
-import socket
+import shutil
 import subprocess
 from datetime import datetime
 from pathlib import Path
-from typing import TypeAlias
 
 import typer
 from rich.console import Console
 
+from sprout.config import load_config
 from sprout.exceptions import SproutError
-from sprout.types import BranchName, WorktreeInfo
-
-# Type aliases
-PortNumber: TypeAlias = int
-PortSet: TypeAlias = set[PortNumber]
+from sprout.git import get_git_context, index_state, read_worktrees, refs_exist, run_subprocess
+from sprout.ports import PortLedger, PortSession, is_port_available, parse_auto_port_args
+from sprout.templates import (
+    TEMPLATE_LIST_FILENAME,
+    load_template,
+    load_template_list,
+    save_template_list,
+    unresolved_variables,
+)
+from sprout.types import BranchName, PortNumber, PortSet, TemplateToken, WorktreeInfo
 
 console = Console()
 
+# Directory at the repository root holding the worktrees and sprout's bookkeeping.
+# Bookkeeping files and directories in it start with a dot: git forbids ref
+# components starting with a dot, so they can never collide with a worktree.
+SPROUT_DIRNAME = ".sprout"
+
 
 def is_git_repository() -> bool:
     """Check if current directory is inside a git repository."""
-    try:
-        result = subprocess.run(
-            ["git", "rev-parse", "--git-dir"],
-            capture_output=True,
-            text=True,
-            check=False,
-        )
-        return result.returncode == 0
-    except (subprocess.SubprocessError, FileNotFoundError):
-        return False
+    return get_git_context() is not None
 
 
 def get_git_root() -> Path:
     """Get the root directory of the git repository."""
-    if not is_git_repository():
+    context = get_git_context()
+    if context is None:
         raise SproutError("Not in a git repository")
-
-    result = subprocess.run(
-        ["git", "rev-parse", "--show-toplevel"],
-        capture_output=True,
-        text=True,
-        check=True,
-    )
-    return Path(result.stdout.strip())
+    return context.root
 
 
 def run_command(cmd: list[str], check: bool = True) -> subprocess.CompletedProcess[str]:
     """Run a command and return the result."""
     try:
-        return subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=check,
-        )
+        return run_subprocess(cmd, check=check)
     except subprocess.CalledProcessError as e:
         raise SproutError(f"Command failed: {' '.join(cmd)}\n{e.stderr}") from e
 
 
 def get_sprout_dir() -> Path:
     """Get the .sprout directory path."""
-    return get_git_root() / ".sprout"
+    return get_git_root() / SPROUT_DIRNAME
 
 
 def ensure_sprout_dir() -> Path:
@@ -75,54 +63,133 @@ def ensure_sprout_dir() -> Path:
     return sprout_dir
 
 
+def _discover_env_examples(git_root: Path) -> list[str]:
+    """List the tracked .env.example templates, reusing the list while the index is unchanged."""
+    context = get_git_context()
+    key = index_state(context) if context is not None else None
+    cache_path = git_root / SPROUT_DIRNAME / TEMPLATE_LIST_FILENAME
+    files = load_template_list(cache_path, key) if key is not None else None
+    if files is None:
+        result = run_command(
+            ["git", "-C", str(git_root), "ls-files", "*.env.example", "**/*.env.example"]
+        )
+        files = [path for path in result.stdout.splitlines() if path]
+        if key is not None:
+            save_template_list(cache_path, key, files)
+    return files
+
+
+def get_env_examples(git_root: Path | None = None) -> list[Path]:
+    """Get the .env.example templates of the repository.
+
+    The templates listed in ``[templates] files`` are used as-is. Otherwise the
+    templates tracked by git are listed once and cached in .sprout/ until the
+    index or HEAD changes, so unchanged trees skip the repository-wide scan.
+
+    Args:
+        git_root: Repository root; looked up if not given
+
+    Returns:
+        Absolute paths of the templates that exist in the main working tree
+    """
+    if git_root is None:
+        git_root = get_git_root()
+    configured = load_config(git_root).templates.files
+    files = list(configured) if configured is not None else _discover_env_examples(git_root)
+    paths = (git_root / path for path in files)
+    return [path for path in paths if path.exists()]
+
+
+def get_env_dirs() -> list[str] | None:
+    """Get the directories, relative to the repository root, that receive .env files.
+
+    Returns:
+        Parent directories of the tracked .env.example templates, or None if they
+        can't be listed
+    """
+    try:
+        git_root = get_git_root()
+        env_examples = get_env_examples()
+    except (SproutError, subprocess.CalledProcessError):
+        return None
+    return sorted({path.parent.relative_to(git_root).as_posix() for path in env_examples})
+
+
 def get_used_ports() -> PortSet:
-    """Get all ports currently used by sprout worktrees."""
-    used_ports: PortSet = set()
+    """Get all ports currently used by sprout worktrees.
+
+    Ports are read from the port ledger in .sprout/. The ledger is rebuilt from the
+    worktrees' .env files the first time it is needed.
+    """
     sprout_dir = get_sprout_dir()
 
     if not sprout_dir.exists():
-        return used_ports
+        return set()
 
-    # Scan all .env files recursively in .sprout/
-    for env_file in sprout_dir.rglob("*.env"):
-        if env_file.is_file():
-            try:
-                content = env_file.read_text()
-                # Find all port assignments (e.g., PORT=8080)
-                port_matches = re.findall(r"=(\d{4,5})\b", content)
-                for port_str in port_matches:
-                    port = int(port_str)
-                    if 1024 <= port <= 65535:
-                        used_ports.add(port)
-            except (OSError, ValueError):
-                continue
+    return PortLedger.open(sprout_dir, env_dirs=get_env_dirs()).ports()
 
-    return used_ports
 
+def find_available_port() -> PortNumber:
+    """Find an available port that's not used by sprout or system."""
+    return PortSession(get_used_ports, probe=is_port_available).allocate()
 
-def is_port_available(port: PortNumber) -> bool:
-    """Check if a port is available for binding."""
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-        try:
-            sock.bind(("127.0.0.1", port))
-            return True
-        except OSError:
-            return False
 
+def prompt_for_value(var_name: str, template_path: Path, silent: bool = False) -> str:
+    """Ask the user for the value of a template variable.
 
-def find_available_port() -> PortNumber:
-    """Find an available port that's not used by sprout or system."""
-    used_ports = get_used_ports()
-    max_attempts = 1000
+    Args:
+        var_name: Name of the variable
+        template_path: Template the variable was found in, shown as context
+        silent: If True, use stderr for the prompt to keep stdout clean
+    """
+    # Create a relative path for display
+    try:
+        display_path = template_path.relative_to(Path.cwd())
+    except ValueError:
+        display_path = template_path
+
+    # Prompt user for value with file context
+    if silent:
+        # Use stderr for prompts in silent mode to keep stdout clean
+        prompt = f"Enter a value for '{var_name}' (from {display_path}): "
+        typer.echo(prompt, err=True, nl=False)
+        return input()
+    prompt = f"Enter a value for '[cyan]{var_name}[/cyan]' (from [dim]{display_path}[/dim]): "
+    return console.input(prompt)
+
+
+def prompt_for_variables(
+    template_paths: list[Path],
+    silent: bool = False,
+    cache_dir: Path | None = None,
+    known: dict[str, str] | None = None,
+    only: set[str] | None = None,
+) -> dict[str, str]:
+    """Ask once for every variable the templates can't resolve on their own.
 
-    for _ in range(max_attempts):
-        # Random port between 1024 and 65535
-        port = random.randint(1024, 65535)
+    Variables without a default that are neither set in the environment nor
+    known already are deduplicated across all templates and prompted for in
+    order of first use, so rendering can run without further input.
 
-        if port not in used_ports and is_port_available(port):
-            return port
+    Args:
+        template_paths: Paths to the .env.example template files
+        silent: If True, use stderr for prompts to keep stdout clean
+        cache_dir: Directory for compiled templates (see parse_env_template)
+        known: Values already available (e.g. from a values file or remembered answers)
+        only: If given, only these variables are asked for
 
-    raise SproutError("Could not find an available port after 1000 attempts")
+    Returns:
+        Dict mapping each prompted variable name to the value entered
+    """
+    values: dict[str, str] = {}
+    for template_path in template_paths:
+        for var_name in unresolved_variables(load_template(template_path, cache_dir)):
+            if var_name in values or var_name in os.environ or (known and var_name in known):
+                continue
+            if only is not None and var_name not in only:
+                continue
+            values[var_name] = prompt_for_value(var_name, template_path, silent)
+    return values
 
 
 def parse_env_template(
@@ -130,6 +197,11 @@ def parse_env_template(
     silent: bool = False,
     used_ports: PortSet | None = None,
     branch_name: str | None = None,
+    session: PortSession | None = None,
+    cache_dir: Path | None = None,
+    values: dict[str, str] | None = None,
+    answers: dict[str, str] | None = None,
+    tokens: list[TemplateToken] | None = None,
 ) -> str:
     """Parse .env.example template and process placeholders.
 
@@ -138,100 +210,87 @@ def parse_env_template(
         silent: If True, use stderr for prompts to keep stdout clean
         used_ports: Set of ports already in use (in addition to system-wide used ports)
         branch_name: Branch name to use for {{ branch() }} placeholders
+        session: Port allocation session shared across templates. When given, ports
+            are allocated from it instead of rescanning .sprout/ for every placeholder,
+            and named ports (auto_port("api")) resolve to the same port in every template.
+        cache_dir: Directory for compiled templates (.sprout/.cache/), so unchanged
+            templates are not parsed again
+        values: Values from a values file or provider; like the environment they
+            take precedence over template defaults
+        answers: Answers for variables without a default (see prompt_for_variables);
+            missing ones are prompted for
+        tokens: Compiled tokens to render instead of the whole template, e.g. single
+            lines during sync; template_path is then only used for prompts
     """
-    if not template_path.exists():
-        raise SproutError(f".env.example file not found at {template_path}")
+    if tokens is None:
+        tokens = load_template(template_path, cache_dir)
 
-    try:
-        content = template_path.read_text()
-    except OSError as e:
-        raise SproutError(f"Failed to read .env.example: {e}") from e
-
-    lines: list[str] = []
     # Track used ports within this file to avoid duplicates
     file_ports: PortSet = set()
     # Include any additional used ports passed in
     if used_ports:
         file_ports.update(used_ports)
 
-    for line in content.splitlines():
-        # Process {{ auto_port() | default }} placeholders
-        def replace_auto_port(match: re.Match[str]) -> str:
-            # Extract default value if present (group 1)
-            default_value = match.group(1)
-            if default_value is not None:
-                default_value = default_value.strip()
-
-            # Generate available port
+    # Process {{ auto_port() | default }} placeholders, optionally with a name
+    # and/or a range: {{ auto_port("api", 8000-8999) }}
+    def render_auto_port(args: str) -> str:
+        nonlocal session
+        name, port_range = parse_auto_port_args(args)
+
+        # Generate available port
+        if session is None and (name is not None or port_range is not None):
+            # Named and ranged lookups need a session; use it for the rest of the file
+            session = PortSession(lambda: get_used_ports() | file_ports)
+        if session is not None:
+            return str(session.allocate(port_range, name=name))
+        port = find_available_port()
+        while port in file_ports:
             port = find_available_port()
-            while port in file_ports:
-                port = find_available_port()
-            file_ports.add(port)
-            return str(port)
-
-        line = re.sub(r"{{\s*auto_port\(\)(?:\s*\|\s*([^}]*))?\s*}}", replace_auto_port, line)
-
-        # Process {{ branch() | default }} placeholders
-        def replace_branch(match: re.Match[str]) -> str:
-            # Extract default value if present (group 1)
-            default_value = match.group(1)
-            if default_value is not None:
-                default_value = default_value.strip()
+        file_ports.add(port)
+        return str(port)
+
+    # Process {{ VARIABLE | default }} placeholders
+    def render_variable(var_name: str, default_value: str | None) -> str:
+        # Check environment variable first
+        value = os.environ.get(var_name)
+        if value is not None:
+            return value
 
-            # Use branch_name if provided, otherwise use default
+        # Then values supplied by a values file or provider
+        if values is not None and var_name in values:
+            return values[var_name]
+
+        # If default value is provided, use it
+        if default_value is not None:
+            return default_value
+
+        # Answers collected before rendering started
+        if answers is not None and var_name in answers:
+            return answers[var_name]
+
+        # No default value - prompt user for value
+        return prompt_for_value(var_name, template_path, silent)
+
+    parts: list[str] = []
+    for token in tokens:
+        kind = token["kind"]
+        if kind == "auto_port":
+            parts.append(render_auto_port(token["text"]))
+        elif kind == "branch":
+            # Use branch_name if provided, otherwise use default; with neither the
+            # placeholder is kept unchanged
             if branch_name:
-                return branch_name
-            elif default_value is not None:
-                return default_value
+                parts.append(branch_name)
+            elif token["default"] is not None:
+                parts.append(token["default"])
             else:
-                # No branch name and no default - keep placeholder unchanged
-                return match.group(0)
-
-        line = re.sub(r"{{\s*branch\(\)(?:\s*\|\s*([^}]*))?\s*}}", replace_branch, line)
-
-        # Process {{ VARIABLE | default }} placeholders
-        def replace_variable(match: re.Match[str]) -> str:
-            var_name = match.group(1).strip()
-            # Extract default value if present (group 2)
-            default_value = match.group(2)
-            if default_value is not None:
-                default_value = default_value.strip()
-
-            # Check environment variable first
-            value = os.environ.get(var_name)
-            if value is None:
-                # If default value is provided, use it
-                if default_value is not None:
-                    return default_value
-
-                # No default value - prompt user for value
-                # Create a relative path for display
-                try:
-                    display_path = template_path.relative_to(Path.cwd())
-                except ValueError:
-                    display_path = template_path
-
-                # Prompt user for value with file context
-                if silent:
-                    # Use stderr for prompts in silent mode to keep stdout clean
-                    prompt = f"Enter a value for '{var_name}' (from {display_path}): "
-                    typer.echo(prompt, err=True, nl=False)
-                    value = input()
-                else:
-                    prompt = (
-                        f"Enter a value for '[cyan]{var_name}[/cyan]' "
-                        f"(from [dim]{display_path}[/dim]): "
-                    )
-                    value = console.input(prompt)
-            return value
-
-        # Only match variables that don't look like function calls (no parentheses)
-        # Now also captures optional | default_value
-        line = re.sub(r"{{\s*([^}()]+?)(?:\s*\|\s*([^}]*))?\s*}}", replace_variable, line)
+                parts.append(token["text"])
+        elif kind == "variable":
+            parts.append(render_variable(token["text"], token["default"]))
+        else:
+            parts.append(token["text"])
 
-        lines.append(line)
-
-    return "\n".join(lines)
+    return "".join(parts)
 
 
 def worktree_exists(branch_name: BranchName) -> bool:
@@ -242,29 +301,29 @@ def worktree_exists(branch_name: BranchName) -> bool:
 
 def branch_exists(branch_name: BranchName) -> bool:
     """Check if a git branch exists."""
-    result = run_command(["git", "rev-parse", "--verify", f"refs/heads/{branch_name}"], check=False)
-    return result.returncode == 0
+    ref = f"refs/heads/{branch_name}"
+    return refs_exist([ref])[ref]
 
 
-def get_indexed_worktrees() -> list[WorktreeInfo]:
-    """Get a list of sprout-managed worktrees with consistent ordering.
+def force_remove_worktree(worktree_path: Path) -> None:
+    """Remove a worktree and any files written to it, such as one whose creation failed.
 
-    Returns:
-        List of WorktreeInfo dicts, sorted by branch name for consistent indexing.
+    ``--force`` removes the worktree even though it contains generated .env files or
+    a partial checkout. If git can't remove it, the directory is deleted and git's
+    record of it pruned.
     """
-    if not is_git_repository():
-        raise SproutError("Not in a git repository")
-
-    sprout_dir = get_sprout_dir()
+    result = run_command(["git", "worktree", "remove", "--force", str(worktree_path)], check=False)
+    if result.returncode != 0 and worktree_path.exists():
+        shutil.rmtree(worktree_path, ignore_errors=True)
+        run_command(["git", "worktree", "prune"], check=False)
 
-    # Get worktree list from git
-    result = run_command(["git", "worktree", "list", "--porcelain"])
 
-    # Parse worktree output
+def _parse_worktree_list(output: str) -> list[WorktreeInfo]:
+    """Parse the output of ``git worktree list --porcelain``."""
     worktrees: list[WorktreeInfo] = []
     current_worktree: WorktreeInfo = {}
 
-    for line in result.stdout.strip().split("\n"):
+    for line in output.strip().split("\n"):
         if not line:
             if current_worktree:
                 worktrees.append(current_worktree)
@@ -285,22 +344,44 @@ def get_indexed_worktrees() -> list[WorktreeInfo]:
 
     if current_worktree:
         worktrees.append(current_worktree)
+    return worktrees
+
+
+def get_indexed_worktrees() -> list[WorktreeInfo]:
+    """Get a list of sprout-managed worktrees with consistent ordering.
+
+    Returns:
+        List of WorktreeInfo dicts, sorted by branch name for consistent indexing.
+    """
+    if not is_git_repository():
+        raise SproutError("Not in a git repository")
+
+    sprout_dir = get_sprout_dir()
+
+    # Read the worktrees from .git/worktrees/ directly; ask git only if that fails.
+    # Paths read from git's own files are already canonical
+    context = get_git_context()
+    worktrees = read_worktrees(context) if context is not None else None
+    canonical = worktrees is not None
+    if worktrees is None:
+        worktrees = _parse_worktree_list(
+            run_command(["git", "worktree", "list", "--porcelain"]).stdout
+        )
 
     # Filter for sprout-managed worktrees
     sprout_worktrees: list[WorktreeInfo] = []
     current_path = Path.cwd().resolve()
 
     for wt in worktrees:
-        wt_path = wt["path"].resolve()
+        wt_path = wt["path"] if canonical else wt["path"].resolve()
         if wt_path.parent == sprout_dir:
             # Check if we're currently in this worktree
             wt["is_current"] = current_path == wt_path or current_path.is_relative_to(wt_path)
 
             # Get last modified time
-            if wt_path.exists():
-                stat = wt_path.stat()
-                wt["modified"] = datetime.fromtimestamp(stat.st_mtime)
-            else:
+            try:
+                wt["modified"] = datetime.fromtimestamp(wt_path.stat().st_mtime)
+            except OSError:
                 wt["modified"] = None
 
             sprout_worktrees.append(wt)
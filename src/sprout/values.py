@@ -0,0 +1,145 @@
+"""Sources of template variable values other than the environment and prompts."""
+
+import json
+import tomllib
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any, Protocol
+
+from sprout.config import ValueProviderConfig
+from sprout.exceptions import SproutError
+from sprout.files import atomic_write_json
+
+# Answers typed at prompts, remembered for later worktrees of the same repository
+ANSWERS_FILENAME = ".answers.json"
+
+
+class ValueProvider(Protocol):
+    """Source of values for template variables, such as a secret store."""
+
+    def fetch(self, names: Sequence[str]) -> dict[str, str]:
+        """Return the values of as many of the requested variables as are known.
+
+        Called once per create with every variable the templates use, so
+        providers backed by a remote service can fetch them in a single request.
+        """
+        ...
+
+
+def _parse_dotenv(content: str) -> dict[str, str]:
+    """Parse KEY=VALUE lines, ignoring blank lines, comments and ``export``."""
+    values: dict[str, str] = {}
+    for line in content.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, _, value = line.partition("=")
+        key = key.strip().removeprefix("export ").strip()
+        value = value.strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+            value = value[1:-1]
+        values[key] = value
+    return values
+
+
+def _stringify(data: Any, path: Path) -> dict[str, str]:
+    """Turn a parsed TOML/JSON table of scalars into string values."""
+    if not isinstance(data, dict):
+        raise SproutError(f"Values file {path} must contain a table of variables")
+    values: dict[str, str] = {}
+    for key, value in data.items():
+        if isinstance(value, bool):
+            values[key] = "true" if value else "false"
+        elif isinstance(value, str | int | float):
+            values[key] = str(value)
+        else:
+            raise SproutError(f"Value of '{key}' in {path} must be a string, number or boolean")
+    return values
+
+
+def load_values_file(path: Path) -> dict[str, str]:
+    """Read variable values from a dotenv, TOML or JSON file.
+
+    The format is chosen by the file extension (``.toml``, ``.json``); anything
+    else is read as dotenv.
+
+    Raises:
+        SproutError: If the file can't be read or parsed
+    """
+    try:
+        content = path.read_text()
+    except OSError as e:
+        raise SproutError(f"Failed to read values file {path}: {e}") from e
+
+    try:
+        if path.suffix == ".toml":
+            return _stringify(tomllib.loads(content), path)
+        if path.suffix == ".json":
+            return _stringify(json.loads(content), path)
+    except (tomllib.TOMLDecodeError, ValueError) as e:
+        raise SproutError(f"Failed to parse values file {path}: {e}") from e
+    return _parse_dotenv(content)
+
+
+class FileValueProvider:
+    """Value provider backed by a local dotenv, TOML or JSON file."""
+
+    def __init__(self, path: Path) -> None:
+        """Initialize a provider reading the given file."""
+        self.path = path
+
+    def fetch(self, names: Sequence[str]) -> dict[str, str]:
+        """Return the requested variables found in the file."""
+        values = load_values_file(self.path)
+        return {name: values[name] for name in names if name in values}
+
+
+def build_providers(configs: Sequence[ValueProviderConfig], git_root: Path) -> list[ValueProvider]:
+    """Create the value providers configured in .sprout.toml.
+
+    Relative paths are resolved against the repository root.
+    """
+    providers: list[ValueProvider] = []
+    for config in configs:
+        if config.type == "file":
+            path = Path(config.path).expanduser()
+            providers.append(FileValueProvider(path if path.is_absolute() else git_root / path))
+    return providers
+
+
+def fetch_values(names: Sequence[str], providers: Sequence[ValueProvider]) -> dict[str, str]:
+    """Look up variables in each provider in turn, with one batch request per provider.
+
+    Earlier providers take precedence; later ones are only asked for what is
+    still missing.
+    """
+    values: dict[str, str] = {}
+    for provider in providers:
+        missing = [name for name in names if name not in values]
+        if not missing:
+            break
+        for name, value in provider.fetch(missing).items():
+            if name in missing:
+                values[name] = value
+    return values
+
+
+class AnswersStore:
+    """Answers typed at prompts, remembered per repository in .sprout/.answers.json."""
+
+    def __init__(self, sprout_dir: Path) -> None:
+        """Initialize a store for a .sprout directory."""
+        self.path = sprout_dir / ANSWERS_FILENAME
+
+    def load(self) -> dict[str, str]:
+        """Return the remembered answers; an unreadable store counts as empty."""
+        try:
+            data = json.loads(self.path.read_text())
+            return {str(name): str(value) for name, value in data["answers"].items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return {}
+
+    def update(self, answers: dict[str, str]) -> None:
+        """Remember new answers, atomically and readable only by the current user."""
+        data = {"answers": self.load() | answers}
+        atomic_write_json(self.path, data, sort_keys=True, mode=0o600)
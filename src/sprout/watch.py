@@ -0,0 +1,224 @@
+"""Watching template files for changes."""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Iterable
+from pathlib import Path
+from types import TracebackType
+from typing import Self
+
+# Seconds to wait for further changes before reporting a batch: editors often
+# write a file several times (or write a temporary file and rename it) per save
+DEFAULT_DEBOUNCE = 0.3
+
+# Seconds between checks when the operating system can't notify us of changes
+DEFAULT_POLL_INTERVAL = 0.5
+
+# inotify(7) event masks. Directories are watched rather than the templates
+# themselves so files replaced by rename keep being watched
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ONLYDIR = 0x01000000
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+
+# struct inotify_event: wd, mask, cookie, len, followed by a NUL-padded name
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class Watcher(ABC):
+    """Base class reporting which of a set of files changed."""
+
+    mechanism = "none"
+
+    def __init__(self, paths: Iterable[Path]) -> None:
+        """Initialize a watcher for the given files."""
+        self.paths = set(paths)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:  # noqa: B027 - optional hook, most watchers hold nothing
+        """Release the resources held by the watcher."""
+
+    @abstractmethod
+    def poll(self, timeout: float | None) -> set[Path]:
+        """Wait up to ``timeout`` seconds (forever if None) for watched files to change.
+
+        Returns:
+            The files that changed, or an empty set if the timeout expired
+        """
+
+    def wait_for_changes(
+        self, debounce: float = DEFAULT_DEBOUNCE, timeout: float | None = None
+    ) -> set[Path]:
+        """Wait for a change, then collect more until none arrive for ``debounce`` seconds.
+
+        Args:
+            debounce: Quiet period that ends a batch of changes
+            timeout: Seconds to wait for the first change (forever if None)
+
+        Returns:
+            The files that changed, or an empty set if the timeout expired
+        """
+        changed = self.poll(timeout)
+        while changed:
+            more = self.poll(debounce)
+            if not more:
+                break
+            changed |= more
+        return changed
+
+
+class PollingWatcher(Watcher):
+    """Watcher comparing modification times and sizes at a fixed interval."""
+
+    mechanism = "polling"
+
+    def __init__(self, paths: Iterable[Path], interval: float = DEFAULT_POLL_INTERVAL) -> None:
+        """Initialize a watcher checking the files every ``interval`` seconds."""
+        super().__init__(paths)
+        self.interval = interval
+        self._signatures = {path: self._signature(path) for path in self.paths}
+
+    @staticmethod
+    def _signature(path: Path) -> tuple[int, int] | None:
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _check(self) -> set[Path]:
+        changed: set[Path] = set()
+        for path in self.paths:
+            signature = self._signature(path)
+            if signature != self._signatures[path]:
+                self._signatures[path] = signature
+                changed.add(path)
+        return changed
+
+    def poll(self, timeout: float | None) -> set[Path]:
+        """Check the files until one changes or the timeout expires."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self._check()
+            if changed:
+                return changed
+            if deadline is None:
+                time.sleep(self.interval)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return set()
+            time.sleep(min(self.interval, remaining))
+
+
+class InotifyWatcher(Watcher):
+    """Watcher notified by the Linux kernel through inotify(7)."""
+
+    mechanism = "inotify"
+
+    def __init__(self, paths: Iterable[Path]) -> None:
+        """Initialize a watcher on the directories containing the files.
+
+        Raises:
+            OSError: If inotify is unavailable or a directory can't be watched
+        """
+        super().__init__(paths)
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self._libc = libc
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        # Watch descriptor -> directory, and directory -> names of watched files in it
+        self._directories: dict[int, Path] = {}
+        self._names: dict[Path, set[str]] = {}
+        for path in self.paths:
+            self._names.setdefault(path.parent, set()).add(path.name)
+        try:
+            for directory in self._names:
+                wd = libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+                if wd < 0:
+                    errno = ctypes.get_errno()
+                    raise OSError(errno, os.strerror(errno), str(directory))
+                self._directories[wd] = directory
+        except OSError:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        """Close the inotify file descriptor."""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _read_events(self) -> set[Path]:
+        changed: set[Path] = set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, _mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            directory = self._directories.get(wd)
+            if directory is not None and name in self._names[directory]:
+                changed.add(directory / name)
+        return changed
+
+    def poll(self, timeout: float | None) -> set[Path]:
+        """Wait for events on the watched files until the timeout expires."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            readable, _, _ = select.select([self._fd], [], [], remaining)
+            if readable:
+                # Events for other files in the same directories are skipped
+                changed = self._read_events()
+                if changed:
+                    return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+
+
+def create_watcher(paths: Iterable[Path], interval: float = DEFAULT_POLL_INTERVAL) -> Watcher:
+    """Create the most efficient watcher available for the files.
+
+    Uses inotify on Linux and falls back to polling elsewhere, or when inotify
+    can't be used (for example because the watch limit is reached).
+
+    Args:
+        paths: Files to watch; they don't need to exist yet
+        interval: Seconds between checks if polling is used
+    """
+    paths = list(paths)
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(paths)
+        except OSError:
+            pass
+    return PollingWatcher(paths, interval=interval)
@@ -0,0 +1,58 @@
+"""Shared test fixtures."""
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from sprout.git import reset_git_context
+
+
+@pytest.fixture(autouse=True)
+def _fresh_git_context():
+    """Discover the repository afresh in every test, as a new sprout process would."""
+    reset_git_context()
+    yield
+    reset_git_context()
+
+
+def _git(*args, cwd):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True)
+
+
+@pytest.fixture
+def git():
+    """Run a git command in a directory, raising if it fails."""
+    return _git
+
+
+@pytest.fixture
+def make_repo(tmp_path):
+    """Factory creating a repository at ``tmp_path / "repo"`` with a .sprout directory.
+
+    The factory takes the files to track, by path relative to the root (a README.md
+    by default), and whether to commit them; uncommitted files are only staged.
+    """
+
+    def make(files: dict[str, str] | None = None, commit: bool = True) -> Path:
+        root = tmp_path / "repo"
+        root.mkdir()
+        _git("init", cwd=root)
+        _git("config", "user.email", "test@example.com", cwd=root)
+        _git("config", "user.name", "Test User", cwd=root)
+        for name, content in (files or {"README.md": "# Test\n"}).items():
+            (root / name).parent.mkdir(parents=True, exist_ok=True)
+            (root / name).write_text(content)
+        _git("add", ".", cwd=root)
+        if commit:
+            _git("commit", "-m", "Initial commit", cwd=root)
+        (root / ".sprout").mkdir()
+        return root.resolve()
+
+    return make
+
+
+@pytest.fixture
+def worktree_list_fallback(mocker):
+    """Make sprout list worktrees with `git worktree list` instead of reading .git/worktrees/."""
+    mocker.patch("sprout.utils.read_worktrees", return_value=None)
@@ -6,6 +6,7 @@ from unittest.mock import Mock
 from typer.testing import CliRunner
 
 from sprout.cli import app
+from sprout.exceptions import SproutError
 
 runner = CliRunner()
 
@@ -38,18 +39,8 @@ class TestCreateCommand:
 
         # Mock command execution
         mock_run = mocker.patch("sprout.commands.create.run_command")
-        # Mock git ls-files to return .env.example
-        mock_run.side_effect = lambda cmd, **kwargs: (
-            Mock(stdout=".env.example\n", returncode=0)
-            if cmd[1] == "ls-files"
-            else Mock(returncode=0)
-        )
-        # Mock git ls-files to return .env.example
-        mock_run.side_effect = lambda cmd, **kwargs: (
-            Mock(stdout=".env.example\n", returncode=0)
-            if cmd[1] == "ls-files"
-            else Mock(returncode=0)
-        )
+        mock_run.return_value = Mock(returncode=0)
+        mocker.patch("sprout.commands.create.get_env_examples", return_value=[env_example])
 
         # Run command
         result = runner.invoke(app, ["create", "feature-branch"])
@@ -63,6 +54,72 @@ class TestCreateCommand:
         assert env_file.exists()
         assert env_file.read_text() == "ENV_VAR=value"
 
+    def test_create_uses_parallel_checkout(self, mocker, tmp_path):
+        """Test the worktree is added without files and populated by a parallel checkout."""
+        project_dir = tmp_path / "project"
+        project_dir.mkdir()
+        (project_dir / ".sprout.toml").write_text("[checkout]\nworkers = 3\n")
+        sprout_dir = project_dir / ".sprout"
+        sprout_dir.mkdir()
+
+        mocker.patch("sprout.commands.create.is_git_repository", return_value=True)
+        mocker.patch("sprout.commands.create.get_git_root", return_value=project_dir)
+        mocker.patch("sprout.commands.create.get_env_examples", return_value=[])
+        mocker.patch("sprout.commands.create.worktree_exists", return_value=False)
+        mocker.patch("sprout.commands.create.branch_exists", return_value=True)
+        mocker.patch("sprout.commands.create.ensure_sprout_dir", return_value=sprout_dir)
+        mock_run = mocker.patch("sprout.commands.create.run_command")
+        mock_run.return_value = Mock(returncode=0)
+
+        result = runner.invoke(app, ["create", "feature-branch", "--path"])
+
+        assert result.exit_code == 0
+        worktree = str(sprout_dir / "feature-branch")
+        assert [call.args[0] for call in mock_run.call_args_list] == [
+            ["git", "worktree", "add", "--no-checkout", worktree, "feature-branch"],
+            [
+                "git",
+                "-C",
+                worktree,
+                "-c",
+                "checkout.workers=3",
+                "-c",
+                "checkout.thresholdForParallelism=100",
+                "checkout",
+            ],
+        ]
+
+    def test_create_checkout_failure_removes_worktree(self, mocker, tmp_path):
+        """Test a failed checkout force-removes the partially populated worktree."""
+        project_dir = tmp_path / "project"
+        project_dir.mkdir()
+        sprout_dir = project_dir / ".sprout"
+        sprout_dir.mkdir()
+
+        mocker.patch("sprout.commands.create.is_git_repository", return_value=True)
+        mocker.patch("sprout.commands.create.get_git_root", return_value=project_dir)
+        mocker.patch("sprout.commands.create.get_env_examples", return_value=[])
+        mocker.patch("sprout.commands.create.worktree_exists", return_value=False)
+        mocker.patch("sprout.commands.create.branch_exists", return_value=True)
+        mocker.patch("sprout.commands.create.ensure_sprout_dir", return_value=sprout_dir)
+
+        def run(cmd, check=True):
+            if cmd[-1] == "checkout":
+                raise SproutError("Command failed: git checkout")
+            return Mock(returncode=0)
+
+        mock_run = mocker.patch("sprout.commands.create.run_command", side_effect=run)
+        mocker.patch("sprout.utils.run_command", new=mock_run)
+
+        result = runner.invoke(app, ["create", "feature-branch"])
+
+        assert result.exit_code == 1
+        assert "Error creating worktree" in result.stdout
+        mock_run.assert_any_call(
+            ["git", "worktree", "remove", "--force", str(sprout_dir / "feature-branch")],
+            check=False,
+        )
+
     def test_create_not_in_git_repo(self, mocker):
         """Test error when not in git repository."""
         mocker.patch("sprout.commands.create.is_git_repository", return_value=False)
@@ -96,12 +153,8 @@ class TestCreateCommand:
 
         # Mock command execution
         mock_run = mocker.patch("sprout.commands.create.run_command")
-        # Mock git ls-files to return .env.example
-        mock_run.side_effect = lambda cmd, **kwargs: (
-            Mock(stdout=".env.example\n", returncode=0)
-            if cmd[1] == "ls-files"
-            else Mock(returncode=0)
-        )
+        mock_run.return_value = Mock(returncode=0)
+        mocker.patch("sprout.commands.create.get_env_examples", return_value=[env_example])
 
         # Run command with --path flag
         result = runner.invoke(app, ["create", "feature-branch", "--path"])
@@ -138,9 +191,10 @@ class TestCreateCommand:
         mocker.patch("sprout.commands.create.ensure_sprout_dir", return_value=sprout_dir)
         mocker.patch("sprout.commands.create.branch_exists", return_value=False)
 
-        # Mock git ls-files to return empty list (no .env.example files)
+        # No .env.example files
+        mocker.patch("sprout.commands.create.get_env_examples", return_value=[])
         mock_run = mocker.patch("sprout.commands.create.run_command")
-        mock_run.return_value = Mock(stdout="", returncode=0)
+        mock_run.return_value = Mock(returncode=0)
 
         # Change to project directory to make relative path calculation work
         import os
@@ -165,13 +219,10 @@ class TestCreateCommand:
         mocker.patch("sprout.commands.create.get_git_root", return_value=mock_git_root)
         mocker.patch("sprout.commands.create.worktree_exists", return_value=True)
 
-        # Mock git ls-files to return .env.example
-        mock_run = mocker.patch("sprout.commands.create.run_command")
-        mock_run.return_value = Mock(stdout=".env.example\n", returncode=0)
-
-        # Mock Path.exists to return True for .env.example
-        mock_exists = mocker.patch("pathlib.Path.exists")
-        mock_exists.return_value = True
+        mocker.patch(
+            "sprout.commands.create.get_env_examples",
+            return_value=[mock_git_root / ".env.example"],
+        )
 
         result = runner.invoke(app, ["create", "feature-branch"])
 
@@ -190,9 +241,10 @@ class TestCreateCommand:
         mocker.patch("sprout.commands.create.ensure_sprout_dir", return_value=sprout_dir)
         mocker.patch("sprout.commands.create.branch_exists", return_value=False)
 
-        # Mock git ls-files to return empty list (no .env.example files)
+        # No .env.example files
+        mocker.patch("sprout.commands.create.get_env_examples", return_value=[])
         mock_run = mocker.patch("sprout.commands.create.run_command")
-        mock_run.return_value = Mock(stdout="", returncode=0)
+        mock_run.return_value = Mock(returncode=0)
 
         result = runner.invoke(app, ["create", "feature-branch", "--path"])
 
@@ -204,7 +256,7 @@ class TestCreateCommand:
 class TestLsCommand:
     """Test sprout ls command."""
 
-    def test_ls_with_worktrees(self, mocker, tmp_path):
+    def test_ls_with_worktrees(self, mocker, tmp_path, worktree_list_fallback):
         """Test listing worktrees."""
         # Set up test directory structure
         project_dir = tmp_path / "project"
@@ -243,7 +295,7 @@ branch refs/heads/feature2
         assert "feature1" in result.stdout
         assert "feature2" in result.stdout
 
-    def test_ls_no_worktrees(self, mocker):
+    def test_ls_no_worktrees(self, mocker, worktree_list_fallback):
         """Test listing when no worktrees exist."""
         mocker.patch("sprout.commands.ls.is_git_repository", return_value=True)
         mocker.patch("sprout.utils.is_git_repository", return_value=True)
@@ -303,7 +355,7 @@ class TestPathCommand:
         # Error goes to stderr, not stdout in path command
         assert "Error: Worktree for branch 'feature-branch' does not exist" in result.output
 
-    def test_path_with_index(self, mocker, tmp_path):
+    def test_path_with_index(self, mocker, tmp_path, worktree_list_fallback):
         """Test getting worktree path using index."""
         # Set up test directory structure
         project_dir = tmp_path / "project"
@@ -343,7 +395,7 @@ branch refs/heads/feature-b
         assert result.exit_code == 0
         assert result.stdout.strip() == str(sprout_dir / "feature-b")
 
-    def test_path_with_invalid_index(self, mocker):
+    def test_path_with_invalid_index(self, mocker, worktree_list_fallback):
         """Test error when using invalid index."""
         # Mock prerequisites
         mocker.patch("sprout.commands.path.is_git_repository", return_value=True)
@@ -362,6 +414,111 @@ branch refs/heads/feature-b
         assert "sprout ls" in result.output
 
 
+class TestPortsCommand:
+    """Test sprout ports command."""
+
+    def test_ports_json_reports_collisions_and_orphans(self, mocker, tmp_path):
+        """Test the JSON report flags shared ports and removed worktrees.
+
+        Fixed ports from the templates are shared on purpose and aren't collisions.
+        """
+        import json
+
+        from sprout.ports import LEDGER_FILENAME, PortLedger
+
+        sprout_dir = tmp_path / ".sprout"
+        (sprout_dir / "feature-a").mkdir(parents=True)
+        (sprout_dir / "feature-b").mkdir()
+        (sprout_dir / "feature-a" / ".env").write_text("PORT=8080\nDB_PORT=5432")
+        (sprout_dir / "feature-b" / ".env").write_text("PORT=8080\nDB_PORT=5432")
+        for worktree in ("feature-a", "feature-b"):
+            (sprout_dir / worktree / ".git").write_text("gitdir: /repo/.git/worktrees/x")
+        template = tmp_path / ".env.example"
+        template.write_text("PORT={{ auto_port() }}\nDB_PORT=5432\n")
+        PortLedger(
+            sprout_dir / LEDGER_FILENAME,
+            {8080: {"feature-a"}, 5432: {"feature-a", "feature-b"}, 9000: {"gone"}, 9001: {"gone"}},
+        ).save()
+
+        mocker.patch("sprout.commands.ports.is_git_repository", return_value=True)
+        mocker.patch("sprout.commands.ports.get_sprout_dir", return_value=sprout_dir)
+        mocker.patch("sprout.commands.ports.read_bound_ports", return_value={9000})
+        mocker.patch("sprout.commands.ports.get_env_dirs", return_value=["."])
+        mocker.patch("sprout.commands.ports.get_env_examples", return_value=[template])
+
+        result = runner.invoke(app, ["ports", "--json"])
+
+        assert result.exit_code == 0
+        report = json.loads(result.stdout)
+        assert report["orphans"] == ["gone"]
+        assert report["collisions"] == [{"port": 8080, "worktrees": ["feature-a", "feature-b"]}]
+        entries = {entry["worktree"]: entry for entry in report["worktrees"]}
+        assert entries["feature-a"]["ports"] == [
+            {"port": 5432, "listening": False, "collision": []},
+            {"port": 8080, "listening": False, "collision": ["feature-b"]},
+        ]
+        assert entries["gone"]["orphan"] is True
+        assert entries["gone"]["ports"][0] == {"port": 9000, "listening": True, "collision": []}
+        # Without --gc nothing is reclaimed
+        assert PortLedger.open(sprout_dir).ports() == {5432, 8080, 9000, 9001}
+
+    def test_ports_gc_reclaims_orphans(self, mocker, tmp_path):
+        """Test --gc releases ports of worktrees that no longer exist."""
+        from sprout.ports import LEDGER_FILENAME, PortLedger
+
+        sprout_dir = tmp_path / ".sprout"
+        (sprout_dir / "feature-a").mkdir(parents=True)
+        PortLedger(sprout_dir / LEDGER_FILENAME, {8080: {"feature-a"}, 9000: {"gone"}}).save()
+
+        mocker.patch("sprout.commands.ports.is_git_repository", return_value=True)
+        mocker.patch("sprout.commands.ports.get_sprout_dir", return_value=sprout_dir)
+        mocker.patch("sprout.commands.ports.get_env_examples", return_value=[])
+
+        result = runner.invoke(app, ["ports", "--gc"])
+
+        assert result.exit_code == 0
+        assert "Sprout Ports" in result.stdout
+        assert "Reclaimed 1 port(s) from 1 worktree(s)" in result.stdout
+        assert PortLedger.open(sprout_dir).ports() == {8080}
+
+    def test_ports_verify_reports_ledger_drift(self, mocker, tmp_path):
+        """Test --verify reports ports missing from the ledger and stale entries."""
+        import json
+
+        from sprout.ports import LEDGER_FILENAME, PortLedger
+
+        sprout_dir = tmp_path / ".sprout"
+        (sprout_dir / "feature-a").mkdir(parents=True)
+        (sprout_dir / "feature-a" / ".git").write_text("gitdir: /repo/.git/worktrees/x")
+        (sprout_dir / "feature-a" / ".env").write_text("PORT=8080\nOTHER=8081")
+        PortLedger(sprout_dir / LEDGER_FILENAME, {8080: {"feature-a"}, 7000: {"feature-a"}}).save()
+
+        mocker.patch("sprout.commands.ports.is_git_repository", return_value=True)
+        mocker.patch("sprout.commands.ports.get_sprout_dir", return_value=sprout_dir)
+        mocker.patch("sprout.commands.ports.get_env_dirs", return_value=["."])
+        mocker.patch("sprout.commands.ports.get_env_examples", return_value=[])
+
+        report = json.loads(runner.invoke(app, ["ports", "--json"]).stdout)
+        assert report["drift"] is None
+
+        result = runner.invoke(app, ["ports", "--verify", "--json"])
+        assert result.exit_code == 0
+        assert json.loads(result.stdout)["drift"] == {"untracked": [8081], "stale": [7000]}
+
+        result = runner.invoke(app, ["ports", "--verify"])
+        assert result.exit_code == 0
+        assert "The port ledger is out of date" in result.stdout
+
+    def test_ports_not_in_git_repo(self, mocker):
+        """Test error when not in git repository."""
+        mocker.patch("sprout.commands.ports.is_git_repository", return_value=False)
+
+        result = runner.invoke(app, ["ports"])
+
+        assert result.exit_code == 1
+        assert "Not in a git repository" in result.stdout
+
+
 class TestVersion:
     """Test version display."""
 
@@ -376,7 +533,7 @@ class TestVersion:
 class TestIndexedOperations:
     """Test index-based functionality."""
 
-    def test_ls_with_indices(self, mocker, tmp_path):
+    def test_ls_with_indices(self, mocker, tmp_path, worktree_list_fallback):
         """Test that ls command shows index numbers."""
         # Set up test directory structure
         project_dir = tmp_path / "project"
@@ -429,7 +586,7 @@ branch refs/heads/feature-c
         else:
             raise AssertionError("Index 1 should correspond to feature-a")
 
-    def test_rm_with_index(self, mocker, tmp_path):
+    def test_rm_with_index(self, mocker, tmp_path, worktree_list_fallback):
         """Test removing worktree by index."""
         # Set up test directory structure
         project_dir = tmp_path / "project"
@@ -475,7 +632,7 @@ branch refs/heads/feature-b
         assert result.exit_code == 0
         assert "feature-b" in result.stdout  # Should show the resolved branch name
 
-    def test_rm_with_invalid_index(self, mocker):
+    def test_rm_with_invalid_index(self, mocker, worktree_list_fallback):
         """Test error when using invalid index."""
         # Mock prerequisites
         mocker.patch("sprout.commands.rm.is_git_repository", return_value=True)
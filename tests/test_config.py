@@ -0,0 +1,131 @@
+"""Tests for repository configuration."""
+
+import pytest
+
+from sprout.config import (
+    CONFIG_FILENAME,
+    CheckoutConfig,
+    MaintenanceConfig,
+    PoolConfig,
+    PortConfig,
+    SproutConfig,
+    TemplateConfig,
+    ValueProviderConfig,
+    ValuesConfig,
+    load_config,
+)
+from sprout.exceptions import SproutError
+
+
+class TestLoadConfig:
+    """Test loading .sprout.toml."""
+
+    def test_missing_file_uses_defaults(self, tmp_path):
+        """Test defaults are returned when no config file exists."""
+        assert load_config(tmp_path) == SproutConfig()
+
+    def test_port_settings(self, tmp_path):
+        """Test the [ports] table is parsed."""
+        (tmp_path / CONFIG_FILENAME).write_text(
+            '[ports]\nmode = "block"\nblock_size = 10\nblock_range = [20000, 20999]\n'
+        )
+
+        config = load_config(tmp_path)
+        assert config.ports == PortConfig(mode="block", block_size=10, block_range=(20000, 20999))
+
+    def test_template_settings(self, tmp_path):
+        """Test the [templates] table is parsed."""
+        (tmp_path / CONFIG_FILENAME).write_text("[templates]\nworkers = 2\n")
+
+        assert load_config(tmp_path).templates == TemplateConfig(workers=2)
+
+    def test_template_targets(self, tmp_path):
+        """Test [templates.targets] maps sources to targets in order."""
+        (tmp_path / CONFIG_FILENAME).write_text(
+            '[templates.targets]\n"compose.override.yaml.tmpl" = "compose.override.yaml"\n'
+            '".vscode/settings.json.tmpl" = ".vscode/settings.json"\n'
+        )
+
+        assert load_config(tmp_path).templates.targets == (
+            ("compose.override.yaml.tmpl", "compose.override.yaml"),
+            (".vscode/settings.json.tmpl", ".vscode/settings.json"),
+        )
+
+    def test_template_files(self, tmp_path):
+        """Test [templates] files lists templates explicitly."""
+        (tmp_path / CONFIG_FILENAME).write_text(
+            '[templates]\nfiles = ["backend/.env.example", ".env.example"]\n'
+        )
+
+        assert load_config(tmp_path).templates.files == ("backend/.env.example", ".env.example")
+        assert TemplateConfig().files is None
+
+    def test_checkout_settings(self, tmp_path):
+        """Test the [checkout] table is parsed."""
+        (tmp_path / CONFIG_FILENAME).write_text(
+            "[checkout]\nworkers = 4\nparallel_threshold = 0\ntune = true\n"
+        )
+
+        assert load_config(tmp_path).checkout == CheckoutConfig(
+            workers=4, parallel_threshold=0, tune=True
+        )
+
+    def test_maintenance_settings(self, tmp_path):
+        """Test the [maintenance] table is parsed."""
+        (tmp_path / CONFIG_FILENAME).write_text("[maintenance]\nafter_create = true\n")
+
+        assert load_config(tmp_path).maintenance == MaintenanceConfig(after_create=True)
+        assert MaintenanceConfig().after_create is False
+
+    def test_pool_settings(self, tmp_path):
+        """Test the [pool] table is parsed."""
+        (tmp_path / CONFIG_FILENAME).write_text("[pool]\nmax_size = 10\nrefill = false\n")
+
+        assert load_config(tmp_path).pool == PoolConfig(max_size=10, refill=False)
+
+    def test_values_settings(self, tmp_path):
+        """Test the [values] table is parsed."""
+        (tmp_path / CONFIG_FILENAME).write_text(
+            '[values]\nremember_answers = false\n\n[[values.providers]]\ntype = "file"\n'
+            'path = "~/.secrets.env"\n'
+        )
+
+        assert load_config(tmp_path).values == ValuesConfig(
+            remember_answers=False,
+            providers=(ValueProviderConfig(type="file", path="~/.secrets.env"),),
+        )
+
+    @pytest.mark.parametrize(
+        ("content", "message"),
+        [
+            ('[ports]\nmode = "sequential"\n', "Invalid ports.mode"),
+            ("[ports]\nblock_size = 0\n", "block_size"),
+            ("[ports]\nblock_size = true\n", "block_size"),
+            ("[ports]\nblock_range = [80, 90]\n", "block_range"),
+            ("[ports]\nblock_size = 50\nblock_range = [20000, 20010]\n", "smaller than"),
+            ("[ports]\nlease_ttl = 0\n", "lease_ttl"),
+            ("[ports]\nlease_ttl = true\n", "lease_ttl"),
+            ("[templates]\nworkers = 0\n", "templates.workers"),
+            ('[templates.targets]\n"a.tmpl" = "../outside"\n', "must be relative"),
+            ('[templates.targets]\n"/etc/hosts" = "hosts"\n', "must be relative"),
+            ('[templates.targets]\n"a.tmpl" = 1\n', "must be a path"),
+            ('[templates]\nfiles = ".env.example"\n', "templates.files"),
+            ('[templates]\nfiles = ["../.env.example"]\n', "must be relative"),
+            ("[checkout]\nworkers = -1\n", "checkout.workers"),
+            ("[checkout]\nparallel_threshold = true\n", "parallel_threshold"),
+            ('[checkout]\ntune = "yes"\n', "checkout.tune"),
+            ("[maintenance]\nafter_create = 1\n", "maintenance.after_create"),
+            ("[pool]\nmax_size = -1\n", "pool.max_size"),
+            ('[pool]\nrefill = "no"\n', "pool.refill"),
+            ('[values]\nremember_answers = "yes"\n', "remember_answers"),
+            ('[[values.providers]]\ntype = "vault"\n', "Invalid values provider"),
+            ('[[values.providers]]\ntype = "file"\n', "needs a path"),
+            ("[ports\n", "Failed to read"),
+        ],
+    )
+    def test_invalid_config(self, tmp_path, content, message):
+        """Test invalid settings raise SproutError."""
+        (tmp_path / CONFIG_FILENAME).write_text(content)
+
+        with pytest.raises(SproutError, match=message):
+            load_config(tmp_path)
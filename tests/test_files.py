@@ -0,0 +1,28 @@
+"""Tests for writing bookkeeping files."""
+
+import json
+
+from sprout.files import atomic_write_json
+
+
+class TestAtomicWriteJson:
+    """Test atomic JSON writes."""
+
+    def test_replaces_existing_file(self, tmp_path):
+        """Test the new content replaces the old and no temporary file is left behind."""
+        path = tmp_path / ".state.json"
+        path.write_text("old")
+
+        atomic_write_json(path, {"b": 1, "a": [2]}, sort_keys=True)
+
+        assert path.read_text() == '{\n  "a": [\n    2\n  ],\n  "b": 1\n}\n'
+        assert [entry.name for entry in tmp_path.iterdir()] == [".state.json"]
+
+    def test_compact_output(self, tmp_path):
+        """Test no indentation writes the content on one line."""
+        path = tmp_path / "cache.json"
+
+        atomic_write_json(path, {"tokens": []}, indent=None)
+
+        assert path.read_text() == '{"tokens": []}\n'
+        assert json.loads(path.read_text()) == {"tokens": []}
@@ -0,0 +1,132 @@
+"""Tests for the repository context and the worktree reader."""
+
+from pathlib import Path
+
+import pytest
+
+from sprout.git import (
+    BatchCheck,
+    GitContext,
+    get_git_context,
+    read_worktrees,
+    refs_exist,
+    subprocess_count,
+)
+from sprout.utils import _parse_worktree_list
+
+
+@pytest.fixture
+def repo(make_repo, git):
+    """Repository with one commit and two linked worktrees, one detached."""
+    root = make_repo()
+    git("worktree", "add", "-b", "feature", str(root / ".sprout" / "feature"), cwd=root)
+    git("worktree", "add", "--detach", str(root / ".sprout" / "detached"), cwd=root)
+    return root
+
+
+def _porcelain(git, root):
+    return _parse_worktree_list(git("worktree", "list", "--porcelain", cwd=root).stdout)
+
+
+class TestGitContext:
+    """Test repository discovery."""
+
+    def test_linked_worktree_context(self, repo, monkeypatch):
+        """Test the context of a linked worktree points at the shared repository."""
+        monkeypatch.chdir(repo / ".sprout" / "feature")
+        context = get_git_context()
+
+        assert context is not None
+        assert context.root == repo / ".sprout" / "feature"
+        assert context.common_dir == repo / ".git"
+        assert context.git_dir == repo / ".git" / "worktrees" / "feature"
+
+    def test_context_is_cached_per_directory(self, repo, monkeypatch):
+        """Test repeated lookups from one directory run git once."""
+        monkeypatch.chdir(repo)
+        before = subprocess_count()
+        assert get_git_context() == get_git_context()
+        assert subprocess_count() - before == 1
+
+    def test_outside_repository(self, tmp_path, monkeypatch):
+        """Test there is no context outside a repository."""
+        monkeypatch.chdir(tmp_path)
+        assert get_git_context() is None
+
+
+class TestReadWorktrees:
+    """Test reading worktrees from .git/worktrees/."""
+
+    def test_matches_git_worktree_list(self, repo, monkeypatch, git):
+        """Test the worktrees read from .git/worktrees/ match `git worktree list`."""
+        monkeypatch.chdir(repo)
+        before = subprocess_count()
+        context = get_git_context()
+        assert context is not None
+
+        worktrees = read_worktrees(context)
+
+        assert worktrees == _porcelain(git, repo)
+        assert subprocess_count() - before == 1
+        by_path = {wt["path"]: wt for wt in worktrees}
+        assert by_path[repo / ".sprout" / "feature"]["branch"] == "feature"
+        assert "branch" not in by_path[repo / ".sprout" / "detached"]
+        assert by_path[repo / ".sprout" / "detached"]["head"] == by_path[repo]["head"]
+
+    def test_packed_refs(self, repo, git):
+        """Test branch heads are resolved from packed-refs."""
+        git("pack-refs", "--all", cwd=repo)
+        context = GitContext(git_dir=repo / ".git", common_dir=repo / ".git", root=repo)
+
+        assert read_worktrees(context) == _porcelain(git, repo)
+
+    def test_unexpected_head_falls_back(self, repo):
+        """Test an unreadable HEAD makes the reader give up."""
+        (repo / ".git" / "worktrees" / "feature" / "HEAD").write_text("garbage\n")
+        context = GitContext(git_dir=repo / ".git", common_dir=repo / ".git", root=repo)
+
+        assert read_worktrees(context) is None
+
+    def test_missing_gitdir_falls_back(self, repo):
+        """Test a worktree without a gitdir file makes the reader give up."""
+        (repo / ".git" / "worktrees" / "feature" / "gitdir").unlink()
+        context = GitContext(git_dir=repo / ".git", common_dir=repo / ".git", root=repo)
+
+        assert read_worktrees(context) is None
+
+    def test_bare_repository_falls_back(self, tmp_path, git):
+        """Test bare repositories are left to `git worktree list`."""
+        bare = tmp_path / "bare.git"
+        git("init", "--bare", str(bare), cwd=tmp_path)
+        context = GitContext(git_dir=bare, common_dir=bare, root=Path(tmp_path))
+
+        assert read_worktrees(context) is None
+
+
+class TestBatchCheck:
+    """Test the long-lived cat-file helper."""
+
+    def test_refs_exist_uses_one_process(self, repo, monkeypatch):
+        """Test any number of ref lookups is answered by one cat-file process."""
+        monkeypatch.chdir(repo)
+        before = subprocess_count()
+        refs = [f"refs/heads/missing-{i}" for i in range(600)] + ["refs/heads/feature"]
+
+        first = refs_exist(refs)
+        second = refs_exist(["refs/heads/feature", "refs/tags/none"])
+
+        assert first["refs/heads/feature"] is True
+        assert not any(first[f"refs/heads/missing-{i}"] for i in range(600))
+        assert second == {"refs/heads/feature": True, "refs/tags/none": False}
+        assert subprocess_count() - before == 1
+
+    def test_resolve_object_ids(self, repo, git):
+        """Test revisions resolve to object ids, and unknown or malformed ones to None."""
+        head = git("rev-parse", "HEAD", cwd=repo).stdout.strip()
+        batch_check = BatchCheck(repo)
+        try:
+            resolved = batch_check.resolve(["HEAD", "feature", "no\nsuch", "nonexistent"])
+        finally:
+            batch_check.close()
+
+        assert resolved == {"HEAD": head, "feature": head, "no\nsuch": None, "nonexistent": None}
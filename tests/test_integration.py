@@ -1,6 +1,9 @@
 """Integration tests for sprout."""
 
+import json
+import shutil
 import subprocess
+import time
 from pathlib import Path
 
 import pytest
@@ -294,6 +297,467 @@ class TestIntegrationWorkflow:
         # Check prompted value
         assert "NO_DEFAULT=prompted_value" in env_content
 
+    @pytest.mark.parametrize("removal", ["git", "rm"])
+    def test_ports_command_reclaims_externally_removed_worktree(
+        self, git_repo, monkeypatch, removal
+    ):
+        """Test sprout ports lists allocations and --gc reclaims removed worktrees."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv("API_KEY", "test_key")
+
+        assert runner.invoke(app, ["create", "keep-branch"]).exit_code == 0
+        assert runner.invoke(app, ["create", "drop-branch"]).exit_code == 0
+
+        # Remove one worktree behind sprout's back; after rm -rf git still lists it
+        dropped = git_repo / ".sprout" / "drop-branch"
+        if removal == "git":
+            subprocess.run(
+                ["git", "worktree", "remove", "--force", str(dropped)], cwd=git_repo, check=True
+            )
+        else:
+            shutil.rmtree(dropped)
+
+        result = runner.invoke(app, ["ports", "--json"])
+        assert result.exit_code == 0
+        report = json.loads(result.stdout)
+        assert report["orphans"] == ["drop-branch"]
+        assert {entry["worktree"] for entry in report["worktrees"]} == {
+            "keep-branch",
+            "drop-branch",
+        }
+
+        result = runner.invoke(app, ["ports", "--gc", "--json"])
+        assert result.exit_code == 0
+        assert list(json.loads(result.stdout)["reclaimed"]) == ["drop-branch"]
+
+        report = json.loads(runner.invoke(app, ["ports", "--json"]).stdout)
+        assert report["orphans"] == []
+        assert [entry["worktree"] for entry in report["worktrees"]] == ["keep-branch"]
+
+    def test_create_with_values_file(self, git_repo, monkeypatch, tmp_path):
+        """Test a --values file answers prompts and overrides template defaults."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.delenv("API_KEY", raising=False)
+        values_file = tmp_path / "values.toml"
+        values_file.write_text('API_KEY = "from_file"\n')
+
+        result = runner.invoke(app, ["create", "values-branch", "--values", str(values_file)])
+
+        assert result.exit_code == 0
+        assert "Enter a value" not in result.stdout
+        env_content = (git_repo / ".sprout" / "values-branch" / ".env").read_text()
+        assert "API_KEY=from_file" in env_content
+
+        result = runner.invoke(app, ["create", "other-branch", "--values", "missing.env"])
+        assert result.exit_code == 1
+        assert "Values file not found" in result.stdout
+
+    def test_answers_are_remembered(self, git_repo, monkeypatch):
+        """Test prompted answers are reused by later creates."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.delenv("API_KEY", raising=False)
+
+        result = runner.invoke(app, ["create", "first"], input="typed_key\n")
+        assert result.exit_code == 0
+        assert "Enter a value for" in result.stdout
+
+        result = runner.invoke(app, ["create", "second"])
+        assert result.exit_code == 0
+        assert "Enter a value for" not in result.stdout
+        env_content = (git_repo / ".sprout" / "second" / ".env").read_text()
+        assert "API_KEY=typed_key" in env_content
+
+    def test_sync_updates_worktrees_and_keeps_ports(self, git_repo, monkeypatch):
+        """Test sync adds and removes changed keys while keeping ports and answers."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv("API_KEY", "test_key")
+
+        for branch in ("sync-a", "sync-b"):
+            assert runner.invoke(app, ["create", branch]).exit_code == 0
+        env_a = git_repo / ".sprout" / "sync-a" / ".env"
+        before = dict(line.split("=", 1) for line in env_a.read_text().splitlines() if "=" in line)
+        env_a.write_text(env_a.read_text() + "\nMY_OVERRIDE=1")
+
+        result = runner.invoke(app, ["sync"])
+        assert result.exit_code == 0
+        assert "All worktrees are up to date" in result.stdout
+
+        (git_repo / ".env.example").write_text(
+            "API_KEY={{ API_KEY }}\n"
+            "WEB_PORT={{ auto_port() }}\n"
+            "CACHE_PORT={{ auto_port() }}\n"
+            "STATIC_VAR=fixed_value\n"
+        )
+        monkeypatch.setenv("API_KEY", "changed_key")
+
+        result = runner.invoke(app, ["sync"])
+        assert result.exit_code == 0
+        assert "sync-a: updated .env (+CACHE_PORT, -DB_PORT, -COMPOSE_VAR)" in result.stdout
+        assert "Synced 2 worktree(s)" in result.stdout
+
+        after = dict(line.split("=", 1) for line in env_a.read_text().splitlines())
+        assert after["WEB_PORT"] == before["WEB_PORT"]
+        assert after["API_KEY"] == "test_key"
+        assert after["MY_OVERRIDE"] == "1"
+        assert "DB_PORT" not in after
+        assert int(after["CACHE_PORT"]) not in {int(before["WEB_PORT"]), int(before["DB_PORT"])}
+
+        from sprout.ports import PortLedger
+
+        ledger = PortLedger.open(git_repo / ".sprout")
+        assert ledger.ports_for("sync-a") == {int(after["WEB_PORT"]), int(after["CACHE_PORT"])}
+
+        result = runner.invoke(app, ["sync"])
+        assert "All worktrees are up to date" in result.stdout
+
+    def test_sync_keeps_ports_in_non_dotenv_targets(self, git_repo, monkeypatch):
+        """Test sync keeps the unnamed ports of a YAML target when another line changes."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv("API_KEY", "test_key")
+        template = git_repo / "compose.yaml.tmpl"
+        template.write_text('services:\n  web:\n    ports:\n      - "{{ auto_port() }}:80"\n')
+        (git_repo / ".sprout.toml").write_text(
+            '[templates.targets]\n"compose.yaml.tmpl" = "compose.override.yaml"\n'
+        )
+        assert runner.invoke(app, ["create", "compose"]).exit_code == 0
+        compose = git_repo / ".sprout" / "compose" / "compose.override.yaml"
+        port = int(compose.read_text().split('"')[1].split(":")[0])
+
+        template.write_text(template.read_text() + "    restart: always\n")
+        result = runner.invoke(app, ["sync"])
+
+        assert result.exit_code == 0
+        assert f'- "{port}:80"' in compose.read_text()
+        assert "restart: always" in compose.read_text()
+        from sprout.ports import PortLedger
+
+        assert port in PortLedger.open(git_repo / ".sprout").ports_for("compose")
+
+    def test_sync_watch_updates_changed_templates(self, git_repo, monkeypatch):
+        """Test sync --watch re-renders the templates the watcher reports until interrupted."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv("API_KEY", "test_key")
+        assert runner.invoke(app, ["create", "watched"]).exit_code == 0
+        template = git_repo / ".env.example"
+
+        class FakeWatcher:
+            mechanism = "fake"
+            batches = [lambda: template.write_text(template.read_text() + "NEW_VAR=added\n")]
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                return None
+
+            def wait_for_changes(self, debounce):
+                if not self.batches:
+                    raise KeyboardInterrupt
+                self.batches.pop()()
+                return {template}
+
+        monkeypatch.setattr("sprout.commands.sync.create_watcher", lambda paths: FakeWatcher())
+
+        result = runner.invoke(app, ["sync", "--watch"])
+
+        assert result.exit_code == 0
+        assert "Watching 1 template(s) for changes (fake)" in result.stdout
+        assert "Changed: .env.example" in result.stdout
+        assert "watched: updated .env (+NEW_VAR)" in result.stdout
+        assert "Stopped watching" in result.stdout
+        assert "NEW_VAR=added" in (git_repo / ".sprout" / "watched" / ".env").read_text()
+
+    def test_commands_discover_repository_once(self, git_repo, monkeypatch):
+        """Test read-only commands stay within a small budget of git subprocesses."""
+        from sprout.git import subprocess_count
+
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv("API_KEY", "test_key")
+        assert runner.invoke(app, ["create", "budget"]).exit_code == 0
+
+        # One rev-parse for the repository context; worktrees are read from .git/worktrees
+        for args in (["path", "1"], ["ls"]):
+            before = subprocess_count()
+            result = runner.invoke(app, args)
+            assert result.exit_code == 0
+            assert subprocess_count() - before <= 1, args
+
+    def test_create_only_selected_directories(self, git_repo, monkeypatch):
+        """Test --only makes a sparse worktree and renders only the templates inside it."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv("API_KEY", "test_key")
+        for service in ("backend", "web"):
+            (git_repo / service).mkdir()
+            (git_repo / service / ".env.example").write_text(f"{service.upper()}_PORT=1\n")
+            (git_repo / service / "main.py").write_text("")
+        subprocess.run(["git", "add", "."], cwd=git_repo, check=True)
+        subprocess.run(["git", "commit", "-m", "Add services"], cwd=git_repo, check=True)
+
+        result = runner.invoke(app, ["create", "sparse", "--only", "backend"])
+
+        assert result.exit_code == 0, result.stdout
+        worktree = git_repo / ".sprout" / "sparse"
+        assert (worktree / "README.md").exists()
+        assert (worktree / "backend" / "main.py").exists()
+        assert (worktree / ".env").exists()
+        assert (worktree / "backend" / ".env").read_text().strip() == "BACKEND_PORT=1"
+        assert not (worktree / "web").exists()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=worktree,
+            capture_output=True,
+            text=True,
+        )
+        assert status.stdout == ""
+
+        # Template changes outside the selected directories don't reach the worktree
+        (git_repo / "web" / ".env.example").write_text("WEB_PORT=2\n")
+        (git_repo / "backend" / ".env.example").write_text("BACKEND_PORT=1\nEXTRA=1\n")
+        result = runner.invoke(app, ["sync"])
+        assert result.exit_code == 0
+        assert "EXTRA=1" in (worktree / "backend" / ".env").read_text()
+        assert not (worktree / "web").exists()
+
+    def test_sparse_create_rebuilds_ledger_from_every_template(self, git_repo, monkeypatch):
+        """Test a sparse create rebuilding the ledger keeps ports outside its directories."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv("API_KEY", "test_key")
+        for service in ("backend", "web"):
+            (git_repo / service).mkdir()
+            (git_repo / service / ".env.example").write_text(
+                f"{service.upper()}_PORT={{{{ auto_port() }}}}\n"
+            )
+        subprocess.run(["git", "add", "."], cwd=git_repo, check=True)
+        subprocess.run(["git", "commit", "-m", "Add services"], cwd=git_repo, check=True)
+
+        assert runner.invoke(app, ["create", "one"]).exit_code == 0
+        web_env = (git_repo / ".sprout" / "one" / "web" / ".env").read_text()
+        web_port = web_env.strip().split("=")[1]
+        (git_repo / ".sprout" / ".ports.json").unlink()
+
+        result = runner.invoke(app, ["create", "two", "--only", "backend"])
+
+        assert result.exit_code == 0, result.stdout
+        ledger = json.loads((git_repo / ".sprout" / ".ports.json").read_text())
+        assert ledger["ports"][web_port] == ["one"]
+
+    def test_failed_create_removes_populated_worktree(self, git_repo, monkeypatch):
+        """Test a create failing after files were written leaves no worktree behind."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv("API_KEY", "test_key")
+        (git_repo / "web").mkdir()
+        (git_repo / "web" / ".env.example").write_text("PORT={{ auto_port(bad) }}\n")
+        subprocess.run(["git", "add", "."], cwd=git_repo, check=True)
+        subprocess.run(["git", "commit", "-m", "Add web"], cwd=git_repo, check=True)
+
+        result = runner.invoke(app, ["create", "broken"])
+
+        assert result.exit_code == 1
+        assert "Error generating .env file" in result.stdout
+        assert not (git_repo / ".sprout" / "broken").exists()
+        worktrees = subprocess.run(
+            ["git", "worktree", "list"], cwd=git_repo, capture_output=True, text=True
+        )
+        assert "broken" not in worktrees.stdout
+
+    def test_create_tunes_worktree_for_fast_status(self, git_repo, monkeypatch):
+        """Test --tune writes worktree-scoped settings and reports the status latency."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv("API_KEY", "test_key")
+
+        result = runner.invoke(app, ["create", "tuned", "--tune"])
+
+        assert result.exit_code == 0
+        assert "Tuned git settings for fast status (git status:" in result.stdout
+        worktree = git_repo / ".sprout" / "tuned"
+
+        def config(*args, cwd=worktree):
+            return subprocess.run(
+                ["git", "config", *args], cwd=cwd, capture_output=True, text=True
+            ).stdout.strip()
+
+        assert config("--worktree", "core.untrackedCache") == "true"
+        assert config("--worktree", "index.version") == "4"
+        assert config("--worktree", "core.splitIndex") == "true"
+        assert config("--worktree", "gc.auto") == "0"
+        # The main working tree keeps its defaults
+        assert config("core.splitIndex", cwd=git_repo) == ""
+        assert config("gc.auto", cwd=git_repo) == ""
+
+        result = runner.invoke(app, ["create", "untuned"])
+        assert "Tuned git settings" not in result.stdout
+
+    def test_maintain_optimizes_shared_object_store(self, git_repo, monkeypatch):
+        """Test maintain packs loose objects, writes indexes and prunes stale worktrees."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv("API_KEY", "test_key")
+        assert runner.invoke(app, ["create", "stale"]).exit_code == 0
+        shutil.rmtree(git_repo / ".sprout" / "stale")
+
+        result = runner.invoke(app, ["maintain"])
+
+        assert result.exit_code == 0
+        assert "Reference query (git rev-list --count --all)" in result.stdout
+        assert "Loose objects:" in result.stdout
+        assert "Maintenance complete" in result.stdout
+        objects = git_repo / ".git" / "objects"
+        assert (objects / "pack" / "multi-pack-index").exists()
+        assert (objects / "info" / "commit-graphs" / "commit-graph-chain").exists()
+        count = subprocess.run(
+            ["git", "count-objects", "-v"], cwd=git_repo, capture_output=True, text=True
+        )
+        assert "count: 0" in count.stdout
+        assert not (git_repo / ".git" / "worktrees" / "stale").exists()
+
+    def test_maintain_refuses_to_run_twice(self, git_repo, monkeypatch):
+        """Test a second maintain fails while one holds the lock."""
+        from sprout.maintenance import maintain_lock
+
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        sprout_dir = git_repo / ".sprout"
+        sprout_dir.mkdir(exist_ok=True)
+
+        # flock locks belong to the open file, so a second open in this process conflicts
+        with maintain_lock(sprout_dir):
+            result = runner.invoke(app, ["maintain"])
+
+        assert result.exit_code == 1
+        assert "Maintenance is already running" in result.stdout
+
+    def test_create_starts_background_maintenance(self, git_repo, monkeypatch, mocker):
+        """Test [maintenance] after_create starts maintain in the background."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv("API_KEY", "test_key")
+        start = mocker.patch("sprout.commands.create.start_background_maintenance")
+
+        assert runner.invoke(app, ["create", "plain"]).exit_code == 0
+        start.assert_not_called()
+
+        (git_repo / ".sprout.toml").write_text("[maintenance]\nafter_create = true\n")
+        assert runner.invoke(app, ["create", "maintained"]).exit_code == 0
+        start.assert_called_once_with(git_repo, git_repo / ".sprout")
+
+    def test_maintain_in_background(self, git_repo, monkeypatch):
+        """Test maintain --background runs detached and logs its report."""
+        import sprout
+
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        # The detached process imports sprout from this checkout
+        monkeypatch.setenv("PYTHONPATH", str(Path(sprout.__file__).parents[1]))
+
+        result = runner.invoke(app, ["maintain", "--background"])
+
+        assert result.exit_code == 0
+        assert "Started maintenance in the background" in result.stdout
+        log = git_repo / ".sprout" / ".maintain.log"
+        deadline = time.monotonic() + 30
+        while "Maintenance complete" not in log.read_text() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        assert "Maintenance complete" in log.read_text()
+
+    def test_create_claims_worktree_from_pool(self, git_repo, monkeypatch, mocker):
+        """Test create takes a pooled worktree and switches it to the branch."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv("API_KEY", "test_key")
+        refill = mocker.patch("sprout.commands.create.start_background_fill")
+        subprocess.run(["git", "branch", "existing"], cwd=git_repo, check=True)
+
+        result = runner.invoke(app, ["pool", "fill", "2"])
+        assert result.exit_code == 0
+        assert "Added 2 worktree(s)" in result.stdout
+
+        # The main branch moves on after the pool was filled
+        (git_repo / "NEW.md").write_text("new\n")
+        subprocess.run(["git", "add", "NEW.md"], cwd=git_repo, check=True)
+        subprocess.run(["git", "commit", "-m", "Add NEW.md"], cwd=git_repo, check=True)
+
+        for branch in ["fresh", "existing"]:
+            result = runner.invoke(app, ["create", branch])
+            assert result.exit_code == 0
+            assert "Using a pre-populated worktree from the pool" in result.stdout
+
+        fresh = git_repo / ".sprout" / "fresh"
+        existing = git_repo / ".sprout" / "existing"
+
+        def head(path):
+            return subprocess.run(
+                ["git", "rev-parse", "--abbrev-ref", "HEAD"],
+                cwd=path,
+                capture_output=True,
+                text=True,
+            ).stdout.strip()
+
+        # A new branch starts at the current HEAD, like `git worktree add -b`
+        assert head(fresh) == "fresh"
+        assert (fresh / "NEW.md").exists()
+        assert head(existing) == "existing"
+        assert not (existing / "NEW.md").exists()
+        assert "API_KEY=test_key" in (fresh / ".env").read_text()
+        assert refill.call_count == 2
+        assert not list((git_repo / ".sprout" / ".pool").iterdir())
+
+        # With the pool empty, create adds a worktree as usual
+        result = runner.invoke(app, ["create", "unpooled"])
+        assert result.exit_code == 0
+        assert "pre-populated" not in result.stdout
+        assert refill.call_count == 2
+
+        # Pooled worktrees are not listed as environments
+        result = runner.invoke(app, ["ls"])
+        assert "fresh" in result.stdout
+        assert ".pool" not in result.stdout
+
+    def test_pool_refill_restores_filled_size(self, git_repo, monkeypatch, mocker):
+        """Test a fill without a size (as run after a claim) goes back to the last size."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv("API_KEY", "test_key")
+        pool_dir = git_repo / ".sprout" / ".pool"
+
+        assert runner.invoke(app, ["pool", "fill", "2"]).exit_code == 0
+        refill = mocker.patch("sprout.commands.create.start_background_fill")
+        assert runner.invoke(app, ["create", "claimed"]).exit_code == 0
+        refill.assert_called_once()
+        assert len(list(pool_dir.iterdir())) == 1
+
+        result = runner.invoke(app, ["pool", "fill"])
+
+        assert result.exit_code == 0
+        assert "Added 1 worktree(s)" in result.stdout
+        assert len(list(pool_dir.iterdir())) == 2
+
+    def test_pool_fill_respects_max_size(self, git_repo, monkeypatch):
+        """Test pool fill never grows the pool beyond [pool] max_size."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        (git_repo / ".sprout.toml").write_text("[pool]\nmax_size = 1\n")
+
+        result = runner.invoke(app, ["pool", "fill", "3"])
+
+        assert result.exit_code == 0
+        assert "Filling only 1 worktree(s) ([pool] max_size)" in result.stdout
+        assert "Added 1 worktree(s)" in result.stdout
+
+        result = runner.invoke(app, ["pool", "clear"])
+        assert result.exit_code == 0
+        assert "Removed 1 pooled worktree(s)" in result.stdout
+
     def test_error_cases(self, git_repo, monkeypatch, tmp_path):
         """Test various error conditions."""
         git_repo, default_branch = git_repo
@@ -172,19 +172,163 @@ PORT2={{ auto_port() }}
         assert "NESTED_PORT=" in nested_env_path.read_text()
 
     def test_get_used_ports_recursive(self, tmp_path, monkeypatch):
-        """Test that get_used_ports now searches recursively."""
+        """Test that get_used_ports reads the .env files of every template directory."""
         monkeypatch.setattr("sprout.utils.get_sprout_dir", lambda: tmp_path)
+        monkeypatch.setattr("sprout.utils.get_env_dirs", lambda: [".", "service-a", "nested/deep"])
 
         # Create nested structure with .env files
         (tmp_path / "branch1").mkdir()
+        (tmp_path / "branch1" / ".git").touch()
         (tmp_path / "branch1" / ".env").write_text("PORT1=8080")
 
         (tmp_path / "branch1" / "service-a").mkdir()
         (tmp_path / "branch1" / "service-a" / ".env").write_text("PORT2=8081")
 
         (tmp_path / "branch2" / "nested" / "deep").mkdir(parents=True)
+        (tmp_path / "branch2" / ".git").touch()
         (tmp_path / "branch2" / "nested" / "deep" / ".env").write_text("PORT3=8082")
 
+        # .env files outside the template directories are never read
+        (tmp_path / "branch2" / "node_modules" / "pkg").mkdir(parents=True)
+        (tmp_path / "branch2" / "node_modules" / "pkg" / ".env").write_text("PORT4=8083")
+
         # Test recursive port collection
         ports = get_used_ports()
         assert ports == {8080, 8081, 8082}
+
+    def test_port_ledger_tracks_created_worktrees(self, git_repo, monkeypatch):  # noqa: F811
+        """Test that create records its ports in the ledger and rm releases them."""
+        from sprout.ports import PortLedger
+
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv("API_KEY", "test_key")
+
+        result = runner.invoke(app, ["create", "ledger-branch"])
+        assert result.exit_code == 0
+
+        sprout_dir = git_repo / ".sprout"
+        env_content = (sprout_dir / "ledger-branch" / ".env").read_text()
+        ports = {
+            int(line.split("=")[1])
+            for line in env_content.splitlines()
+            if line.startswith(("WEB_PORT=", "DB_PORT="))
+        }
+        assert PortLedger.open(sprout_dir).ports_for("ledger-branch") == ports
+
+        result = runner.invoke(app, ["rm", "ledger-branch"], input="y\nn\n")
+        assert result.exit_code == 0
+        assert PortLedger.open(sprout_dir).ports_for("ledger-branch") == set()
+
+    def test_named_port_shared_across_templates(self, git_repo, monkeypatch):  # noqa: F811
+        """Test auto_port("name") resolves to the same port in every template."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv("API_KEY", "test_key")
+
+        (git_repo / "backend").mkdir()
+        (git_repo / "backend" / ".env.example").write_text(
+            'API_PORT={{ auto_port("api") }}\nWORKER_PORT={{ auto_port() }}\n'
+        )
+        (git_repo / "frontend").mkdir()
+        (git_repo / "frontend" / ".env.example").write_text(
+            'API_URL=http://localhost:{{ auto_port("api") }}\n'
+        )
+        subprocess.run(["git", "add", "."], cwd=git_repo, check=True)
+        subprocess.run(["git", "commit", "-m", "Add services"], cwd=git_repo, check=True)
+
+        result = runner.invoke(app, ["create", "named-ports"])
+        assert result.exit_code == 0
+
+        worktree_path = git_repo / ".sprout" / "named-ports"
+        backend = dict(
+            line.split("=", 1) for line in (worktree_path / "backend" / ".env").read_text().split()
+        )
+        frontend = (worktree_path / "frontend" / ".env").read_text().strip()
+        assert frontend == f"API_URL=http://localhost:{backend['API_PORT']}"
+        assert backend["WORKER_PORT"] != backend["API_PORT"]
+
+    def test_shared_variable_prompted_once(self, git_repo, monkeypatch):  # noqa: F811
+        """Test a variable used by several templates is asked for a single time."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv("API_KEY", "test_key")
+        (git_repo / ".sprout.toml").write_text("[templates]\nworkers = 4\n")
+
+        for i in range(6):
+            service_dir = git_repo / f"service-{i}"
+            service_dir.mkdir()
+            (service_dir / ".env.example").write_text(
+                "SHARED_TOKEN={{ SHARED_TOKEN }}\nPORT={{ auto_port() }}\n"
+            )
+        subprocess.run(["git", "add", "."], cwd=git_repo, check=True)
+        subprocess.run(["git", "commit", "-m", "Add services"], cwd=git_repo, check=True)
+
+        result = runner.invoke(app, ["create", "shared-prompt"], input="tok\n")
+        assert result.exit_code == 0
+        assert result.stdout.count("Enter a value for") == 1
+
+        worktree_path = git_repo / ".sprout" / "shared-prompt"
+        ports = set()
+        for i in range(6):
+            env = (worktree_path / f"service-{i}" / ".env").read_text()
+            assert "SHARED_TOKEN=tok" in env
+            ports.add(env.split("PORT=")[-1].strip())
+        assert len(ports) == 6
+
+    def test_template_targets_share_ports_and_answers(self, git_repo, monkeypatch):  # noqa: F811
+        """Test configured targets are rendered with the .env files in the same pass."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv("API_KEY", "test_key")
+
+        (git_repo / "backend").mkdir()
+        (git_repo / "backend" / ".env.example").write_text(
+            'API_PORT={{ auto_port("api") }}\nSERVICE={{ SERVICE_NAME }}\n'
+        )
+        (git_repo / "compose.override.yaml.tmpl").write_text(
+            'services:\n  {{ SERVICE_NAME }}:\n    ports: ["{{ auto_port("api") }}:8000"]\n'
+        )
+        (git_repo / ".sprout.toml").write_text(
+            '[templates.targets]\n"compose.override.yaml.tmpl" = "deploy/compose.override.yaml"\n'
+        )
+        subprocess.run(["git", "add", "."], cwd=git_repo, check=True)
+        subprocess.run(["git", "commit", "-m", "Add targets"], cwd=git_repo, check=True)
+
+        result = runner.invoke(app, ["create", "targets"], input="api\n")
+        assert result.exit_code == 0
+        assert result.stdout.count("Enter a value for") == 1
+        assert "Rendered 1 template target(s)" in result.stdout
+
+        worktree_path = git_repo / ".sprout" / "targets"
+        env = (worktree_path / "backend" / ".env").read_text()
+        port = env.split("API_PORT=")[1].split()[0]
+        compose = (worktree_path / "deploy" / "compose.override.yaml").read_text()
+        assert compose == f'services:\n  api:\n    ports: ["{port}:8000"]'
+
+    def test_block_mode_reuses_ports_for_recreated_branch(self, git_repo, monkeypatch):  # noqa: F811
+        """Test block mode assigns contiguous ports that survive rm and recreate."""
+        git_repo, default_branch = git_repo
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv("API_KEY", "test_key")
+        (git_repo / ".sprout.toml").write_text('[ports]\nmode = "block"\nblock_size = 20\n')
+
+        def read_ports(branch):
+            content = (git_repo / ".sprout" / branch / ".env").read_text()
+            return [
+                int(line.split("=")[1])
+                for line in content.splitlines()
+                if line.startswith(("WEB_PORT=", "DB_PORT="))
+            ]
+
+        result = runner.invoke(app, ["create", "block-branch"])
+        assert result.exit_code == 0
+        ports = read_ports("block-branch")
+        assert ports[1] > ports[0]
+        assert ports[1] - ports[0] < 20
+
+        result = runner.invoke(app, ["rm", "block-branch"], input="y\nn\n")
+        assert result.exit_code == 0
+        result = runner.invoke(app, ["create", "block-branch"])
+        assert result.exit_code == 0
+        assert read_ports("block-branch") == ports
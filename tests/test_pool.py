@@ -0,0 +1,114 @@
+"""Tests for the pool of pre-populated worktrees."""
+
+import pytest
+
+from sprout.config import CheckoutConfig
+from sprout.pool import (
+    POOL_DIRNAME,
+    PoolState,
+    claim_slot,
+    clear_pool,
+    fill_pool,
+    slot_path,
+)
+
+
+@pytest.fixture
+def repo(make_repo, monkeypatch):
+    """Repository with one commit and a .sprout directory, as the working directory."""
+    root = make_repo()
+    monkeypatch.chdir(root)
+    return root
+
+
+class TestPoolState:
+    """Test the on-disk list of ready worktrees."""
+
+    def test_round_trip(self, tmp_path):
+        """Test slots survive a save and load."""
+        state = PoolState.open(tmp_path)
+        state.slots.append({"name": "abc", "head": "0" * 40})
+        state.size = 3
+        state.save()
+
+        reloaded = PoolState.open(tmp_path)
+        assert reloaded.slots == [{"name": "abc", "head": "0" * 40}]
+        assert reloaded.size == 3
+
+    @pytest.mark.parametrize("content", ["not json", '{"version": 99, "slots": []}', "[]"])
+    def test_unreadable_state_is_empty(self, tmp_path, content):
+        """Test a corrupt or unknown state file is treated as an empty pool."""
+        (tmp_path / ".pool.json").write_text(content)
+
+        assert PoolState.open(tmp_path).slots == []
+
+
+class TestPool:
+    """Test filling, claiming and clearing the pool."""
+
+    def test_fill_creates_detached_worktrees_up_to_size(self, repo, git):
+        """Test fill adds populated detached worktrees until the pool is full."""
+        sprout_dir = repo / ".sprout"
+        head = git("rev-parse", "HEAD", cwd=repo).stdout.strip()
+
+        added = fill_pool(sprout_dir, 2, CheckoutConfig())
+
+        assert len(added) == 2
+        for slot in added:
+            path = slot_path(sprout_dir, slot)
+            assert slot["head"] == head
+            assert (path / "README.md").read_text() == "# Test\n"
+            assert git("status", "--porcelain", cwd=path).stdout == ""
+            assert git("rev-parse", "--abbrev-ref", "HEAD", cwd=path).stdout.strip() == "HEAD"
+        assert PoolState.open(sprout_dir).slots == added
+        assert PoolState.open(sprout_dir).size == 2
+
+        # A full pool stays as it is; a bigger size adds the difference
+        assert fill_pool(sprout_dir, 2, CheckoutConfig()) == []
+        assert len(fill_pool(sprout_dir, 3, CheckoutConfig())) == 1
+
+    def test_claim_moves_oldest_worktree(self, repo, git):
+        """Test claim moves the first ready worktree to the destination."""
+        sprout_dir = repo / ".sprout"
+        first, second = fill_pool(sprout_dir, 2, CheckoutConfig())
+        destination = sprout_dir / "feature" / "login"
+
+        assert claim_slot(sprout_dir, destination) == first
+
+        assert (destination / "README.md").exists()
+        assert not slot_path(sprout_dir, first).exists()
+        assert PoolState.open(sprout_dir).slots == [second]
+        worktrees = git("worktree", "list", "--porcelain", cwd=repo).stdout
+        assert f"worktree {destination}\n" in worktrees
+
+    def test_claim_from_empty_pool(self, repo):
+        """Test claim returns None without touching an empty pool."""
+        sprout_dir = repo / ".sprout"
+
+        assert claim_slot(sprout_dir, sprout_dir / "feature") is None
+        assert not (sprout_dir / ".pool.lock").exists()
+
+    def test_claim_skips_removed_worktrees(self, repo, git):
+        """Test worktrees deleted from the pool directory are dropped from the list."""
+        sprout_dir = repo / ".sprout"
+        first, second = fill_pool(sprout_dir, 2, CheckoutConfig())
+        git("worktree", "remove", str(slot_path(sprout_dir, first)), cwd=repo)
+
+        assert claim_slot(sprout_dir, sprout_dir / "feature") == second
+        assert PoolState.open(sprout_dir).slots == []
+
+    def test_clear_removes_listed_and_leftover_worktrees(self, repo, git):
+        """Test clear removes every pooled worktree, including unlisted leftovers."""
+        sprout_dir = repo / ".sprout"
+        fill_pool(sprout_dir, 1, CheckoutConfig())
+        # Left behind by a fill that was interrupted before the worktree was listed
+        leftover = sprout_dir / POOL_DIRNAME / "leftover"
+        git("worktree", "add", "--detach", str(leftover), cwd=repo)
+
+        assert clear_pool(sprout_dir) == 2
+
+        assert list((sprout_dir / POOL_DIRNAME).iterdir()) == []
+        assert PoolState.open(sprout_dir).slots == []
+        assert PoolState.open(sprout_dir).size is None
+        worktrees = git("worktree", "list", "--porcelain", cwd=repo).stdout
+        assert POOL_DIRNAME not in worktrees
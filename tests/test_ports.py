@@ -0,0 +1,557 @@
+"""Tests for port bookkeeping."""
+
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from unittest.mock import Mock
+
+import pytest
+
+from sprout.exceptions import SproutError
+from sprout.ports import (
+    LEDGER_FILENAME,
+    PortBitmap,
+    PortLeases,
+    PortLedger,
+    PortSession,
+    extract_ports,
+    kernel_assigned_port,
+    parse_auto_port_args,
+    parse_port_range,
+    read_bound_ports,
+    scan_env_ports,
+)
+
+
+class TestScanEnvPorts:
+    """Test scanning of generated .env files."""
+
+    def test_extract_ports(self):
+        """Test extract_ports keeps only values in the valid port range."""
+        content = "WEB_PORT=8080\nSMALL=80\nBIG=99999\nNAME=abc\nDB_PORT=5432"
+        assert extract_ports(content) == {8080, 5432}
+
+    def test_scan_groups_ports_by_worktree(self, tmp_path):
+        """Test scan_env_ports attributes nested .env files to their worktree."""
+        (tmp_path / "branch1" / "service-a").mkdir(parents=True)
+        (tmp_path / "branch1" / ".env").write_text("PORT1=8080")
+        (tmp_path / "branch1" / "service-a" / ".env").write_text("PORT2=8081")
+        (tmp_path / "branch2").mkdir()
+        (tmp_path / "branch2" / ".env").write_text("PORT3=8082")
+
+        assert scan_env_ports(tmp_path) == {"branch1": {8080, 8081}, "branch2": {8082}}
+
+    def test_scan_uses_worktree_root_for_nested_branches(self, tmp_path):
+        """Test branches containing slashes are owned by their full worktree path."""
+        worktree = tmp_path / "feature" / "login"
+        (worktree / "api").mkdir(parents=True)
+        (worktree / ".git").write_text("gitdir: /somewhere")
+        (worktree / "api" / ".env").write_text("API_PORT=9000")
+
+        assert scan_env_ports(tmp_path) == {"feature/login": {9000}}
+
+    def test_scan_skips_dot_directories(self, tmp_path):
+        """Test sprout's own bookkeeping directories are not scanned."""
+        (tmp_path / ".cache").mkdir()
+        (tmp_path / ".cache" / "old.env").write_text("PORT=8080")
+
+        assert scan_env_ports(tmp_path) == {}
+
+    def test_scan_targets_only_template_directories(self, tmp_path, mocker):
+        """Test explicit template directories bound the scan to those .env files."""
+        for branch in ("main-wt", "feature/login"):
+            (tmp_path / branch / "api").mkdir(parents=True)
+            (tmp_path / branch / ".git").touch()
+            (tmp_path / branch / "api" / ".env").write_text("API_PORT=9000")
+            (tmp_path / branch / "node_modules").mkdir()
+            (tmp_path / branch / "node_modules" / ".env").write_text("PORT=9999")
+        (tmp_path / "feature" / "login" / ".env").write_text("PORT=8000")
+        rglob = mocker.spy(type(tmp_path), "rglob")
+
+        scanned = scan_env_ports(tmp_path, env_dirs=[".", "api"])
+
+        assert scanned == {"feature/login": {8000, 9000}, "main-wt": {9000}}
+        rglob.assert_not_called()
+
+    def test_scan_targets_skip_dot_directories(self, tmp_path):
+        """Test the targeted scan never enters sprout's own dot-directories."""
+        (tmp_path / ".cache" / "wt").mkdir(parents=True)
+        (tmp_path / ".cache" / "wt" / ".git").touch()
+        (tmp_path / ".cache" / "wt" / ".env").write_text("PORT=8080")
+
+        assert scan_env_ports(tmp_path, env_dirs=["."]) == {}
+
+
+class TestPortLedger:
+    """Test the on-disk port ledger."""
+
+    def test_open_rebuilds_missing_ledger(self, tmp_path):
+        """Test opening without a ledger rescans existing worktrees once and persists."""
+        (tmp_path / "branch1").mkdir()
+        (tmp_path / "branch1" / ".env").write_text("WEB_PORT=8080\nDB_PORT=5432")
+
+        ledger = PortLedger.open(tmp_path)
+
+        assert ledger.ports() == {8080, 5432}
+        assert ledger.port_owners(8080) == {"branch1"}
+        data = json.loads((tmp_path / LEDGER_FILENAME).read_text())
+        assert data["ports"] == {"5432": ["branch1"], "8080": ["branch1"]}
+
+    def test_open_reads_existing_ledger_without_scanning(self, tmp_path, mocker):
+        """Test an existing ledger is used as-is."""
+        PortLedger(tmp_path / LEDGER_FILENAME, {3000: {"feature"}}).save()
+        scan = mocker.patch("sprout.ports.scan_env_ports")
+
+        ledger = PortLedger.open(tmp_path)
+
+        assert ledger.ports() == {3000}
+        assert ledger.port_owners(3000) == {"feature"}
+        scan.assert_not_called()
+
+    def test_open_rebuilds_corrupt_ledger(self, tmp_path):
+        """Test an unreadable ledger is replaced by a rebuilt one."""
+        (tmp_path / LEDGER_FILENAME).write_text("{not json")
+        (tmp_path / "branch1").mkdir()
+        (tmp_path / "branch1" / ".env").write_text("PORT=4000")
+
+        assert PortLedger.open(tmp_path).ports() == {4000}
+
+    def test_claim_and_release(self, tmp_path):
+        """Test claiming and releasing ports persists ownership changes."""
+        ledger = PortLedger.open(tmp_path)
+        ledger.claim("feature-a", {8000, 8001})
+        ledger.claim("feature-b", {9000})
+
+        reloaded = PortLedger.open(tmp_path)
+        assert reloaded.owners() == {"feature-a": {8000, 8001}, "feature-b": {9000}}
+
+        assert reloaded.release("feature-a") == {8000, 8001}
+        assert PortLedger.open(tmp_path).ports() == {9000}
+
+    def test_shared_port_is_kept_until_last_owner_goes(self, tmp_path):
+        """Test a fixed port used by several worktrees stays taken until all are removed."""
+        for branch in ("feat1", "feat2"):
+            (tmp_path / branch / "backend").mkdir(parents=True)
+            (tmp_path / branch / ".git").write_text("gitdir: elsewhere")
+            (tmp_path / branch / "backend" / ".env").write_text("DB_PORT=5432")
+
+        ledger = PortLedger.open(tmp_path, env_dirs=["backend"])
+        assert ledger.port_owners(5432) == {"feat1", "feat2"}
+        assert ledger.ports_of_others("feat1") == {5432}
+
+        ledger.release("feat2")
+        assert PortLedger.open(tmp_path).ports_for("feat1") == {5432}
+
+        ledger.claim("feat1", set())
+        assert PortLedger.open(tmp_path).ports() == set()
+
+    def test_open_reads_single_owner_ledger(self, tmp_path, mocker):
+        """Test a ledger written with one owner per port (version 1) is still read."""
+        (tmp_path / LEDGER_FILENAME).write_text(
+            json.dumps({"version": 1, "ports": {"3000": "feature"}, "blocks": {}})
+        )
+        scan = mocker.patch("sprout.ports.scan_env_ports")
+
+        assert PortLedger.open(tmp_path).port_owners(3000) == {"feature"}
+        scan.assert_not_called()
+
+    def test_claim_replaces_previous_ports(self, tmp_path):
+        """Test claim records the worktree's complete port set."""
+        ledger = PortLedger.open(tmp_path)
+        ledger.claim("feature", {8000, 8001})
+        ledger.claim("feature", {8001, 8002})
+
+        assert PortLedger.open(tmp_path).ports_for("feature") == {8001, 8002}
+
+    def test_assign_block_is_deterministic(self, tmp_path):
+        """Test the same branch gets the same block back after release."""
+        ledger = PortLedger.open(tmp_path)
+        block = ledger.assign_block("feature", 20, (10000, 10999))
+        assert len(block) == 20
+        assert 10000 <= block[0] and block[-1] <= 10999
+        assert (block[0] - 10000) % 20 == 0
+        ledger.claim("feature", {block[0]})
+
+        reloaded = PortLedger.open(tmp_path)
+        assert reloaded.block_for("feature") == block
+        reloaded.release("feature")
+        assert reloaded.block_for("feature") is None
+        assert PortLedger.open(tmp_path).assign_block("feature", 20, (10000, 10999)) == block
+
+    def test_assign_block_probes_past_taken_blocks(self, tmp_path):
+        """Test colliding blocks are resolved by linear probing."""
+        ledger = PortLedger.open(tmp_path)
+        # Two blocks fit in the range, so the second branch must take the other one
+        first = ledger.assign_block("branch-a", 10, (20000, 20019))
+        second = ledger.assign_block("branch-b", 10, (20000, 20019))
+
+        assert {first[0], second[0]} == {20000, 20010}
+        with pytest.raises(SproutError, match="No free block"):
+            ledger.assign_block("branch-c", 10, (20000, 20019))
+
+    def test_assign_block_avoids_ports_of_other_worktrees(self, tmp_path):
+        """Test blocks containing ports owned by another worktree are skipped."""
+        ledger = PortLedger(tmp_path / LEDGER_FILENAME, {20005: {"other"}})
+
+        assert ledger.assign_block("feature", 10, (20000, 20019)) == range(20010, 20020)
+
+    def test_verify_reports_drift(self, tmp_path):
+        """Test verify compares the ledger with the .env files on disk."""
+        (tmp_path / "branch1").mkdir()
+        (tmp_path / "branch1" / ".env").write_text("PORT=8080\nOTHER=8081")
+        ledger = PortLedger(tmp_path / LEDGER_FILENAME, {8080: {"branch1"}, 7000: {"gone"}})
+
+        assert ledger.verify() == {"untracked": {8081}, "stale": {7000}}
+
+    def test_verify_against_earlier_scan(self, tmp_path, mocker):
+        """Test verify compares with a given scan instead of reading the files again."""
+        scan = mocker.patch("sprout.ports.scan_env_ports")
+        ledger = PortLedger(tmp_path / LEDGER_FILENAME, {8080: {"branch1"}})
+
+        assert ledger.verify(scanned={"branch1": {8080, 8081}}) == {
+            "untracked": {8081},
+            "stale": set(),
+        }
+        scan.assert_not_called()
+
+
+class TestPortSession:
+    """Test the per-operation port allocation session."""
+
+    def test_used_ports_loaded_once(self, mocker):
+        """Test the used-port snapshot is loaded a single time per session."""
+        load = Mock(return_value={8080})
+        session = PortSession(load, probe=lambda port: True, load_bound_ports=set)
+        mocker.patch("random.randint", side_effect=[8080, 8081, 8082, 8083])
+
+        assert [session.allocate() for _ in range(3)] == [8081, 8082, 8083]
+        load.assert_called_once()
+        assert session.rescans == 1
+        assert session.probes == 3
+        assert session.reserved == {8081, 8082, 8083}
+
+    def test_allocate_skips_reserved_ports(self, mocker):
+        """Test ports reserved earlier in the session are never handed out again."""
+        session = PortSession(set, probe=lambda port: True, load_bound_ports=set)
+        session.reserve({5432})
+        mocker.patch("random.randint", side_effect=[5432, 5432, 6000])
+
+        assert session.allocate() == 6000
+        assert session.probes == 1
+
+    def test_allocate_named_port_once(self, mocker):
+        """Test a named allocation returns the same port every time it is requested."""
+        session = PortSession(set, probe=lambda port: True, load_bound_ports=set)
+        mocker.patch("random.randint", side_effect=[5000, 6000])
+
+        assert session.allocate(name="api") == 5000
+        assert session.allocate(name="api") == 5000
+        assert session.allocate() == 6000
+        assert session.named == {"api": 5000}
+        assert session.reserved == {5000, 6000}
+
+    def test_session_shared_between_threads(self):
+        """Test concurrent allocations from one session never return the same port."""
+        session = PortSession(
+            set, probe=lambda port: True, load_bound_ports=set, block=range(20000, 20040)
+        )
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            ports = list(executor.map(lambda _: session.allocate(), range(40)))
+
+        assert sorted(ports) == list(range(20000, 20040))
+        assert session.reserved == set(ports)
+
+    def test_allocate_skips_unavailable_ports(self, mocker):
+        """Test ports failing the probe are skipped."""
+        session = PortSession(set, probe=lambda port: port != 7000, load_bound_ports=set)
+        mocker.patch("random.randint", side_effect=[7000, 7001])
+
+        assert session.allocate() == 7001
+        assert session.probes == 2
+
+    def test_allocate_fills_block_in_order(self, mocker):
+        """Test block allocation hands out the block's ports in order."""
+        session = PortSession(
+            lambda: {20001},
+            probe=lambda port: port != 20003,
+            load_bound_ports=lambda: {20002},
+            load_ephemeral_range=lambda: (32768, 60999),
+            block=range(20000, 20005),
+        )
+        randint = mocker.patch("random.randint", side_effect=[40000, 30000])
+
+        assert [session.allocate() for _ in range(3)] == [20000, 20004, 30000]
+        assert randint.call_count == 2
+
+    def test_allocate_avoids_ephemeral_range(self, mocker):
+        """Test random picks inside the kernel's ephemeral range are rejected."""
+        probe = Mock(return_value=True)
+        session = PortSession(
+            set, probe=probe, load_bound_ports=set, load_ephemeral_range=lambda: (32768, 60999)
+        )
+        mocker.patch("random.randint", side_effect=[32768, 60999, 60000, 61000])
+
+        assert session.allocate() == 61000
+        probe.assert_called_once_with(61000)
+
+    def test_allocate_range_returns_first_free_port(self):
+        """Test ranged allocation returns the lowest free port in the range."""
+        session = PortSession(
+            lambda: set(range(8000, 8100)),
+            probe=lambda port: port != 8100,
+            load_bound_ports=lambda: {8101},
+        )
+
+        assert session.allocate((8000, 8999)) == 8102
+        assert session.allocate((8000, 8999)) == 8103
+
+    def test_allocate_range_ignores_ephemeral_exclusion(self):
+        """Test explicitly requested ranges may lie inside the ephemeral range."""
+        session = PortSession(
+            set,
+            probe=lambda port: True,
+            load_bound_ports=set,
+            load_ephemeral_range=lambda: (32768, 60999),
+        )
+
+        assert session.allocate((40000, 40010)) == 40000
+
+    def test_allocate_range_exhausted(self):
+        """Test ranged allocation fails once every port in the range is taken."""
+        session = PortSession(lambda: {9000, 9001}, probe=lambda port: True, load_bound_ports=set)
+
+        with pytest.raises(SproutError, match="No available port in range 9000-9001"):
+            session.allocate((9000, 9001))
+
+    def test_allocate_falls_back_to_scan(self, mocker):
+        """Test allocation only fails when no port is left, not after unlucky picks."""
+        session = PortSession(
+            lambda: {1024, 1025},
+            probe=lambda port: True,
+            load_bound_ports=set,
+            load_ephemeral_range=lambda: None,
+        )
+        mocker.patch("random.randint", return_value=1024)
+
+        assert session.allocate() == 1026
+
+    def test_allocate_kernel_mode(self):
+        """Test kernel mode takes the kernel's choice, skipping taken ports."""
+        kernel_port = Mock(side_effect=[45000, 45001])
+        session = PortSession(lambda: {45000}, load_bound_ports=set, kernel_port=kernel_port)
+
+        assert session.allocate() == 45001
+        assert session.reserved == {45001}
+
+    def test_allocate_exhausted(self):
+        """Test allocation fails after the maximum number of attempts."""
+        session = PortSession(set, probe=lambda port: False)
+
+        with pytest.raises(SproutError, match="Could not find an available port"):
+            session.allocate()
+
+    def test_allocate_skips_bound_ports_without_probing(self, mocker):
+        """Test candidates bound on the machine are rejected from the snapshot."""
+        probe = Mock(return_value=True)
+        bound = Mock(return_value={7000, 7001})
+        session = PortSession(set, probe=probe, load_bound_ports=bound)
+        mocker.patch("random.randint", side_effect=[7000, 7001, 7002, 7000, 7003])
+
+        assert session.allocate() == 7002
+        assert session.allocate() == 7003
+        probe.assert_has_calls([mocker.call(7002), mocker.call(7003)])
+        assert session.probes == 2
+        bound.assert_called_once()
+
+    def test_allocate_without_bound_port_snapshot(self, mocker):
+        """Test every candidate is probed when the socket tables are unavailable."""
+        session = PortSession(set, probe=lambda port: port == 7001, load_bound_ports=lambda: None)
+        mocker.patch("random.randint", side_effect=[7000, 7001])
+
+        assert session.allocate() == 7001
+        assert session.probes == 2
+
+
+class TestPortBitmap:
+    """Test the 65536-bit port bitmap."""
+
+    def test_membership(self):
+        """Test ports can be added and queried."""
+        bitmap = PortBitmap({80, 65535})
+        bitmap.add(8080)
+
+        assert 80 in bitmap
+        assert 8080 in bitmap
+        assert 65535 in bitmap
+        assert 81 not in bitmap
+        assert 70000 not in bitmap
+
+    def test_first_free_skips_full_words(self):
+        """Test first_free finds the first gap across fully used 64-bit words."""
+        bitmap = PortBitmap(range(8000, 9000))
+        bitmap.update(range(9001, 9100))
+
+        assert bitmap.first_free(8000, 9999) == 9000
+        assert bitmap.first_free(8010, 8999) is None
+        assert bitmap.first_free(9001, 9200) == 9100
+
+    def test_first_free_unaligned_edges(self):
+        """Test ranges that don't start or end on a word boundary."""
+        bitmap = PortBitmap(range(8003, 8070))
+
+        assert bitmap.first_free(8003, 8069) is None
+        assert bitmap.first_free(8003, 8070) == 8070
+        assert bitmap.first_free(8001, 8070) == 8001
+
+
+class TestPortHelpers:
+    """Test small port helpers."""
+
+    def test_parse_port_range(self):
+        """Test START-END ranges are parsed."""
+        assert parse_port_range("8000-8999") == (8000, 8999)
+
+    @pytest.mark.parametrize("spec", ["8000", "9000-8000", "1-70000", "a-b", "1-2-3"])
+    def test_parse_port_range_invalid(self, spec):
+        """Test malformed or out of bounds ranges are rejected."""
+        with pytest.raises(SproutError, match="Invalid port range"):
+            parse_port_range(spec)
+
+    @pytest.mark.parametrize(
+        ("args", "expected"),
+        [
+            ("", (None, None)),
+            ('"api"', ("api", None)),
+            ("'db'", ("db", None)),
+            ("8000-8999", (None, (8000, 8999))),
+            ('"api", 8000-8999', ("api", (8000, 8999))),
+        ],
+    )
+    def test_parse_auto_port_args(self, args, expected):
+        """Test auto_port() accepts an optional name and an optional range."""
+        assert parse_auto_port_args(args) == expected
+
+    @pytest.mark.parametrize("args", ['""', '"a", "b"', "8000-8001, 9000-9001", "api"])
+    def test_parse_auto_port_args_invalid(self, args):
+        """Test malformed auto_port() arguments are rejected."""
+        with pytest.raises(SproutError, match="Invalid"):
+            parse_auto_port_args(args)
+
+    def test_kernel_assigned_port(self):
+        """Test the kernel hands out a non-privileged port."""
+        assert 1024 <= kernel_assigned_port() <= 65535
+
+
+class TestReadBoundPorts:
+    """Test parsing of the kernel socket tables."""
+
+    HEADER = "  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt\n"
+
+    def test_read_bound_ports(self, tmp_path):
+        """Test ports are collected from every tcp/udp table."""
+        (tmp_path / "tcp").write_text(
+            self.HEADER + "   0: 0100007F:1F90 00000000:0000 0A 00000000:00000000 00:00000000\n"
+        )
+        (tmp_path / "tcp6").write_text(
+            self.HEADER
+            + "   0: 00000000000000000000000000000000:0BB8 "
+            + "00000000000000000000000000000000:0000 0A\n"
+        )
+        (tmp_path / "udp").write_text(self.HEADER + "   5: 00000000:14E9 00000000:0000 07\n")
+
+        assert read_bound_ports(tmp_path) == {8080, 3000, 5353}
+
+    def test_read_bound_ports_unavailable(self, tmp_path):
+        """Test None is returned when no socket table can be read."""
+        assert read_bound_ports(tmp_path / "missing") is None
+
+
+def _allocate_with_leases(sprout_dir, owner):
+    """Allocate ports from a shared range in a separate process."""
+    session = PortSession(
+        set,
+        probe=lambda port: True,
+        load_bound_ports=set,
+        leases=PortLeases(sprout_dir, owner),
+    )
+    return [session.allocate((30000, 30999)) for _ in range(5)]
+
+
+class TestPortLeases:
+    """Test cross-process port leases."""
+
+    def test_acquire_and_release(self, tmp_path):
+        """Test leases are visible to other holders until released."""
+        mine = PortLeases(tmp_path, "feature-a")
+        other = PortLeases(tmp_path, "feature-b")
+
+        with mine.locked():
+            mine.acquire({8000, 8001})
+        with other.locked():
+            assert other.taken_ports() == {8000, 8001}
+            assert mine.taken_ports() == set()
+
+        with mine.locked():
+            mine.release()
+        with other.locked():
+            assert other.taken_ports() == set()
+
+    def test_expired_leases_are_ignored(self, tmp_path):
+        """Test leases left behind by crashed processes expire after the TTL."""
+        now = [1000.0]
+        crashed = PortLeases(tmp_path, "crashed", ttl=60, clock=lambda: now[0])
+        other = PortLeases(tmp_path, "feature", ttl=60, clock=lambda: now[0])
+        with crashed.locked():
+            crashed.acquire({8000})
+
+        assert set(other.load()) == {8000}
+        now[0] += 61
+        assert other.load() == {}
+
+    def test_taken_ports_include_ledger(self, tmp_path):
+        """Test ports claimed in the ledger by other worktrees count as taken."""
+        PortLedger(tmp_path / LEDGER_FILENAME, {9000: {"other"}, 9001: {"feature"}}).save()
+        leases = PortLeases(tmp_path, "feature")
+
+        with leases.locked():
+            assert leases.taken_ports() == {9000}
+
+    def test_taken_ports_rebuild_ledger_from_template_directories(self, tmp_path, mocker):
+        """Test a missing ledger is rebuilt by scanning only the template directories."""
+        (tmp_path / "other" / "api").mkdir(parents=True)
+        (tmp_path / "other" / ".git").touch()
+        (tmp_path / "other" / "api" / ".env").write_text("API_PORT=9000")
+        rglob = mocker.spy(type(tmp_path), "rglob")
+        leases = PortLeases(tmp_path, "feature", env_dirs=["api"])
+
+        with leases.locked():
+            assert leases.taken_ports() == {9000}
+        rglob.assert_not_called()
+
+    def test_session_refreshes_taken_ports_before_allocating(self, tmp_path):
+        """Test a session sees ports leased by another process after its snapshot."""
+        session = PortSession(
+            set,
+            probe=lambda port: True,
+            load_bound_ports=set,
+            leases=PortLeases(tmp_path, "feature-a"),
+        )
+        assert session.allocate((30000, 30999)) == 30000
+
+        other = PortLeases(tmp_path, "feature-b")
+        with other.locked():
+            other.acquire({30001, 30002})
+
+        assert session.allocate((30000, 30999)) == 30003
+        assert set(PortLeases(tmp_path, "feature-c").load()) == {30000, 30001, 30002, 30003}
+
+    def test_parallel_sessions_never_collide(self, tmp_path):
+        """Test concurrent processes allocating from the same range get distinct ports."""
+        with ProcessPoolExecutor(max_workers=4) as pool:
+            futures = [
+                pool.submit(_allocate_with_leases, tmp_path, f"branch-{i}") for i in range(8)
+            ]
+            results = [future.result() for future in futures]
+
+        ports = [port for result in results for port in result]
+        assert len(ports) == len(set(ports)) == 40
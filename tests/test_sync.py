@@ -0,0 +1,125 @@
+"""Tests for incremental template regeneration."""
+
+from pathlib import Path
+
+from sprout.sync import SyncState, line_key, plan_update, template_hash, template_keys
+from sprout.templates import compile_template
+
+
+def plan(template_content, existing, previous_keys=None):
+    tokens = compile_template(template_content)
+    previous = {"hash": "old", "keys": previous_keys} if previous_keys is not None else None
+    return plan_update(Path(".env.example"), Path(".env"), tokens, "new", existing, previous)
+
+
+class TestLineKeys:
+    """Test recognizing KEY=VALUE lines."""
+
+    def test_line_key(self):
+        """Test assignments, exports, comments and plain text."""
+        assert line_key("API_PORT=8080") == "API_PORT"
+        assert line_key("export TOKEN = abc") == "TOKEN"
+        assert line_key("# COMMENTED=1") is None
+        assert line_key("no assignment here") is None
+        assert line_key("a sentence with = sign") is None
+
+    def test_template_keys(self):
+        """Test the keys of a compiled template, in order and without duplicates."""
+        tokens = compile_template("# header\nB={{ auto_port() }}\nA={{ A }}\nB=2")
+
+        assert template_keys(tokens) == ["B", "A"]
+
+
+class TestPlanUpdate:
+    """Test planning updates of rendered files."""
+
+    def test_existing_keys_keep_their_values(self):
+        """Test ports and answers already in the file are kept verbatim."""
+        update = plan("PORT={{ auto_port() }}\nTOKEN={{ TOKEN }}", "PORT=8080\nTOKEN=secret")
+
+        assert update.lines == ["PORT=8080", "TOKEN=secret"]
+        assert update.added == []
+        assert update.state == {"hash": "new", "keys": ["PORT", "TOKEN"]}
+
+    def test_new_keys_are_rendered(self):
+        """Test keys new to the template are left for rendering."""
+        update = plan("PORT={{ auto_port() }}\nDB_PORT={{ auto_port() }}", "PORT=8080")
+
+        assert update.lines[0] == "PORT=8080"
+        assert update.lines[1] == [
+            {"kind": "literal", "text": "DB_PORT=", "default": None},
+            {"kind": "auto_port", "text": "", "default": None},
+        ]
+        assert update.added == ["DB_PORT"]
+
+    def test_removed_and_hand_added_keys(self):
+        """Test keys the template dropped go away while hand-added keys stay."""
+        update = plan(
+            "PORT={{ auto_port() }}", "PORT=8080\nOLD=1\nMINE=x", previous_keys=["PORT", "OLD"]
+        )
+
+        assert update.lines == ["PORT=8080", "MINE=x"]
+        assert update.removed == ["OLD"]
+
+    def test_without_previous_record_extra_keys_are_kept(self):
+        """Test files rendered before sync existed never lose keys."""
+        update = plan("PORT={{ auto_port() }}", "PORT=8080\nOLD=1")
+
+        assert update.lines == ["PORT=8080", "OLD=1"]
+        assert update.removed == []
+
+    def test_placeholder_lines_without_keys_are_kept(self):
+        """Test non-dotenv lines keep their ports while changed lines are rendered again."""
+        template = (
+            'ports:\n  - "{{ auto_port() }}:80"\n  - "{{ auto_port() }}:443"\nname: {{ NAME }}'
+        )
+        existing = 'ports:\n  - "26483:80"\n  - "26484:443"\nname: old'
+
+        update = plan(template, existing)
+
+        assert update.lines[1:4] == ['  - "26483:80"', '  - "26484:443"', "name: old"]
+
+        update = plan(template.replace(":443", ":8443"), existing)
+
+        assert update.lines[1] == '  - "26483:80"'
+        assert not isinstance(update.lines[2], str)
+
+    def test_missing_file_renders_everything(self):
+        """Test a target that doesn't exist yet is rendered in full."""
+        update = plan("A=1\nB={{ B }}", None)
+
+        assert update.added == ["A", "B"]
+        assert all(not isinstance(line, str) for line in update.lines)
+
+
+class TestSyncState:
+    """Test the on-disk sync record."""
+
+    def test_record_save_and_forget(self, tmp_path):
+        """Test worktree records round-trip through the state file."""
+        state = SyncState.open(tmp_path)
+        entry = {"targets": {".env": {"hash": "abc", "keys": ["A"]}}, "named_ports": {"api": 9000}}
+        state.record("feature", entry)
+        state.save()
+
+        reloaded = SyncState.open(tmp_path)
+        assert reloaded.get("feature") == entry
+
+        reloaded.forget("feature")
+        reloaded.save()
+        assert SyncState.open(tmp_path).get("feature") is None
+
+    def test_corrupt_state_is_empty(self, tmp_path):
+        """Test an unreadable state file is treated as empty."""
+        (tmp_path / ".sync.json").write_text("{")
+
+        assert SyncState.open(tmp_path).worktrees == {}
+
+    def test_template_hash(self, tmp_path):
+        """Test the template hash follows the content."""
+        template = tmp_path / ".env.example"
+        template.write_text("A=1")
+        first = template_hash(template)
+        template.write_text("A=2")
+
+        assert template_hash(template) != first
@@ -0,0 +1,198 @@
+"""Tests for template compilation and caching."""
+
+import json
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from sprout.exceptions import SproutError
+from sprout.templates import (
+    compile_template,
+    in_cones,
+    load_template,
+    parse_cones,
+    template_targets,
+)
+
+
+def literal(text):
+    return {"kind": "literal", "text": text, "default": None}
+
+
+class TestCompileTemplate:
+    """Test compiling template content into tokens."""
+
+    def test_compile_placeholders(self):
+        """Test each placeholder kind becomes its own token."""
+        tokens = compile_template(
+            'PORT={{ auto_port("api") | 3000 }}\nNET={{ branch() | main }}\nKEY={{ API_KEY }}'
+        )
+
+        assert tokens == [
+            literal("PORT="),
+            {"kind": "auto_port", "text": '"api"', "default": "3000"},
+            literal("\nNET="),
+            {"kind": "branch", "text": "{{ branch() | main }}", "default": "main"},
+            literal("\nKEY="),
+            {"kind": "variable", "text": "API_KEY", "default": None},
+        ]
+
+    def test_compile_variable_defaults(self):
+        """Test defaults are trimmed and an empty default is kept distinct from none."""
+        tokens = compile_template("A={{  NAME  |  value  }}\nB={{ EMPTY | }}")
+
+        assert tokens[1] == {"kind": "variable", "text": "NAME", "default": "value"}
+        assert tokens[3] == {"kind": "variable", "text": "EMPTY", "default": ""}
+
+    def test_compile_keeps_docker_syntax_literal(self):
+        """Test ${...} references are not placeholders."""
+        content = "COMPOSE=${COMPOSE_PROJECT_NAME:-app}\nPLAIN=value"
+
+        assert compile_template(content) == [literal(content)]
+
+    def test_compile_ignores_malformed_placeholders(self):
+        """Test text that only resembles a placeholder is kept as-is."""
+        content = "A={{ unclosed\nB={{ a } b }}\nC={{ auto_port(x(y)) }}\nD={{ }}\nE=}} {{"
+
+        assert compile_template(content) == [literal(content)]
+
+    def test_compile_uses_innermost_opening_braces(self):
+        """Test stray opening braces before a placeholder stay literal."""
+        assert compile_template("A={{ {{ KEY }}") == [
+            literal("A={{ "),
+            {"kind": "variable", "text": "KEY", "default": None},
+        ]
+
+    def test_compile_normalizes_line_endings(self):
+        """Test lines are joined with newlines and the trailing newline is dropped."""
+        assert compile_template("A=1\r\nB=2\n") == [literal("A=1\nB=2")]
+
+
+class TestTokenizerPerformance:
+    """Benchmark the tokenizer on pathological input."""
+
+    @pytest.mark.parametrize(
+        "content",
+        [
+            "{{" * 500_000,
+            "A=" + "{{ auto_port(" * 80_000,
+            "{{ " * 300_000 + "KEY }}",
+            "{{ a }" * 200_000 + "}}",
+            "{{ X | " + "|" * 1_000_000,
+        ],
+        ids=["unclosed", "unclosed-auto-port", "one-close", "stray-close", "long-default"],
+    )
+    def test_compile_is_linear_on_malformed_lines(self, content):
+        """Test a ~1 MB malformed line compiles in well under a second."""
+        started = time.perf_counter()
+        tokens = compile_template(content)
+        elapsed = time.perf_counter() - started
+
+        assert "".join(token["text"] for token in tokens if token["kind"] == "literal")
+        assert elapsed < 1.0
+
+
+class TestLoadTemplate:
+    """Test the compiled template cache."""
+
+    def test_cache_hit_skips_parsing(self, tmp_path, mocker):
+        """Test an unchanged template is loaded from the cache."""
+        template = tmp_path / ".env.example"
+        template.write_text("KEY={{ API_KEY }}")
+        cache_dir = tmp_path / ".cache"
+
+        tokens = load_template(template, cache_dir)
+        assert len(list(cache_dir.iterdir())) == 1
+
+        compile_spy = mocker.patch("sprout.templates.compile_template")
+        assert load_template(template, cache_dir) == tokens
+        compile_spy.assert_not_called()
+
+    def test_cache_invalidated_by_modification(self, tmp_path):
+        """Test changing the template recompiles it."""
+        template = tmp_path / ".env.example"
+        template.write_text("KEY={{ API_KEY }}")
+        cache_dir = tmp_path / ".cache"
+        load_template(template, cache_dir)
+
+        template.write_text("KEY={{ OTHER_KEY }}")
+        stat = template.stat()
+        os.utime(template, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+        assert load_template(template, cache_dir)[1]["text"] == "OTHER_KEY"
+
+    def test_corrupt_cache_is_ignored(self, tmp_path):
+        """Test an unreadable cache entry is replaced."""
+        template = tmp_path / ".env.example"
+        template.write_text("KEY={{ API_KEY }}")
+        cache_dir = tmp_path / ".cache"
+        load_template(template, cache_dir)
+        (cache_file,) = cache_dir.iterdir()
+        cache_file.write_text("not json")
+
+        assert load_template(template, cache_dir)[1]["text"] == "API_KEY"
+        assert json.loads(cache_file.read_text())["tokens"][1]["text"] == "API_KEY"
+
+    def test_missing_template(self, tmp_path):
+        """Test a missing template raises SproutError."""
+        with pytest.raises(SproutError, match="not found"):
+            load_template(tmp_path / ".env.example", tmp_path / ".cache")
+
+
+class TestTemplateTargets:
+    """Test pairing templates with the files they render to."""
+
+    def test_env_examples_and_configured_targets(self, tmp_path):
+        """Test .env.example files render next to themselves and targets where configured."""
+        (tmp_path / "api").mkdir()
+        (tmp_path / "api" / ".env.example").touch()
+        (tmp_path / "compose.override.yaml.tmpl").touch()
+
+        pairs = template_targets(
+            tmp_path,
+            [tmp_path / "api" / ".env.example"],
+            [("compose.override.yaml.tmpl", "compose.override.yaml")],
+        )
+
+        assert pairs == [
+            (tmp_path / "api" / ".env.example", Path("api/.env")),
+            (tmp_path / "compose.override.yaml.tmpl", Path("compose.override.yaml")),
+        ]
+
+    def test_missing_source(self, tmp_path):
+        """Test a configured source that doesn't exist raises SproutError."""
+        with pytest.raises(SproutError, match="Template source not found"):
+            template_targets(tmp_path, [], [("missing.tmpl", "out")])
+
+
+class TestSparseCones:
+    """Test selecting templates for sparse checkouts."""
+
+    def test_parse_cones(self):
+        """Test directories are split, trimmed and deduplicated."""
+        assert parse_cones(" backend/, shared,,backend") == ["backend", "shared"]
+
+    @pytest.mark.parametrize("value", ["", " , ", "../other", "backend/../.."])
+    def test_parse_invalid_cones(self, value):
+        """Test empty lists and paths leaving the repository are rejected."""
+        with pytest.raises(SproutError):
+            parse_cones(value)
+
+    @pytest.mark.parametrize(
+        ("path", "expected"),
+        [
+            (".env", True),
+            ("backend/.env", True),
+            ("backend/api/deep/.env", True),
+            ("services/.env", True),
+            ("services/auth/.env", True),
+            ("services/billing/.env", False),
+            ("web/.env", False),
+            ("backend-old/.env", False),
+        ],
+    )
+    def test_in_cones(self, path, expected):
+        """Test cone mode includes root files, cone contents and files of parent directories."""
+        assert in_cones(Path(path), ["backend", "services/auth"]) is expected
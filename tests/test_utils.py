@@ -17,6 +17,7 @@ from sprout.utils import (
     is_git_repository,
     is_port_available,
     parse_env_template,
+    prompt_for_variables,
     run_command,
     worktree_exists,
 )
@@ -28,50 +29,71 @@ class TestGitUtils:
     def test_is_git_repository_true(self, mocker):
         """Test is_git_repository returns True in a git repo."""
         mock_run = mocker.patch("subprocess.run")
-        mock_run.return_value = Mock(returncode=0)
+        mock_run.return_value = Mock(returncode=0, stdout=".git\n.git\n/home/user/project\n")
 
         assert is_git_repository() is True
         mock_run.assert_called_once_with(
-            ["git", "rev-parse", "--git-dir"],
+            ["git", "rev-parse", "--git-dir", "--git-common-dir", "--show-toplevel"],
             capture_output=True,
             text=True,
             check=False,
+            cwd=Path.cwd(),
         )
 
     def test_is_git_repository_false(self, mocker):
         """Test is_git_repository returns False outside a git repo."""
         mock_run = mocker.patch("subprocess.run")
-        mock_run.return_value = Mock(returncode=1)
+        mock_run.return_value = Mock(returncode=128, stdout="")
 
         assert is_git_repository() is False
 
     def test_get_git_root_success(self, mocker):
         """Test get_git_root returns the repository root."""
-        mocker.patch("sprout.utils.is_git_repository", return_value=True)
         mock_run = mocker.patch("subprocess.run")
-        mock_run.return_value = Mock(returncode=0, stdout="/home/user/project\n")
+        mock_run.return_value = Mock(returncode=0, stdout=".git\n.git\n/home/user/project\n")
 
         root = get_git_root()
         assert root == Path("/home/user/project")
 
     def test_get_git_root_not_in_repo(self, mocker):
         """Test get_git_root raises error when not in a repo."""
-        mocker.patch("sprout.utils.is_git_repository", return_value=False)
+        mock_run = mocker.patch("subprocess.run")
+        mock_run.return_value = Mock(returncode=128, stdout="")
 
         with pytest.raises(SproutError, match="Not in a git repository"):
             get_git_root()
 
+    def test_git_context_is_discovered_once(self, mocker):
+        """Test repeated lookups share one rev-parse call."""
+        mock_run = mocker.patch("subprocess.run")
+        mock_run.return_value = Mock(
+            returncode=0,
+            stdout="/home/user/project/.git/worktrees/feature\n/home/user/project/.git\n"
+            "/home/user/project/.sprout/feature\n",
+        )
+
+        from sprout.git import get_git_context
+        from sprout.utils import get_sprout_dir
+
+        assert is_git_repository() is True
+        assert get_git_root() == Path("/home/user/project/.sprout/feature")
+        assert get_sprout_dir() == Path("/home/user/project/.sprout/feature/.sprout")
+        context = get_git_context()
+        assert context is not None
+        assert context.common_dir == Path("/home/user/project/.git")
+        mock_run.assert_called_once()
+
     def test_branch_exists_true(self, mocker):
         """Test branch_exists returns True for existing branch."""
-        mock_run = mocker.patch("sprout.utils.run_command")
-        mock_run.return_value = Mock(returncode=0)
+        mock_refs = mocker.patch("sprout.utils.refs_exist")
+        mock_refs.return_value = {"refs/heads/main": True}
 
         assert branch_exists("main") is True
+        mock_refs.assert_called_once_with(["refs/heads/main"])
 
     def test_branch_exists_false(self, mocker):
         """Test branch_exists returns False for non-existing branch."""
-        mock_run = mocker.patch("sprout.utils.run_command")
-        mock_run.return_value = Mock(returncode=1)
+        mocker.patch("sprout.utils.refs_exist", return_value={"refs/heads/nonexistent": False})
 
         assert branch_exists("nonexistent") is False
 
@@ -82,12 +104,15 @@ class TestPortUtils:
     def test_get_used_ports(self, tmp_path, mocker):
         """Test get_used_ports extracts ports from .env files."""
         mocker.patch("sprout.utils.get_sprout_dir", return_value=tmp_path)
+        mocker.patch("sprout.utils.get_env_dirs", return_value=["."])
 
         # Create test .env files
         (tmp_path / "branch1").mkdir()
+        (tmp_path / "branch1" / ".git").touch()
         (tmp_path / "branch1" / ".env").write_text("WEB_PORT=8080\nDB_PORT=5432\nNOT_A_PORT=abc")
 
         (tmp_path / "branch2").mkdir()
+        (tmp_path / "branch2" / ".git").touch()
         (tmp_path / "branch2" / ".env").write_text("API_PORT=3000")
 
         ports = get_used_ports()
@@ -151,6 +176,46 @@ class TestEnvTemplateParser:
         result = parse_env_template(template)
         assert result == "WEB_PORT=8080\nAPI_PORT=3000"
 
+    def test_parse_env_template_auto_port_range(self, tmp_path):
+        """Test {{ auto_port(START-END) }} returns the first free port in the range."""
+        from sprout.ports import PortSession
+
+        session = PortSession(lambda: {8000}, probe=lambda port: True, load_bound_ports=set)
+
+        template = tmp_path / ".env.example"
+        template.write_text(
+            "WEB_PORT={{ auto_port(8000-8999) }}\nAPI_PORT={{ auto_port( 8000 - 8999 ) | 80 }}"
+        )
+
+        result = parse_env_template(template, session=session)
+        assert result == "WEB_PORT=8001\nAPI_PORT=8002"
+
+    def test_parse_env_template_auto_port_invalid_range(self, tmp_path):
+        """Test malformed auto_port() arguments are reported."""
+        template = tmp_path / ".env.example"
+        template.write_text("WEB_PORT={{ auto_port(9000-8000) }}")
+
+        with pytest.raises(SproutError, match="Invalid port range"):
+            parse_env_template(template)
+
+    def test_parse_env_template_auto_port_with_session(self, tmp_path, mocker):
+        """Test auto_port() allocates from a shared session without rescanning."""
+        from sprout.ports import PortSession
+
+        get_used_ports = mocker.patch("sprout.utils.get_used_ports")
+        session = PortSession(lambda: {8080}, probe=lambda port: True, load_bound_ports=set)
+        mocker.patch("random.randint", side_effect=[8080, 9000, 9000, 9001])
+
+        first = tmp_path / "a.env.example"
+        first.write_text("WEB_PORT={{ auto_port() }}")
+        second = tmp_path / "b.env.example"
+        second.write_text("API_PORT={{ auto_port() }}")
+
+        assert parse_env_template(first, session=session) == "WEB_PORT=9000"
+        assert parse_env_template(second, session=session) == "API_PORT=9001"
+        get_used_ports.assert_not_called()
+        assert session.rescans == 1
+
     def test_parse_env_template_variable_from_env(self, tmp_path, mocker):
         """Test parsing {{ VARIABLE }} from environment."""
         mocker.patch.dict(os.environ, {"API_KEY": "secret123"})
@@ -196,6 +261,62 @@ class TestEnvTemplateParser:
         result = parse_env_template(template, branch_name=None)
         assert result == "BRANCH={{ branch() }}"
 
+    def test_parse_env_template_does_not_rescan_output(self, tmp_path, mocker):
+        """Test values substituted into the template are never parsed again."""
+        mocker.patch.dict(os.environ, {"GREETING": "{{ SECRET }}"})
+        mock_input = mocker.patch("sprout.utils.console.input")
+        template = tmp_path / ".env.example"
+        template.write_text("A={{ GREETING }}\nB={{ branch() }}")
+
+        result = parse_env_template(template, branch_name="{{ OTHER }}")
+
+        assert result == "A={{ SECRET }}\nB={{ OTHER }}"
+        mock_input.assert_not_called()
+
+    def test_prompt_for_variables_deduplicates(self, tmp_path, mocker):
+        """Test each unresolved variable is asked for once across all templates."""
+        mocker.patch.dict(os.environ, {"FROM_ENV": "set"})
+        mock_input = mocker.patch("sprout.utils.console.input", side_effect=["s3cret", "db"])
+        first = tmp_path / "a.env.example"
+        first.write_text("A={{ SECRET }}\nB={{ FROM_ENV }}\nC={{ WITH_DEFAULT | x }}")
+        second = tmp_path / "b.env.example"
+        second.write_text("A={{ SECRET }}\nD={{ DB_NAME }}")
+
+        values = prompt_for_variables([first, second])
+
+        assert values == {"SECRET": "s3cret", "DB_NAME": "db"}
+        assert mock_input.call_count == 2
+
+    def test_prompt_for_variables_skips_known_values(self, tmp_path, mocker):
+        """Test variables with a known value are not asked for."""
+        mock_input = mocker.patch("sprout.utils.console.input", return_value="db")
+        template = tmp_path / ".env.example"
+        template.write_text("A={{ SECRET }}\nB={{ DB_NAME }}")
+
+        assert prompt_for_variables([template], known={"SECRET": "s3cret"}) == {"DB_NAME": "db"}
+        mock_input.assert_called_once()
+
+    def test_parse_env_template_uses_collected_values(self, tmp_path, mocker):
+        """Test collected values are used without prompting, after defaults."""
+        mock_input = mocker.patch("sprout.utils.console.input")
+        template = tmp_path / ".env.example"
+        template.write_text("A={{ SECRET }}\nB={{ SECRET | fallback }}")
+
+        result = parse_env_template(template, answers={"SECRET": "s3cret"})
+
+        assert result == "A=s3cret\nB=fallback"
+        mock_input.assert_not_called()
+
+    def test_parse_env_template_values_override_defaults(self, tmp_path, mocker):
+        """Test supplied values win over template defaults but not the environment."""
+        mocker.patch.dict(os.environ, {"FROM_ENV": "env"})
+        template = tmp_path / ".env.example"
+        template.write_text("A={{ SECRET | fallback }}\nB={{ FROM_ENV }}")
+
+        result = parse_env_template(template, values={"SECRET": "s3cret", "FROM_ENV": "file"})
+
+        assert result == "A=s3cret\nB=env"
+
     def test_parse_env_template_mixed_placeholders(self, tmp_path, mocker):
         """Test parsing mixed placeholders in one template."""
         mocker.patch("sprout.utils.find_available_port", return_value=8080)
@@ -321,6 +442,60 @@ class TestEnvTemplateParser:
             parse_env_template(template)
 
 
+class TestEnvExampleDiscovery:
+    """Test finding .env.example templates."""
+
+    @pytest.fixture
+    def repo(self, make_repo, monkeypatch):
+        """Repository with two staged templates, as the working directory."""
+        root = make_repo({".env.example": "A=1\n", "backend/.env.example": "B=1\n"}, commit=False)
+        monkeypatch.chdir(root)
+        return root
+
+    def test_discovery_is_cached_until_index_changes(self, repo, git):
+        """Test the template list is reused until a template is added to the index."""
+        from sprout.git import subprocess_count
+        from sprout.utils import get_env_examples
+
+        expected = [repo / ".env.example", repo / "backend" / ".env.example"]
+        assert get_env_examples() == expected
+
+        before = subprocess_count()
+        assert get_env_examples() == expected
+        assert subprocess_count() == before
+
+        (repo / "web").mkdir()
+        (repo / "web" / ".env.example").write_text("C=1\n")
+        git("add", "web", cwd=repo)
+
+        assert get_env_examples() == [*expected, repo / "web" / ".env.example"]
+        assert subprocess_count() == before + 1
+
+    def test_configured_files_skip_discovery(self, repo):
+        """Test [templates] files are used without asking git or writing the list cache."""
+        from sprout.git import subprocess_count
+        from sprout.utils import get_env_examples
+
+        (repo / ".sprout.toml").write_text(
+            '[templates]\nfiles = ["backend/.env.example", "missing/.env.example"]\n'
+        )
+        get_env_examples()  # repository context lookup
+        before = subprocess_count()
+
+        assert get_env_examples() == [repo / "backend" / ".env.example"]
+        assert subprocess_count() == before
+        assert not (repo / ".sprout" / ".templates.json").exists()
+
+    def test_discovery_does_not_create_sprout_dir(self, repo):
+        """Test looking up templates never creates the .sprout directory."""
+        from sprout.utils import get_env_examples
+
+        (repo / ".sprout").rmdir()
+
+        assert len(get_env_examples()) == 2
+        assert not (repo / ".sprout").exists()
+
+
 class TestWorktreeUtils:
     """Test worktree-related utilities."""
 
@@ -367,7 +542,7 @@ class TestCommandRunner:
 class TestIndexedWorktrees:
     """Test indexed worktree functionality."""
 
-    def test_get_indexed_worktrees(self, mocker, tmp_path):
+    def test_get_indexed_worktrees(self, mocker, tmp_path, worktree_list_fallback):
         """Test get_indexed_worktrees returns sorted list."""
         sprout_dir = tmp_path / ".sprout"
         sprout_dir.mkdir()
@@ -410,7 +585,9 @@ branch refs/heads/feature-a
         result = resolve_branch_identifier("feature-branch")
         assert result == "feature-branch"
 
-    def test_resolve_branch_identifier_with_valid_index(self, mocker, tmp_path):
+    def test_resolve_branch_identifier_with_valid_index(
+        self, mocker, tmp_path, worktree_list_fallback
+    ):
         """Test resolve_branch_identifier with valid index."""
         sprout_dir = tmp_path / ".sprout"
         sprout_dir.mkdir()
@@ -433,7 +610,7 @@ branch refs/heads/feature-a
         result = resolve_branch_identifier("1")
         assert result == "feature-a"
 
-    def test_resolve_branch_identifier_with_invalid_index(self, mocker):
+    def test_resolve_branch_identifier_with_invalid_index(self, mocker, worktree_list_fallback):
         """Test resolve_branch_identifier with invalid index."""
         mocker.patch("sprout.utils.is_git_repository", return_value=True)
         mocker.patch("sprout.utils.get_sprout_dir", return_value=Path("/project/.sprout"))
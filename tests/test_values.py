@@ -0,0 +1,129 @@
+"""Tests for template variable value sources."""
+
+import stat
+
+import pytest
+
+from sprout.config import ValueProviderConfig
+from sprout.exceptions import SproutError
+from sprout.values import (
+    AnswersStore,
+    FileValueProvider,
+    build_providers,
+    fetch_values,
+    load_values_file,
+)
+
+
+class CountingProvider:
+    """In-memory provider recording every batch it is asked for."""
+
+    def __init__(self, values):
+        self.values = values
+        self.requests = []
+
+    def fetch(self, names):
+        self.requests.append(list(names))
+        return {name: self.values[name] for name in names if name in self.values}
+
+
+class TestLoadValuesFile:
+    """Test reading values files."""
+
+    def test_dotenv(self, tmp_path):
+        """Test dotenv files with comments, export and quotes."""
+        path = tmp_path / "values.env"
+        path.write_text('# secrets\nexport API_KEY="abc"\nDB_NAME = app\n\nEMPTY=\n')
+
+        assert load_values_file(path) == {"API_KEY": "abc", "DB_NAME": "app", "EMPTY": ""}
+
+    def test_toml(self, tmp_path):
+        """Test TOML scalars are turned into strings."""
+        path = tmp_path / "values.toml"
+        path.write_text('API_KEY = "abc"\nWORKERS = 4\nDEBUG = true\n')
+
+        assert load_values_file(path) == {"API_KEY": "abc", "WORKERS": "4", "DEBUG": "true"}
+
+    def test_json(self, tmp_path):
+        """Test JSON objects are read."""
+        path = tmp_path / "values.json"
+        path.write_text('{"API_KEY": "abc", "RATIO": 0.5}')
+
+        assert load_values_file(path) == {"API_KEY": "abc", "RATIO": "0.5"}
+
+    @pytest.mark.parametrize(
+        ("name", "content", "message"),
+        [
+            ("values.json", "[1, 2]", "table of variables"),
+            ("values.json", '{"A": [1]}', "string, number or boolean"),
+            ("values.toml", "A = ", "Failed to parse"),
+        ],
+    )
+    def test_invalid(self, tmp_path, name, content, message):
+        """Test malformed files raise SproutError."""
+        path = tmp_path / name
+        path.write_text(content)
+
+        with pytest.raises(SproutError, match=message):
+            load_values_file(path)
+
+    def test_missing(self, tmp_path):
+        """Test a missing file raises SproutError."""
+        with pytest.raises(SproutError, match="Failed to read values file"):
+            load_values_file(tmp_path / "values.env")
+
+
+class TestProviders:
+    """Test value providers."""
+
+    def test_file_provider_returns_requested_values(self, tmp_path):
+        """Test the file-backed provider only returns what was asked for."""
+        path = tmp_path / "secrets.env"
+        path.write_text("API_KEY=abc\nOTHER=x\n")
+
+        assert FileValueProvider(path).fetch(["API_KEY", "MISSING"]) == {"API_KEY": "abc"}
+
+    def test_fetch_values_batches_per_provider(self, tmp_path):
+        """Test each provider is asked once, only for values still missing."""
+        first = CountingProvider({"A": "1"})
+        second = CountingProvider({"A": "ignored", "B": "2"})
+        third = CountingProvider({"C": "3"})
+
+        values = fetch_values(["A", "B", "C", "D"], [first, second, third])
+
+        assert values == {"A": "1", "B": "2", "C": "3"}
+        assert first.requests == [["A", "B", "C", "D"]]
+        assert second.requests == [["B", "C", "D"]]
+        assert third.requests == [["C", "D"]]
+
+    def test_build_providers_resolves_relative_paths(self, tmp_path):
+        """Test configured file providers are relative to the repository root."""
+        (tmp_path / "secrets.env").write_text("API_KEY=abc\n")
+
+        (provider,) = build_providers(
+            [ValueProviderConfig(type="file", path="secrets.env")], tmp_path
+        )
+
+        assert provider.fetch(["API_KEY"]) == {"API_KEY": "abc"}
+
+
+class TestAnswersStore:
+    """Test the remembered answers."""
+
+    def test_update_merges_and_restricts_permissions(self, tmp_path):
+        """Test answers accumulate and the file is private to the user."""
+        store = AnswersStore(tmp_path)
+        assert store.load() == {}
+
+        store.update({"A": "1"})
+        store.update({"B": "2"})
+
+        assert store.load() == {"A": "1", "B": "2"}
+        assert stat.S_IMODE(store.path.stat().st_mode) == 0o600
+
+    def test_corrupt_store_is_empty(self, tmp_path):
+        """Test an unreadable store doesn't break create."""
+        store = AnswersStore(tmp_path)
+        store.path.write_text("not json")
+
+        assert store.load() == {}
@@ -0,0 +1,125 @@
+"""Tests for watching template files."""
+
+import sys
+import threading
+import time
+
+import pytest
+
+from sprout.watch import InotifyWatcher, PollingWatcher, Watcher, create_watcher
+
+
+def _write_later(path, content, delay=0.05):
+    """Write a file from another thread after a short delay."""
+    timer = threading.Timer(delay, path.write_text, args=(content,))
+    timer.start()
+    return timer
+
+
+class TestWatcher:
+    """Test the watcher base class."""
+
+    def test_subclasses_must_implement_poll(self, tmp_path):
+        """Test a watcher without poll can't be created."""
+
+        class Incomplete(Watcher):
+            pass
+
+        with pytest.raises(TypeError):
+            Incomplete([tmp_path / ".env.example"])
+
+
+class TestPollingWatcher:
+    """Test the polling fallback."""
+
+    def test_reports_changed_file(self, tmp_path):
+        """Test only the file that changed is reported."""
+        watched = tmp_path / ".env.example"
+        other = tmp_path / "other.env.example"
+        watched.write_text("A=1\n")
+        other.write_text("B=1\n")
+
+        with PollingWatcher([watched, other], interval=0.01) as watcher:
+            assert watcher.poll(0.05) == set()
+            watched.write_text("A=1\nC=2\n")
+            assert watcher.poll(1) == {watched}
+
+    def test_reports_created_and_deleted_files(self, tmp_path):
+        """Test files that appear or disappear count as changed."""
+        created = tmp_path / "new.env.example"
+        deleted = tmp_path / ".env.example"
+        deleted.write_text("A=1\n")
+
+        with PollingWatcher([created, deleted], interval=0.01) as watcher:
+            created.write_text("B=1\n")
+            deleted.unlink()
+            assert watcher.poll(1) == {created, deleted}
+
+    def test_wait_for_changes_debounces(self, tmp_path):
+        """Test changes arriving within the debounce period are reported together."""
+        first = tmp_path / "a.env.example"
+        second = tmp_path / "b.env.example"
+        first.write_text("A=1\n")
+        second.write_text("B=1\n")
+
+        with PollingWatcher([first, second], interval=0.01) as watcher:
+            first.write_text("A=2\n")
+            timer = _write_later(second, "B=22\n")
+            changed = watcher.wait_for_changes(debounce=0.3, timeout=1)
+            timer.join()
+
+        assert changed == {first, second}
+
+    def test_wait_for_changes_times_out(self, tmp_path):
+        """Test an empty set is returned when nothing changes before the timeout."""
+        watched = tmp_path / ".env.example"
+        watched.write_text("A=1\n")
+
+        with PollingWatcher([watched], interval=0.01) as watcher:
+            started = time.monotonic()
+            assert watcher.wait_for_changes(timeout=0.05) == set()
+            assert time.monotonic() - started < 1
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux-only")
+class TestInotifyWatcher:
+    """Test the inotify watcher."""
+
+    def test_reports_only_watched_files(self, tmp_path):
+        """Test changes to other files in a watched directory are ignored."""
+        watched = tmp_path / ".env.example"
+        watched.write_text("A=1\n")
+
+        with InotifyWatcher([watched]) as watcher:
+            (tmp_path / "unrelated.txt").write_text("x")
+            assert watcher.poll(0.05) == set()
+            timer = _write_later(watched, "A=2\n")
+            assert watcher.poll(1) == {watched}
+            timer.join()
+
+    def test_reports_files_replaced_by_rename(self, tmp_path):
+        """Test a template replaced by renaming a temporary file is reported."""
+        watched = tmp_path / ".env.example"
+        watched.write_text("A=1\n")
+
+        with InotifyWatcher([watched]) as watcher:
+            tmp_file = tmp_path / ".env.example.swp"
+            tmp_file.write_text("A=2\n")
+            tmp_file.replace(watched)
+            assert watcher.wait_for_changes(debounce=0.05, timeout=1) == {watched}
+
+    def test_missing_directory_raises(self, tmp_path):
+        """Test watching a file in a missing directory raises OSError."""
+        with pytest.raises(OSError):
+            InotifyWatcher([tmp_path / "missing" / ".env.example"])
+
+
+def test_create_watcher_falls_back_to_polling(tmp_path, monkeypatch):
+    """Test a watcher is created even when inotify can't be used."""
+    monkeypatch.setattr("sprout.watch.InotifyWatcher", _raise_oserror)
+    watcher = create_watcher([tmp_path / ".env.example"])
+    assert watcher.mechanism == "polling"
+
+
+def _raise_oserror(paths):
+    raise OSError("inotify is not available")